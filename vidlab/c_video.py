@@ -3,10 +3,12 @@ import os
 from PySide6.QtCore import QObject, QTimer, Signal, QUrl
 from PySide6.QtGui import QDesktopServices, Qt
 
+from .m_analysis_sched import AnalysisScheduler
+from .m_live_infer import LiveResultHub
 from .m_project import VideoProjectModel
 from .m_project_ext import VideoProjectExtModel
 from .m_video import VideoModel
-from .m_video_export import VideoExport
+from .m_video_export import VideoMultiExport
 
 class VideoController(QObject):
     video_loaded = Signal()  # Сигнал без параметров, так как View сама возьмет данные из модели
@@ -29,6 +31,9 @@ class VideoController(QObject):
         self._is_playing = False
         self.cropped_mode = False
 
+        # Фоновый инференс предпросмотра закончил кадр — перерисовать паузу
+        LiveResultHub.get_instance().result_ready.connect(self._on_live_result)
+
     @property
     def is_playing(self):
         return self._is_playing
@@ -72,12 +77,15 @@ class VideoController(QObject):
         else:
             if self.model.cap:
                 self._is_playing = True
+                # На время воспроизведения фоновый анализ уступает CPU
+                AnalysisScheduler.get_instance().set_playback_active(True)
                 self.timer.start(int(1000 / self.model.fps))
                 self.playing_changed.emit(True)
 
     def stop(self):
         self._is_playing = False
         self.timer.stop()
+        AnalysisScheduler.get_instance().set_playback_active(False)
         self.playing_changed.emit(False)
 
     def start_track_focused(self):
@@ -120,9 +128,11 @@ class VideoController(QObject):
                     self.detection_failed.emit()
                     print("Tracking lost")
 
-            if f.enabled and f.is_active_at(frame_idx):
-                f.set_current_frame(frame_idx)  # УВЕДОМЛЯЕМ ФИЛЬТР О КАДРЕ
-                processed = f.process(processed, frame_idx)
+            if f.enabled:
+                # УВЕДОМЛЯЕМ ФИЛЬТР О КАДРЕ: один снимок параметров на кадр
+                f.take_snapshot(frame_idx)
+                if f.is_active_at(frame_idx):
+                    processed = f.process(processed, frame_idx)
         return processed
 
     def _process_and_out_frame(self,frame):
@@ -145,6 +155,16 @@ class VideoController(QObject):
         if frame is not None:
             self._process_and_out_frame(frame)
 
+    def _on_live_result(self):
+        # При воспроизведении результат подхватит следующий кадр
+        if not self._is_playing:
+            self.refresh_current_frame()
+
+    def _set_exporting(self, exporting):
+        """На экспорте фильтры считают каждый кадр синхронно, без фонового предпросмотра"""
+        for f in self.project.filters:
+            f.is_exporting = exporting
+
 
     def seek(self, position):
         self.stop() # Останавливаем при перемотке
@@ -158,6 +178,9 @@ class VideoController(QObject):
         if frame is not None:
             self._process_and_out_frame(frame)
 
+        # Фильтры, видимые в новой позиции, поднимаются в очереди анализа
+        AnalysisScheduler.get_instance().update_priorities(self.model.get_current_index())
+
     def draw_filters_overlay(self, painter, viewport_rect):
         # Ищем фильтр, который сейчас выбран (в фокусе)
         for f in self.project.filters:
@@ -265,6 +288,21 @@ class VideoController(QObject):
     def get_out_index(self):
         return self.project.get_out_frame(self.model.get_max_index())
 
+    def get_filter_analysis_range(self, filter_obj):
+        """
+        Диапазон анализа по умолчанию: пересечение In/Out проекта
+        с окном действия фильтра (act_out не включается).
+        """
+        start, end = self.get_in_index(), self.get_out_index()
+
+        act_in = filter_obj.get_param("act_in", -1)
+        act_out = filter_obj.get_param("act_out", -1)
+        if act_in >= 0:
+            start = max(start, act_in)
+            end = min(end, act_out - 1)
+
+        return [start, end]
+
 
     def to_in_point(self):
         self.seek(self.get_in_index())
@@ -369,12 +407,23 @@ class VideoController(QObject):
     def export_video(self, output_path, progress_callback=None):
         """
         Метод экспорта видео в диапазоне In/Out.
+        output_path: путь к файлу или список описаний выходов
+            [{"path": ..., "size": (w, h) | высота | None, "codec": 'mp4v'}, ...].
+            Кадр декодируется и проходит фильтры один раз, затем раздается всем выходам.
         progress_callback: функция, принимающая (int) процента,
         возвращающая True для продолжения и False для отмены.
         """
         if not self.model.cap:
             return False
 
+        if isinstance(output_path, str):
+            specs = [{"path": output_path}]
+        else:
+            specs = list(output_path)
+
+        if not specs:
+            return False
+
         # 1. Определяем диапазон и параметры
         start_frame = self.get_in_index()
         end_frame = self.get_out_index()
@@ -393,21 +442,23 @@ class VideoController(QObject):
         processed_sample = self.get_processed_frame(raw_sample, start_frame)
         h, w = processed_sample.shape[:2]
 
-        # 3. Инициализируем экспортер
-        exporter = VideoExport(
-            output_path=output_path,
+        # 3. Инициализируем экспортеры (по одному на каждый выход)
+        exporter = VideoMultiExport(
+            specs,
             fps=self.model.fps,
-            size=(w, h)
+            src_size=(w, h)
         )
 
         self.stop()  # Останавливаем предпросмотр на время экспорта
+        self._set_exporting(True)
 
         try:
             for i in range(total_to_export):
                 curr_idx = start_frame + i
 
-                # Читаем кадр напрямую из модели
-                frame = self.model.get_frame(curr_idx)
+                # Читаем кадр напрямую из модели: позиционируемся один раз,
+                # дальше читаем последовательно без лишних seek
+                frame = self.model.get_frame(curr_idx if i == 0 else None)
                 if frame is None:
                     break
 
@@ -433,6 +484,7 @@ class VideoController(QObject):
             exporter.cancel()
             return False
         finally:
+            self._set_exporting(False)
             # Возвращаем плеер на место In-point после завершения
             self.seek(curr_idx)
 
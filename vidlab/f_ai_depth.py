@@ -4,11 +4,30 @@ import cv2
 import os
 import numpy as np
 import torch
-from ultralytics import YOLO
 from .f_asinc_base import FilterAsyncBase
+from .m_analysis_stats import AnalysisStats
+from .m_depth_storage import DepthStorage
+from .m_guided_filter import guided_upsample
+from .m_infer_backend import load_depth, infer_device, OnnxDepthModel
+from .m_model_pool import ModelPool
 
 
 class FilterAiDepth(FilterAsyncBase):
+    """
+    Карта глубины Depth Anything поверх кадра. Анализ сохраняет карты в кеш
+    (float16, ширина STORE_WIDTH); для посчитанных кадров process() только
+    растягивает, раскрашивает и смешивает — параметры отрисовки нейросеть не трогают.
+    """
+    CACHE_EXT = "depth"  # Папка DepthStorage
+    ANALYSIS_PARAMS = ("model", "backend")
+    STORE_WIDTH = 518  # Ширина карты в кеше (вход модели)
+    EMIT_EVERY = 10  # Карт в одном сообщении воркера
+
+    # Быстрый предпросмотр (fast): малый вход без PIL, повтор карты на похожих кадрах
+    FAST_WIDTH = 364  # Ширина входа модели (кратна патчу ViT 14)
+    REUSE_DIFF = 3.0  # Средняя разница миниатюр, ниже которой карта берется от прошлого кадра
+    REUSE_MAX = 8  # Не дальше этого числа кадров от кадра, где карта посчитана
+
     def __init__(self, num, cache_dir, params=None):
         if not params:
             params = {
@@ -20,73 +39,248 @@ class FilterAiDepth(FilterAsyncBase):
             }
         super().__init__(num, cache_dir, params)
         self.name = "AI Depth Visualizer"
-        self._model = None
-        self._pipe = None
+        # Модель общая для всех экземпляров (ModelPool)
+        self._model_key = (os.path.join(os.getcwd(), 'models', 'depth_v2_local'), infer_device())
+        self._model_lock = ModelPool.get_instance().acquire(self._model_key, self._load_model)
+        self.set_model_params(self._model_key)
+        self._released = False
 
         self.color_maps = {
             "MAGMA" : cv2.COLORMAP_MAGMA
         }
 
+        self._store = None  # DepthStorage текущего кеша
+        self._pending = []  # Карты из воркера, еще не записанные в хранилище
+        self._fast_prev = None  # (кадр, серая миниатюра, карта) последнего быстрого инференса
+
+        # обязательно, в базовом классе не вызывается
+        self.load_data()
+
     def get_params_metadata(self):
         return {
             "pos_x": {"type": "float", "min": -1, "max": 1, "default": 0},
             "pos_y": {"type": "float", "min": -1, "max": 1, "default": 0},
             "alpha": {"type": "float", "min": 0, "max": 1, "default": 0.5},
             "scale": {"type": "float", "min": 1.0, "max": 50.0, "default": 10.0},
-            "colormap": {"type": "list", "values": ["MAGMA"], "default": "MAGMA"}
+            "colormap": {"type": "list", "values": ["MAGMA"], "default": "MAGMA"},
+            # Предпросмотр: уменьшенный вход, повтор карты, края по кадру (guided filter)
+            "fast": {"type": "bool", "default": False}
         }
 
-    def _get_model(self):
-        if self._pipe is None:
-            # Выбираем девайс (0 для CUDA)
-            device = 0 if torch.cuda.is_available() else -1
-
-            local_model_path = os.path.join(os.getcwd(), 'models', 'depth_v2_local')
-
-            print(f"Loading Depth Model from: {local_model_path}")
-
+    def _get_model(self, wait=True):
+        return ModelPool.get_instance().get(self._model_key, wait)
+
+    def _load_model(self):
+        # Выбираем девайс (0 для CUDA)
+        device = 0 if torch.cuda.is_available() else -1
+
+        local_model_path = self._model_key[0]
+
+        print(f"Loading Depth Model from: {local_model_path}")
+
+        # На CPU с включенным ONNX бэкендом пайплайн transformers не нужен
+        pipe = load_depth(local_model_path, self._model_key[1], self.video_path)
+        if pipe is not None:
+            return pipe
+
+        pipe = pipeline(
+            task="depth-estimation",
+            model=local_model_path,  # Теперь здесь ПУТЬ, а не ID
+            device=device,
+            # Половинная точность — только на видеокарте; на CPU многие операции fp16 медленные или не поддержаны
+            model_kwargs={"torch_dtype": torch.float16 if torch.cuda.is_available() else torch.float32}
+        )
+
+        # pipe = pipeline(
+        #     task="depth-estimation",
+        #     model="depth-anything/Depth-Anything-V2-Small-hf",
+        #     device=device
+        # )
+        print("Depth Anything V2 loaded successfully via Transformers")
+        return pipe
+
+    def warm_up(self):
+        ModelPool.get_instance().warm_up(self._model_key)
+
+    def release(self):
+        super().release()
+        if not self._released:
+            self._released = True
+            ModelPool.get_instance().release(self._model_key)
+
+    # --- КЕШ КАРТ ГЛУБИНЫ ---
+
+    def reset_data(self):
+        super().reset_data()
+        self._store = None
+        self._pending = []
+
+    def load_data(self):
+        self._store = DepthStorage(self.get_data_filepath())
+        self._analyzed_ranges = self._store.analyzed_ranges()
+
+    def get_save_payload(self):
+        if not self._pending:
+            return None
+        payload, self._pending = self._pending, []
+        return payload
+
+    def write_payload(self, payload, path):
+        store = self._store if self._store is not None and self._store.path == path else DepthStorage(path)
+        for start, maps in payload:
+            store.write_range(start, maps)
+
+    def _on_worker_progress(self, data):
+        super()._on_worker_progress(data)
+
+        if "depth" in data:
+            # Карты куска: в хранилище уходят фоновой записью
+            self._pending.append(data["depth"])
+            self.request_save()
+
+    def _infer_depth(self, pipe, frame):
+        """Карта глубины кадра нейросетью (float32, 2D)"""
+        # Превращаем OpenCV (BGR) в PIL Image (RGB)
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        if isinstance(pipe, OnnxDepthModel):
+            with self._model_lock:
+                depth_map = pipe(rgb_frame)
+        else:
+            pil_img = Image.fromarray(rgb_frame)
+            with self._model_lock, torch.inference_mode():
+                result = pipe(pil_img)
 
-            try:
-                self._pipe = pipeline(
-                    task="depth-estimation",
-                    model=local_model_path,  # Теперь здесь ПУТЬ, а не ID
-                    device=device,
-                    model_kwargs={"torch_dtype": torch.float16}  # Использовать половинную точность
-                )
+            # 'depth' возвращает PIL изображение с картой глубин
+            depth_map = np.array(result['predicted_depth']).astype(np.float32)
 
-                # self._pipe = pipeline(
-                #     task="depth-estimation",
-                #     model="depth-anything/Depth-Anything-V2-Small-hf",
-                #     device=device
-                # )
-                print("Depth Anything V2 loaded successfully via Transformers")
-            except Exception as e:
-                print(f"Failed to load depth model: {e}")
-        return self._pipe
+        # --- ЗАЩИТА ---
+        # Убираем лишние размерности (превращаем (1, H, W) в (H, W))
+        if len(depth_map.shape) > 2:
+            depth_map = np.squeeze(depth_map)
+        return depth_map
 
-    def process(self, frame, idx):
-        pipe = self._get_model()
-        if pipe is None: return frame
+    def _store_size(self, frame):
+        """(ширина, высота) карты в кеше: STORE_WIDTH с пропорциями кадра"""
+        h, w = frame.shape[:2]
+        if w <= self.STORE_WIDTH:
+            return w, h
+        return self.STORE_WIDTH, max(1, round(h * self.STORE_WIDTH / w))
+
+    def _fast_depth(self, pipe, frame, idx):
+        """
+        Карта глубины низкого разрешения для предпросмотра: кадр уменьшается до FAST_WIDTH
+        и подается в модель тензором без PIL; если кадр почти не изменился — повтор прошлой карты.
+        На ONNX уменьшенный вход работает только с экспортом переменного размера (OnnxDepthModel.dynamic).
+        """
+        h, w = frame.shape[:2]
+        fw = max(14, min(w, self.FAST_WIDTH) // 14 * 14)
+        fh = max(14, round(h * fw / w / 14) * 14)
+        small = cv2.resize(frame, (fw, fh), interpolation=cv2.INTER_AREA)
+        thumb = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+        prev = self._fast_prev
+        if (prev is not None and prev[1].shape == thumb.shape and abs(idx - prev[0]) <= self.REUSE_MAX
+                and cv2.mean(cv2.absdiff(thumb, prev[1]))[0] < self.REUSE_DIFF):
+            return prev[2]
+
+        rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        if isinstance(pipe, OnnxDepthModel):
+            with self._model_lock:
+                depth_map = pipe(rgb, (fw, fh))
+        else:
+            processor = pipe.image_processor
+            mean = np.asarray(getattr(processor, "image_mean", [0.485, 0.456, 0.406]), dtype=np.float32)
+            std = np.asarray(getattr(processor, "image_std", [0.229, 0.224, 0.225]), dtype=np.float32)
+            pixel_values = ((rgb.astype(np.float32) * (1.0 / 255) - mean) / std).transpose(2, 0, 1)[None]
+
+            model = pipe.model
+            tensor = torch.from_numpy(np.ascontiguousarray(pixel_values)).to(model.device, dtype=model.dtype)
+            with self._model_lock, torch.inference_mode():
+                depth_map = model(pixel_values=tensor).predicted_depth
+            depth_map = depth_map.squeeze().float().cpu().numpy()
+
+        self._fast_prev = (idx, thumb, depth_map)
+        return depth_map
+
+    def run_internal_logic(self, worker):
+        """Карты глубины для непосчитанных кадров диапазона"""
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            raise Exception("Could not open video file")
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        missing = self.get_missing_ranges(*self.get_analysis_range(total_frames))
+        todo = max(1, sum(e - s + 1 for s, e in missing))
+        covered = list(self._analyzed_ranges)
 
-        # Превращаем OpenCV (BGR) в PIL Image (RGB)
         pipe = self._get_model()
-        if pipe is None: return frame
+        if pipe is None:
+            cap.release()
+            raise Exception("Depth model is not available")
+
+        done = 0
+        stats = AnalysisStats(todo)
+
+        def emit(start, maps):
+            nonlocal covered
+            stats.mark()
+            covered = self.merge_ranges(covered + [[start, start + len(maps) - 1]])
+            worker.progress.emit({
+                "progress": int(done / todo * 100),
+                "ranges": covered,
+                "depth": (start, np.stack(maps)),
+                "timing": stats.as_dict()
+            })
+            stats.lap("emit")
+
+        try:
+            for seg_start, seg_end in missing:
+                maps, map_start = [], seg_start
+                for f_idx, frame in self.read_frames(worker, cap, seg_start, seg_end, stats):
+                    depth_map = self._infer_depth(pipe, frame)
+                    maps.append(cv2.resize(depth_map, self._store_size(frame),
+                                           interpolation=cv2.INTER_AREA).astype(np.float16))
+                    stats.lap("core")
+                    stats.frame_done()
+                    done += 1
+
+                    if len(maps) >= self.EMIT_EVERY:
+                        emit(map_start, maps)
+                        maps, map_start = [], f_idx + 1
+                if maps:
+                    emit(map_start, maps)
+                if not worker.is_running:
+                    break
+        finally:
+            cap.release()
+
+        worker.progress.emit({
+            "progress": 100 if done >= todo else int(done / todo * 100),
+            "ranges": covered,
+            "timing": stats.as_dict()
+        })
 
+    def process(self, frame, idx):
         h, w = frame.shape[:2]
 
-        # 1. Получаем карту глубины
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        pil_img = Image.fromarray(rgb_frame)
-        with torch.inference_mode():
-            result = pipe(pil_img)
-
-        # 'depth' возвращает PIL изображение с картой глубин
-        depth_map = np.array(result['predicted_depth']).astype(np.float32)
-
-        # --- ЗАЩИТА ---
-        # 1. Убираем лишние размерности (превращаем (1, H, W) в (H, W))
-        if len(depth_map.shape) > 2:
-            depth_map = np.squeeze(depth_map)
+        fast = self.get_param("fast") and not self.is_exporting
+
+        # 1. Получаем карту глубины: из кеша или нейросетью
+        stored = self._store.get(idx) if self._store is not None else None
+        if stored is not None:
+            depth_map = stored.astype(np.float32)
+        else:
+            # Предпросмотр не ждет загрузку модели: кадр перерисуется, когда она будет готова
+            pipe = self._get_model(wait=self.is_exporting)
+            if pipe is None: return frame
+            depth_map = self._fast_depth(pipe, frame, idx) if fast else self._infer_depth(pipe, frame)
+
+        if depth_map.shape != (h, w):
+            if fast:
+                # Края карты — по краям текущего кадра
+                depth_map = guided_upsample(depth_map, frame)
+            else:
+                depth_map = cv2.resize(depth_map, (w, h), interpolation=cv2.INTER_LINEAR)
 
         # 2. Подготовка цветной карты глубины
 
@@ -110,18 +304,16 @@ class FilterAiDepth(FilterAsyncBase):
         pixel_y = np.clip(pixel_y, 0, h - 1)
 
         # Берем значение глубины в этой точке
-        raw_val = depth_map[pixel_y, pixel_x]
+        raw_val = float(depth_map[pixel_y, pixel_x])
 
         # 1. Параметры для калибровки (можно вынести в ползунки)
         # scale_factor подберем экспериментально (начни с 10.0)
         scale_factor = self.get_param("scale")
         shift = 0.01  # Защита от деления на 0
 
-        # 2. Превращаем инвертированную глубину в линейную
+        # 2. Превращаем инвертированную глубину в линейную — только в точке замера
         # Чем выше RawValue, тем меньше будет результат в "метрах"
-        metric_depth = scale_factor / (depth_map + shift)
-
-        dist_meters = metric_depth[pixel_y, pixel_x]
+        dist_meters = scale_factor / (raw_val + shift)
 
         # 5. Отрисовка прицела
         color = (0, 255, 0)  # Зеленый
@@ -1,7 +1,25 @@
 from PySide6.QtCore import QObject, Signal, QThread
 from .f_base import FilterBase
+from .m_analysis_sched import AnalysisScheduler, STATE_IDLE, STATE_RUNNING, STATE_PAUSED
+from .m_analysis_cache import video_fingerprint, make_cache_key, register_entry
+from .m_analysis_stats import format_stats
+from .m_infer_backend import pin_device
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+import importlib
+import multiprocessing
+import queue
+import threading
 import traceback
+import time
 import os
+import cv2
+import numpy as np
+
+# Один фоновый поток на все фильтры: запись кешей идет по очереди и не держит UI
+_save_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-save")
+
+_PREFETCH_END = object()  # Конец кадров в очереди prefetch_frames
+
 
 class FilterAsincWorker(QObject):
     # Передаем словарь с данными (марки, области и т.д.)
@@ -12,8 +30,35 @@ class FilterAsincWorker(QObject):
     def __init__(self, filter_obj):
         super().__init__()
         self.filter_obj = filter_obj
-        self.is_running = True # Тот самый флаг-прерыватель
+        self._running = True
+        self._resume = threading.Event()  # Сброшен — воркер на паузе
+        self._resume.set()
+
+    @property
+    def is_running(self):
+        """
+        Тот самый флаг-прерыватель. Анализаторы опрашивают его на каждом кадре,
+        поэтому на паузе поток ждет прямо здесь, не занимая CPU.
+        """
+        while self._running and not self._resume.wait(0.2):
+            pass
+        return self._running
+
+    @is_running.setter
+    def is_running(self, value):
+        self._running = value
+        if not value:
+            self._resume.set()  # Будим, чтобы цикл увидел остановку
 
+    def set_paused(self, paused):
+        if paused:
+            self._resume.clear()
+        else:
+            self._resume.set()
+
+    @property
+    def is_paused(self):
+        return not self._resume.is_set()
 
     def run(self):
         try:
@@ -26,36 +71,657 @@ class FilterAsincWorker(QObject):
             self.finished.emit()
 
 
+class _ProcessWorkerProxy:
+    """
+    Заменитель воркера внутри дочернего процесса.
+    Дает run_internal_logic тот же интерфейс: is_running и progress.emit().
+    """
+
+    class _Progress:
+        def __init__(self, conn):
+            self._conn = conn
+
+        def emit(self, data):
+            if self._conn is not None:
+                self._conn.send(("progress", data))
+
+    def __init__(self, conn, stop_event, resume_event):
+        self.progress = self._Progress(conn)
+        self._stop = stop_event
+        self._resume = resume_event
+
+    @property
+    def is_running(self):
+        while not self._stop.is_set() and not self._resume.wait(0.2):
+            pass
+        return not self._stop.is_set()
+
+    @is_running.setter
+    def is_running(self, value):
+        if not value:
+            self._stop.set()
+
+    @property
+    def is_paused(self):
+        return not self._resume.is_set()
+
+
+def _process_worker_main(module_name, class_name, num, cache_dir, params, video_path,
+                         analysis_range, worker_state, conn, stop_event, resume_event):
+    """Точка входа дочернего процесса: восстанавливаем фильтр из простых данных и считаем"""
+    try:
+        pin_device(params.get("backend"))
+        f_class = getattr(importlib.import_module(module_name), class_name)
+        filter_obj = f_class(num, cache_dir, params)
+        filter_obj.attach_video(video_path)
+        filter_obj.analysis_range = analysis_range
+        filter_obj.set_worker_state(worker_state)
+
+        filter_obj.run_internal_logic(_ProcessWorkerProxy(conn, stop_event, resume_event))
+        conn.send(("done", None))
+    except Exception as e:
+        conn.send(("error", f"{str(e)}\n{traceback.format_exc()}"))
+    finally:
+        conn.close()
+
+
+# Состояние процесса пула для параллельного скана кусками
+_chunk_events = None  # (stop_event, resume_event)
+_chunk_filter = None  # Фильтр создается один раз на процесс (модель грузится однажды)
+
+
+def _chunk_worker_init(stop_event, resume_event):
+    global _chunk_events
+    _chunk_events = (stop_event, resume_event)
+    # Параллелим процессами, внутри каждого — один поток, иначе ядра делятся по кругу
+    os.environ["OMP_NUM_THREADS"] = "1"
+    cv2.setNumThreads(1)
+
+
+def _chunk_worker_main(filter_args, start, end):
+    """Задача пула: scan_chunk фильтра на кадрах [start, end]"""
+    global _chunk_filter
+    if _chunk_filter is None:
+        module_name, class_name, num, cache_dir, params, video_path, worker_state = filter_args
+        pin_device(params.get("backend"))
+        f_class = getattr(importlib.import_module(module_name), class_name)
+        _chunk_filter = f_class(num, cache_dir, params)
+        # Только путь к видео: кеш пишет и переносит родитель, scan_chunk его не читает
+        _chunk_filter.video_path = video_path
+        _chunk_filter.set_worker_state(worker_state)
+
+    cap = cv2.VideoCapture(_chunk_filter.video_path)
+    try:
+        return _chunk_filter.scan_chunk(_ProcessWorkerProxy(None, *_chunk_events), cap, start, end)
+    finally:
+        cap.release()
+
+
+class FilterProcessWorker(QObject):
+    """
+    Воркер, который запускает run_internal_logic в отдельном процессе (без GIL).
+    Сам живет в QThread и пересылает сообщения из канала в те же сигналы,
+    поэтому _on_worker_progress фильтра применяет результаты как обычно.
+    """
+    progress = Signal(dict)
+    finished = Signal()
+    error = Signal(str)
+
+    def __init__(self, filter_obj):
+        super().__init__()
+        self._ctx = multiprocessing.get_context("spawn")
+        self._stop = self._ctx.Event()
+        self._resume = self._ctx.Event()
+        self._resume.set()
+
+        # Фильтр передаем не объектом, а простыми данными
+        self._args = (
+            type(filter_obj).__module__,
+            type(filter_obj).__name__,
+            filter_obj.num,
+            filter_obj.cache_dir,
+            filter_obj.get_params(),
+            filter_obj.video_path,
+            filter_obj.analysis_range,
+            filter_obj.get_worker_state()
+        )
+
+    @property
+    def is_running(self):
+        return not self._stop.is_set()
+
+    @is_running.setter
+    def is_running(self, value):
+        if not value:
+            self._stop.set()
+
+    def set_paused(self, paused):
+        if paused:
+            self._resume.clear()
+        else:
+            self._resume.set()
+
+    @property
+    def is_paused(self):
+        return not self._resume.is_set()
+
+    def run(self):
+        recv_conn, send_conn = self._ctx.Pipe(duplex=False)
+        proc = self._ctx.Process(
+            target=_process_worker_main,
+            args=self._args + (send_conn, self._stop, self._resume),
+            daemon=True
+        )
+
+        try:
+            proc.start()
+            send_conn.close()  # В родителе нужен только конец для чтения
+
+            while True:
+                if recv_conn.poll(0.1):
+                    try:
+                        kind, data = recv_conn.recv()
+                    except EOFError:
+                        break
+
+                    if kind == "progress":
+                        self.progress.emit(data)
+                    elif kind == "error":
+                        self.error.emit(data)
+                    elif kind == "done":
+                        break
+                elif not proc.is_alive():
+                    break
+
+            proc.join(timeout=5)
+            if proc.is_alive():
+                proc.terminate()
+        except Exception as e:
+            self.error.emit(f"{str(e)}\n{traceback.format_exc()}")
+        finally:
+            recv_conn.close()
+            self.finished.emit()
+
+
 class FilterAsyncBase(FilterBase):
+    # Запускать ли run_internal_logic в отдельном процессе.
+    # Включают анализаторы с тяжелыми циклами на чистом Python, которые иначе
+    # упираются в GIL и тормозят UI. Фильтр должен восстанавливаться по (num, cache_dir, params).
+    USE_PROCESS = False
+
+    # Чекпоинты состояния, от которых анализ продолжается после остановки
+    CHECKPOINT_STEP = 250  # Кадров между чекпоинтами
+    MAX_CHECKPOINTS = 32  # Лишние (самые ранние) выбрасываются
+
+    SAVE_INTERVAL = 3.0  # Секунд между сохранениями кеша во время анализа
+
+    # Кеш результатов адресуется отпечатком видео и параметрами анализа
+    CACHE_EXT = "json"
+    ANALYSIS_PARAMS = ()  # Параметры, влияющие на результат (остальные — только отрисовка)
+
+    # Параллельный скан кусками в пуле процессов (см. run_chunks)
+    CHUNK_MIN_LEN = 300  # Короче — не окупается запуск процесса
+    CHUNK_MAX_WORKERS = None  # None — по числу ядер; у фильтров с нейросетью — меньше (модель в каждом процессе)
+
+    PREFETCH_DEPTH = 8  # Сколько декодированных кадров держит prefetch_frames
+
     def __init__(self, num, cache_dir, params=None):
         super().__init__(num, cache_dir, params)
         self.video_path = None
-        self.is_analyzing = False
+        self.is_analyzing = False  # В очереди, работает или на паузе
+        self.analysis_state = STATE_IDLE
         self.progress = 0
 
         self._thread = None
         self._worker = None
+        self._checkpoints = {}  # {frame_idx: состояние модели после этого кадра}
+        self.analysis_range = None  # [start, end] текущего запуска, None — весь файл
+
+        self._last_save_time = 0.0
+        self._save_pending = False  # Есть несохраненные изменения
+        self._save_future = None
+        self._discard_progress = False  # Сообщения остановленного запуска больше не нужны
+        self.analysis_stats = None  # Последние счетчики скорости из воркера (AnalysisStats.as_dict)
+
+    # --- АДРЕСАЦИЯ КЕША ---
+
+    def get_analysis_params(self):
+        """Имена параметров, от которых зависит результат анализа"""
+        return self.ANALYSIS_PARAMS
+
+    def get_cache_key(self):
+        """Ключ кеша: отпечаток видео + хеш параметров анализа. None — видео неизвестно"""
+        if not self.video_path:
+            return None
+        fp = video_fingerprint(self.video_path)
+        if fp is None:
+            return None
+        return make_cache_key(fp, self._get_analysis_values())
+
+    def _get_analysis_values(self):
+        return {name: self.get_param(name) for name in self.get_analysis_params()}
+
+    def set_model_params(self, model_key):
+        """
+        Модель и бэкенд нейросети — скрытые параметры анализа (ANALYSIS_PARAMS "model", "backend"):
+        результаты другой модели или бэкенда в этот кеш не попадают
+        """
+        self.set_param("model", os.path.basename(model_key[0]))
+        self.set_param("backend", model_key[1])
+
+    def get_worker_state(self):
+        """
+        Простые данные для копии фильтра в процессе анализа сверх (num, cache_dir, params) —
+        то, что родитель знает из проекта (например, кеш другого фильтра)
+        """
+        return None
+
+    def set_worker_state(self, state):
+        pass
+
+    def get_legacy_filepath(self):
+        """Старое имя кеша — по ID фильтра"""
+        return os.path.join(self.cache_dir, f"{self.get_id()}.{self.CACHE_EXT}")
 
     def get_data_filepath(self):
-        """Формирует путь к файлу кеша на основе ID фильтра"""
-        return os.path.join(self.cache_dir, f"{self.get_id()}.json")
+        """Путь к файлу кеша; пока видео не привязано — по ID фильтра"""
+        path = self.find_data_filepath(self.cache_dir, self.video_path, self._get_analysis_values())
+        if path is None:
+            return self.get_legacy_filepath()
+        return path
+
+    @classmethod
+    def find_data_filepath(cls, cache_dir, video_path, analysis_values=None):
+        """Путь к кешу фильтра этого класса для видео без экземпляра (для других фильтров)"""
+        fp = video_fingerprint(video_path) if video_path else None
+        if fp is None:
+            return None
+        key = make_cache_key(fp, analysis_values or {})
+        return os.path.join(cache_dir, f"{cls.__name__}_{key}.{cls.CACHE_EXT}")
+
+    def attach_video(self, video_path):
+        """Привязка к видео: результаты ищутся по отпечатку файла и параметрам"""
+        self.video_path = video_path
+        if not self.cache_dir:
+            return
+
+        # Однократный перенос кеша, сохраненного под старым именем
+        legacy_path = self.get_legacy_filepath()
+        data_path = self.get_data_filepath()
+        if data_path != legacy_path and os.path.exists(legacy_path) and not os.path.exists(data_path):
+            try:
+                os.replace(legacy_path, data_path)
+            except OSError as e:
+                print(f"Error migrating cache {legacy_path}: {e}")
+
+        self.reload_data()
+
+    def reset_data(self):
+        """Сброс результатов в памяти (потомки чистят свои массивы)"""
+        self._analyzed_ranges = []
+        self._detected_scenes = []
+        self._checkpoints = {}
+
+    def load_data(self):
+        pass
 
-    def start_analysis(self):
-        """Запуск фонового процесса"""
+    def reload_data(self):
+        self.reset_data()
+        self.load_data()
+
+    def set_param(self, key, value):
+        if key not in self.get_analysis_params() or not self.video_path:
+            super().set_param(key, value)
+            return
+
+        old_key = self.get_cache_key()
+        values = self._get_analysis_values()
+        values[key] = value
+        fp = video_fingerprint(self.video_path)
+        if self.get_param(key) == value or (fp is not None and make_cache_key(fp, values) == old_key):
+            # Ключ кеша не меняется (то же значение) — анализ продолжается
+            super().set_param(key, value)
+            return
+
+        if self.is_analyzing:
+            # Анализ шел для старых параметров — его результаты больше не относятся к кешу
+            self.stop_analysis()
+            self._discard_progress = True
+        self.flush_save()
+
+        super().set_param(key, value)
+
+        if self.get_cache_key() != old_key:
+            # Другие параметры — другие результаты (или пусто, если еще не считали)
+            self.reload_data()
+
+    # --- СОХРАНЕНИЕ КЕША ---
+
+    def get_save_payload(self):
+        """Снимок данных для записи (в UI-потоке, данные копируются). None — сохранять нечего"""
+        return None
+
+    def write_payload(self, payload, path):
+        """Запись снимка на диск (выполняется в фоновом потоке)"""
+        pass
+
+    def save_data(self):
+        """Синхронное сохранение"""
+        payload = self.get_save_payload()
+        if payload is not None:
+            self._write_payload_safe(payload, self.get_data_filepath(), self._get_index_info())
+
+    def request_save(self, force=False):
+        """
+        Сохранение из _on_worker_progress: не чаще SAVE_INTERVAL, запись в фоне.
+        force=True — сохранить сейчас (конец анализа).
+        """
+        self._save_pending = True
+        if not force and time.monotonic() - self._last_save_time < self.SAVE_INTERVAL:
+            return
+
+        payload = self.get_save_payload()
+        self._last_save_time = time.monotonic()
+        self._save_pending = False
+        if payload is not None:
+            # Путь фиксируем сейчас: параметры могут смениться до записи
+            self._save_future = _save_executor.submit(
+                self._write_payload_safe, payload, self.get_data_filepath(), self._get_index_info())
+
+    def flush_save(self):
+        """Дописать отложенное и дождаться записи (перед чтением кеша другим процессом)"""
+        if self._save_pending:
+            self.request_save(force=True)
+        if self._save_future is not None:
+            self._save_future.result()
+            self._save_future = None
+
+    def _get_index_info(self):
+        if not self.video_path:
+            return None
+        return {
+            "filter": type(self).__name__,
+            "video": os.path.basename(self.video_path),
+            "params": self._get_analysis_values()
+        }
+
+    def _write_payload_safe(self, payload, path, index_info):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.write_payload(payload, path)
+            if index_info is not None:
+                register_entry(os.path.dirname(path), os.path.basename(path), index_info)
+        except Exception as e:
+            print(f"Error saving cache for {self.name}: {e}")
+
+    @staticmethod
+    def write_npy_atomic(path, payload):
+        """np.save через временный файл: читатель не увидит недописанный кеш"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, payload)
+        os.replace(tmp_path, path)
+
+    # --- ПРОДОЛЖЕНИЕ АНАЛИЗА ---
+
+    @staticmethod
+    def merge_ranges(ranges):
+        """Склеивает пересекающиеся и соседние диапазоны [start, end]"""
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def get_analysis_range(self, total_frames):
+        """Границы текущего запуска, обрезанные по длине видео"""
+        start, end = 0, total_frames - 1
+        if self.analysis_range is not None:
+            start = max(start, self.analysis_range[0])
+            end = min(end, self.analysis_range[1])
+        return start, end
+
+    def get_missing_ranges(self, start, end, ranges=None):
+        """Участки [start, end], которые еще не проанализированы"""
+        if ranges is None:
+            ranges = self._analyzed_ranges
+
+        missing = []
+        pos = start
+        for r_start, r_end in self.merge_ranges(ranges):
+            if r_end < pos:
+                continue
+            if r_start > end:
+                break
+            if r_start > pos:
+                missing.append([pos, r_start - 1])
+            pos = r_end + 1
+
+        if pos <= end:
+            missing.append([pos, end])
+        return missing
+
+    def find_checkpoint(self, frame_idx, checkpoints=None, ranges=None):
+        """
+        Ближайший чекпоинт не позже frame_idx, от которого до frame_idx все посчитано.
+        Возвращает (c_idx, state) или (None, None).
+        """
+        if checkpoints is None:
+            checkpoints = self._checkpoints
+
+        for c_idx in sorted(checkpoints, reverse=True):
+            if c_idx > frame_idx:
+                continue
+            if not self.get_missing_ranges(c_idx, frame_idx, ranges):
+                return c_idx, checkpoints[c_idx]
+        return None, None
+
+    def _add_checkpoint(self, c_idx, state):
+        self._checkpoints[c_idx] = state
+        while len(self._checkpoints) > self.MAX_CHECKPOINTS:
+            del self._checkpoints[min(self._checkpoints)]
+
+    @staticmethod
+    def read_frames(worker, cap, start, end, stats=None):
+        """
+        Кадры [start, end]: одна перемотка в начало, дальше последовательное чтение.
+        stats (AnalysisStats) — учитывает время декодирования как этап "decode".
+        """
+        if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+        for idx in range(start, end + 1):
+            if not worker.is_running:
+                return
+            if stats is not None:
+                stats.mark()
+            ret, frame = cap.read()
+            if not ret:
+                return
+            if stats is not None:
+                stats.lap("decode")
+            yield idx, frame
+
+    @classmethod
+    def prefetch_frames(cls, worker, cap, start, end, stats=None):
+        """
+        То же, что read_frames, но кадры декодируются в отдельном потоке
+        и ждут в очереди, пока идет обработка предыдущих.
+        В stats этапом "decode" считается только ожидание кадра из очереди.
+        """
+        frames = queue.Queue(maxsize=cls.PREFETCH_DEPTH)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    frames.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def reader():
+            try:
+                for item in cls.read_frames(worker, cap, start, end):
+                    if not put(item):
+                        return
+            except Exception as e:
+                put(e)
+            finally:
+                put(_PREFETCH_END)
+
+        thread = threading.Thread(target=reader, name="frame-prefetch", daemon=True)
+        thread.start()
+        try:
+            while True:
+                if stats is not None:
+                    stats.mark()
+                item = frames.get()
+                if stats is not None:
+                    stats.lap("decode")
+                if item is _PREFETCH_END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Обработка прервана — отпускаем поток чтения (cap снова свободен)
+            stop.set()
+            thread.join()
+
+    @staticmethod
+    def cut_ranges(ranges, start, end):
+        """Части диапазонов, лежащие вне [start, end] (результаты, которые перескан не трогает)"""
+        kept = []
+        for r_start, r_end in ranges:
+            if r_start < start:
+                kept.append([r_start, min(r_end, start - 1)])
+            if r_end > end:
+                kept.append([max(r_start, end + 1), r_end])
+        return kept
+
+    # --- ПАРАЛЛЕЛЬНЫЙ СКАН КУСКАМИ ---
+
+    def scan_chunk(self, worker, cap, start, end):
+        """
+        Скан кадров [start, end] без состояния между кусками (переопределяется).
+        Вызывается в процессе пула или в потоке воркера; возвращает простые данные.
+        """
+        raise NotImplementedError("Subclasses must implement scan_chunk")
+
+    def use_chunk_pool(self):
+        """Можно ли раскидывать куски по процессам (потомки отключают, например, на CUDA)"""
+        return True
+
+    def split_chunks(self, segments, workers):
+        """Делит участки на куски: примерно по 4 на процесс, но не короче CHUNK_MIN_LEN"""
+        total = sum(e - s + 1 for s, e in segments)
+        chunk_len = max(self.CHUNK_MIN_LEN, -(-total // (workers * 4)))
+
+        chunks = []
+        for seg_start, seg_end in segments:
+            for start in range(seg_start, seg_end + 1, chunk_len):
+                chunks.append([start, min(seg_end, start + chunk_len - 1)])
+        return chunks
+
+    def run_chunks(self, worker, segments, on_chunk_done):
+        """
+        Считает scan_chunk по кускам участков segments.
+        on_chunk_done(chunk, result) вызывается в потоке воркера по мере готовности
+        (порядок кусков не гарантирован). Пауза и остановка воркера передаются в пул.
+        """
+        workers = self.CHUNK_MAX_WORKERS or os.cpu_count() or 1
+        chunks = self.split_chunks(segments, workers)
+        if not chunks:
+            return
+
+        if len(chunks) == 1 or workers == 1 or not self.use_chunk_pool():
+            # Последовательно в текущем потоке
+            cap = cv2.VideoCapture(self.video_path)
+            try:
+                for chunk in chunks:
+                    if not worker.is_running:
+                        break
+                    on_chunk_done(chunk, self.scan_chunk(worker, cap, *chunk))
+            finally:
+                cap.release()
+            return
+
+        ctx = multiprocessing.get_context("spawn")
+        stop_event, resume_event = ctx.Event(), ctx.Event()
+        resume_event.set()
+        filter_args = (type(self).__module__, type(self).__name__, self.num,
+                       self.cache_dir, self.get_params(), self.video_path, self.get_worker_state())
+
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=ctx,
+                                       initializer=_chunk_worker_init,
+                                       initargs=(stop_event, resume_event))
+        futures = {executor.submit(_chunk_worker_main, filter_args, *chunk): chunk for chunk in chunks}
+        pending = set(futures)
+        try:
+            while pending:
+                if worker.is_paused:
+                    resume_event.clear()
+                if not worker.is_running:  # На паузе ждет здесь
+                    break
+                resume_event.set()
+
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    on_chunk_done(futures[fut], fut.result())
+        finally:
+            # Остановка: куски дорабатывают до ближайшего кадра и отдают частичный результат
+            stop_event.set()
+            resume_event.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        for fut in pending:
+            if fut.done() and not fut.cancelled() and fut.exception() is None:
+                on_chunk_done(futures[fut], fut.result())
+
+    def start_analysis(self, frame_range=None):
+        """
+        Постановка фонового анализа в общую очередь.
+        frame_range — [start, end] включительно; None — весь файл.
+        """
         if self.is_analyzing or not self.video_path:
             return
 
+        if frame_range is not None and frame_range[0] > frame_range[1]:
+            print(f"{self.name}: empty analysis range {frame_range}")
+            return
+
+        self.analysis_range = frame_range
+        self.analysis_stats = None
         self.is_analyzing = True
         self.progress = 0
 
+        # Поток создаст планировщик, когда освободится слот
+        AnalysisScheduler.get_instance().submit(self)
+
+    def launch_worker(self, paused=False):
+        """Вызывается планировщиком: реальный запуск потока"""
+        if self.USE_PROCESS:
+            # Дочерний процесс читает кеш с диска — он должен быть дописан
+            self.flush_save()
+
         # Создаем поток и воркер
         self._thread = QThread()
-        self._worker = FilterAsincWorker(self)
+        if self.USE_PROCESS:
+            self._worker = FilterProcessWorker(self)
+        else:
+            self._worker = FilterAsincWorker(self)
+        self._worker.set_paused(paused)
         self._worker.moveToThread(self._thread)
+        self.analysis_state = STATE_PAUSED if paused else STATE_RUNNING
 
         # Связываем сигналы
         self._thread.started.connect(self._worker.run)
-        self._worker.progress.connect(self._on_worker_progress)
+        self._discard_progress = False
+        self._worker.progress.connect(self._on_worker_progress_checked)
         self._worker.error.connect(self._on_worker_error)
 
         # Правильное завершение
@@ -64,14 +730,34 @@ class FilterAsyncBase(FilterBase):
 
         self._thread.start()
 
+    def set_analysis_paused(self, paused):
+        if self._worker:
+            self._worker.set_paused(paused)
+            self.analysis_state = STATE_PAUSED if paused else STATE_RUNNING
+
     def stop_analysis(self):
         """Принудительная остановка"""
+        if AnalysisScheduler.get_instance().cancel(self):
+            # Еще не стартовал — просто убрали из очереди
+            self.is_analyzing = False
+            return
+
         if self._worker:
             self._worker.is_running = False
         if self._thread:
             self._thread.quit()
             self._thread.wait()  # Ждем реальной остановки
 
+    def release(self):
+        """Фильтр удален — убираем его из очереди анализа"""
+        super().release()
+        AnalysisScheduler.get_instance().remove(self)
+
+    def _on_worker_progress_checked(self, data):
+        if self._discard_progress:
+            return  # Хвост запуска, остановленного сменой параметров анализа
+        self._on_worker_progress(data)
+
     def _on_worker_progress(self, data):
         """Обновление данных из потока (выполняется в UI-потоке)"""
         # Мы используем наши новые сеттеры/геттеры
@@ -84,6 +770,12 @@ class FilterAsyncBase(FilterBase):
         if "marks" in data:
             self._detected_scenes = data["marks"]
 
+        if "checkpoint" in data:
+            self._add_checkpoint(*data["checkpoint"])
+
+        if "timing" in data:
+            self.analysis_stats = data["timing"]
+
         # self.save_data()
 
     def _on_worker_error(self, err_msg):
@@ -91,10 +783,26 @@ class FilterAsyncBase(FilterBase):
         self.is_analyzing = False
 
     def _on_analysis_finished(self):
+        if self._save_pending:
+            self.request_save(force=True)
         self.is_analyzing = False
         self._thread = None
         self._worker = None
-        print(f"Analysis for {self.name} finished.")
+        AnalysisScheduler.get_instance().job_finished(self)
+        print(f"Analysis for {self.name} finished. {format_stats(self.analysis_stats, True)}")
+        self._write_stats_log()
+
+    def _write_stats_log(self):
+        """Строка со скоростью и этапами в журнал анализа рядом с кешем"""
+        if not self.analysis_stats or not self.cache_dir:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(os.path.join(self.cache_dir, "analysis_log.txt"), 'a', encoding='utf-8') as f:
+                f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {self.get_id()}: "
+                        f"{format_stats(self.analysis_stats, True)} | {self.analysis_stats['stages']}\n")
+        except Exception as e:
+            print(f"Error writing analysis log: {e}")
 
     def run_internal_logic(self, worker):
         """Метод должен быть переопределен в конкретном фильтре"""
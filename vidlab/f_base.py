@@ -1,5 +1,9 @@
 import os
 import json
+from bisect import bisect_right
+from types import MappingProxyType
+
+import numpy as np
 
 from PySide6.QtCore import QObject, Signal, QMutex, QMutexLocker
 from PySide6.QtGui import Qt
@@ -9,25 +13,35 @@ class FilterBase(QObject):
 
     params_changed = Signal()  # Сигнал для UI (ползунки, таймлайн)
 
+    # Кеш метаданных параметров: {класс фильтра: dict}, заполняется один раз на класс
+    _metadata_cache = {}
+
     def __init__(self, num, cache_dir, params=None):
         self.name = "Base Filter"  # Переопределяется в потомках
         self.num = num
         self.cache_dir = cache_dir  # Путь к папке вида video_fdata/
 
-        self._params = params or {}
+        # Словарь параметров не меняется на месте (copy-on-write):
+        # любая запись создает новый словарь и подменяет ссылку целиком,
+        # поэтому читателям (UI, воркеры) лок не нужен
+        params = dict(params or {})
 
-        meta = self.get_params_metadata()
+        meta = self.get_metadata()
         for name, data in meta.items():
-            if not name in self._params:
-                self._params[name] = data['default']
+            if not name in params:
+                params[name] = data['default']
+
+        self._params = params
 
         self.enabled = True
         self.focused = False
-        self._lock = QMutex()
+        self._lock = QMutex()  # Сериализует только писателей
 
         self._prj_save_callback = None
+        self._prj_filters_callback = None
 
         self.current_frame_idx = 0  # Устанавливается контроллером перед процессом
+        self.is_exporting = False  # Экспорт: результат нужен точно для кадра, ждать можно
 
         # Временные списки для работы в памяти (не сериализуются автоматически)
         self._analyzed_ranges = []
@@ -35,6 +49,14 @@ class FilterBase(QObject):
 
         self._last_tracked_frame = -1
 
+        # Скомпилированные дорожки ключей: {param: (entry, (frames_list, frames_np, values_np))}
+        # entry — словарь анимации, из которого собрана дорожка; при правке он заменяется,
+        # и дорожка по сравнению ссылок считается устаревшей
+        self._tracks = {}
+
+        # Неизменяемый снимок значений на кадр: (frame_idx, params, MappingProxy)
+        self._snapshot = None
+
     def get_id(self):
         # Превращает "Scene Detector" в "scene_detector_1"
         clean_name = self.name.lower().replace(" ", "_")
@@ -47,30 +69,81 @@ class FilterBase(QObject):
         if self._prj_save_callback is not None:
             self._prj_save_callback()
 
+    def set_prj_filters_callback(self, callback):
+        self._prj_filters_callback = callback
+
+    def get_prj_filters(self):
+        """Фильтры проекта (для фильтров, использующих результаты других)"""
+        if self._prj_filters_callback is not None:
+            return self._prj_filters_callback()
+        return []
+
     def set_current_frame(self, idx):
         """устанавливается из контроллера"""
         self.current_frame_idx = idx
 
+    def take_snapshot(self, idx):
+        """Контроллер: один раз на кадр готовит интерполированные значения параметров"""
+        self.current_frame_idx = idx
+        return self.get_snapshot(idx)
+
+    def get_snapshot(self, idx=None):
+        """
+        Неизменяемый словарь всех параметров, уже интерполированных на кадр idx.
+        Пересобирается только при смене кадра или подмене словаря параметров.
+        """
+        if idx is None:
+            idx = self.current_frame_idx
+
+        params = self._params
+        snap = self._snapshot
+        if snap is not None and snap[0] == idx and snap[1] is params:
+            return snap[2]
+
+        values = {}
+        for key, val in params.items():
+            if isinstance(val, dict) and val.get("is_animated"):
+                values[key] = self._interpolate(key, val, idx)
+            else:
+                values[key] = val
+
+        proxy = MappingProxyType(values)
+        self._snapshot = (idx, params, proxy)
+        return proxy
+
+    def get_metadata(self):
+        """Метаданные параметров (кеш на класс, словарь только для чтения)"""
+        cls = type(self)
+        meta = FilterBase._metadata_cache.get(cls)
+        if meta is None:
+            meta = self.get_params_metadata()
+            FilterBase._metadata_cache[cls] = meta
+        return meta
+
     def get_params(self):
         """Возвращает текущие значения параметров для сохранения в основной JSON"""
-        with QMutexLocker(self._lock):
-            return dict(self._params)
+        return dict(self._params)
 
     def is_animated(self, key):
         """Проверяет, хранится ли параметр как структура ключевых кадров"""
-        with QMutexLocker(self._lock):
-            val = self._params.get(key)
-            return isinstance(val, dict) and val.get("is_animated") is True
+        val = self._params.get(key)
+        return isinstance(val, dict) and val.get("is_animated") is True
 
     def can_be_animated(self, key):
         """Проверяет метаданные: разрешена ли анимация для этого типа"""
-        metadata = self.get_params_metadata()
+        metadata = self.get_metadata()
         if key not in metadata: return False
 
         p_type = metadata[key].get('type')
         # Разрешаем анимацию для чисел
         return p_type in ['float']
 
+    def _swap_param(self, key, value):
+        """Подменяет словарь параметров копией с новым значением (вызывать под локом)"""
+        params = dict(self._params)
+        params[key] = value
+        self._params = params
+
     def set_animation(self, key, is_set):
         """Включает/выключает режим анимации для параметра"""
         if not self.can_be_animated(key): return
@@ -78,38 +151,33 @@ class FilterBase(QObject):
 
         current_val = self.get_param(key)  # Получаем текущее (возможно интерполированное) значение
 
-        if not is_set:
-            # Выключаем: превращаем в обычное число (значение из текущего кадра)
-            with QMutexLocker(self._lock):
-                self._params[key] = current_val
-        else:
-            # Включаем: создаем структуру с первым ключом на текущем кадре
-            with QMutexLocker(self._lock):
-                self._params[key] = {
+        with QMutexLocker(self._lock):
+            if not is_set:
+                # Выключаем: превращаем в обычное число (значение из текущего кадра)
+                self._swap_param(key, current_val)
+            else:
+                # Включаем: создаем структуру с первым ключом на текущем кадре
+                self._swap_param(key, {
                     "is_animated": True,
                     "keys": {str(self.current_frame_idx): current_val}
-                }
+                })
 
     def get_param(self, key, default=None):
-        with QMutexLocker(self._lock):
-            if key in self._params:
-                val = self._params[key]
-                # Если параметр анимирован — интерполируем
-                if isinstance(val, dict) and val.get("is_animated"):
-                    return self._interpolate(val["keys"], self.current_frame_idx)
-                return val
+        snap = self.get_snapshot()
+        if key in snap:
+            return snap[key]
 
-        # 2. Метаданные (вне лока)
-        metadata = self.get_params_metadata()
+        # Метаданные (кешированы на класс)
+        metadata = self.get_metadata()
         if key in metadata and 'default' in metadata[key]:
             return metadata[key]['default']
         return default
 
     def set_param(self, key, value):
-        metadata = self.get_params_metadata()
+        metadata = self.get_metadata()
         if key not in metadata:
             with QMutexLocker(self._lock):
-                self._params[key] = value
+                self._swap_param(key, value)
             return
 
         # 1. Валидация границ (общая для статики и ключей)
@@ -124,36 +192,74 @@ class FilterBase(QObject):
 
         # 2. Запись
 
-        if self.is_animated(key):
-            with QMutexLocker(self._lock):
-                # Записываем ключ для текущего кадра
+        with QMutexLocker(self._lock):
+            val = self._params.get(key)
+            if isinstance(val, dict) and val.get("is_animated"):
+                # Записываем ключ для текущего кадра в новую копию структуры
                 # Используем строки для ключей словаря (для совместимости с JSON)
-                self._params[key]["keys"][str(self.current_frame_idx)] = value
-        else:
-            # Обычная статичная запись
-            if self._params.get(key) == value: return
-            with QMutexLocker(self._lock):
-                self._params[key] = value
+                keys = dict(val["keys"])
+                keys[str(self.current_frame_idx)] = value
+                self._swap_param(key, {"is_animated": True, "keys": keys})
+            else:
+                # Обычная статичная запись
+                if val == value: return
+                self._swap_param(key, value)
+
+    def _get_track(self, key, entry):
+        """
+        Возвращает скомпилированную дорожку ключей параметра.
+        (frames_list, frames_np, values_np) — кадры отсортированы, None если ключей нет.
+        """
+        cached = self._tracks.get(key)
+        if cached is not None and cached[0] is entry:
+            return cached[1]
+
+        keys_dict = entry["keys"]
+        track = None
+        if keys_dict:
+            # Строковые ключи (формат JSON) разбираем один раз
+            items = sorted((int(f), v) for f, v in keys_dict.items())
+            frames = [f for f, _ in items]
+            track = (
+                frames,
+                np.array(frames, dtype=np.int64),
+                np.array([v for _, v in items], dtype=np.float64)
+            )
+        self._tracks[key] = (entry, track)
+        return track
+
+    def _interpolate(self, key, entry, current_frame):
+        track = self._get_track(key, entry)
+        if track is None: return 0
+
+        frames, _, values = track
 
-    def _interpolate(self, keys_dict, current_frame):
-        if not keys_dict: return 0
+        # Крайние точки
+        if current_frame <= frames[0]: return float(values[0])
+        if current_frame >= frames[-1]: return float(values[-1])
 
-        # Сортируем кадры-ключи
-        frames = sorted([int(f) for f in keys_dict.keys()])
+        # Бинарный поиск соседей и линейная интерполяция между ними
+        i = bisect_right(frames, current_frame)
+        f1, f2 = frames[i - 1], frames[i]
+        v1, v2 = values[i - 1], values[i]
+        t = (current_frame - f1) / (f2 - f1)
+        return float(v1 + (v2 - v1) * t)
 
-        # Крайние точки
-        if current_frame <= frames[0]: return keys_dict[str(frames[0])]
-        if current_frame >= frames[-1]: return keys_dict[str(frames[-1])]
-
-        # Линейная интерполяция между соседями
-        for i in range(len(frames) - 1):
-            f1, f2 = frames[i], frames[i + 1]
-            if f1 <= current_frame <= f2:
-                v1 = keys_dict[str(f1)]
-                v2 = keys_dict[str(f2)]
-                t = (current_frame - f1) / (f2 - f1)
-                return v1 + (v2 - v1) * t
-        return 0
+    def get_param_series(self, key, frames):
+        """
+        Значения параметра сразу для набора кадров (один векторный вызов).
+        Возвращает np.ndarray той же длины, что и frames.
+        """
+        frames = np.asarray(frames)
+        val = self._params.get(key)
+        if isinstance(val, dict) and val.get("is_animated"):
+            track = self._get_track(key, val)
+            if track is None:
+                return np.zeros(len(frames), dtype=np.float64)
+            # np.interp сам держит крайние значения за пределами ключей
+            return np.interp(frames, track[1], track[2])
+
+        return np.full(len(frames), self.get_param(key))
 
     def is_active_at(self, idx):
         # Если параметров нет — фильтр работает везде
@@ -186,6 +292,14 @@ class FilterBase(QObject):
         """Рисование поверх видео"""
         pass
 
+    def warm_up(self):
+        """Фоновая подготовка тяжелых ресурсов (нейросетей) до первого кадра"""
+        pass
+
+    def release(self):
+        """Фильтр удален из проекта — освободить общие ресурсы"""
+        pass
+
     def get_timeline_data(self):
         """Переопределяем, чтобы отдавать данные не из params, а из внутренних списков"""
         return {
@@ -207,16 +321,16 @@ class FilterBase(QObject):
 
     def get_keyframe_indices(self, param_names=None):
         """Возвращает отсортированный список всех уникальных кадров-ключей для выбранных полей"""
-        with QMutexLocker(self._lock):
-            indices = set()
-            # Если список полей не задан, берем все анимированные
-            keys_to_check = param_names if param_names else self._params.keys()
+        params = self._params
+        indices = set()
+        # Если список полей не задан, берем все анимированные
+        keys_to_check = param_names if param_names else params.keys()
 
-            for key in keys_to_check:
-                val = self._params.get(key)
-                if isinstance(val, dict) and val.get("is_animated"):
-                    indices.update([int(f) for f in val["keys"].keys()])
-            return sorted(list(indices))
+        for key in keys_to_check:
+            val = params.get(key)
+            if isinstance(val, dict) and val.get("is_animated"):
+                indices.update([int(f) for f in val["keys"].keys()])
+        return sorted(list(indices))
 
     def get_keyframes_data(self, param_names):
         """
@@ -224,26 +338,21 @@ class FilterBase(QObject):
         Позволяет рисовалке получить готовые координаты для всех точек маршрута.
         """
         indices = self.get_keyframe_indices(param_names)
-        result = {}
-
-        # Сохраняем текущий кадр, чтобы не сбить состояние фильтра
-        original_frame = self.current_frame_idx
+        if not indices:
+            return {}
 
-        for idx in indices:
-            self.set_current_frame(idx)
-            frame_data = {}
-            for name in param_names:
-                frame_data[name] = self.get_param(name)
-            result[idx] = frame_data
+        # Все параметры считаем векторно по всем ключевым кадрам сразу
+        series = {name: self.get_param_series(name, indices).tolist() for name in param_names}
 
-        # Восстанавливаем состояние
-        self.set_current_frame(original_frame)
-        return result
+        return {
+            idx: {name: series[name][i] for name in param_names}
+            for i, idx in enumerate(indices)
+        }
 
     def remove_keyframe(self, frame_idx, param_names=None):
         """Удаляет ключи на указанном кадре"""
         with QMutexLocker(self._lock):
-            keys_to_check = param_names if param_names else self._params.keys()
+            keys_to_check = param_names if param_names else list(self._params.keys())
             str_idx = str(frame_idx)
             changed = False
 
@@ -253,7 +362,9 @@ class FilterBase(QObject):
                     # Проверяем, есть ли такой ключ и не единственный ли он
                     if str_idx in val["keys"]:
                         if len(val["keys"]) > 1:
-                            del val["keys"][str_idx]
+                            keys = dict(val["keys"])
+                            del keys[str_idx]
+                            self._swap_param(key, {"is_animated": True, "keys": keys})
                             changed = True
                         else:
                             # Можно вывести предупреждение в консоль или статус-бар
@@ -2,11 +2,38 @@ import cv2
 import os
 import torch
 import numpy as np
-from ultralytics import YOLO
 from .f_asinc_base import FilterAsyncBase
+from .m_analysis_stats import AnalysisStats
+from .m_blur_kernel import FaceBlurKernel
+from .m_det_storage import DetectionStorage, pack_detections
+from .f_object_detecctor import FilterObjectDetector
+from .m_live_infer import LatestFrameInference
+from .m_infer_backend import load_yolo, infer_device
+from .m_model_pool import ModelPool
 
 
 class FilterFaceBlur(FilterAsyncBase):
+    """
+    Размытие лиц. Анализ сохраняет рамки лиц для каждого кадра в колоночное
+    хранилище (детектор на каждом SCAN_STEP-м кадре, между ними рамки
+    интерполируются); кадры из хранилища размываются без нейросети.
+    Каскад (person_crops): лица ищутся только в верхней части рамок людей —
+    из анализа Object Detector или быстрой модели людей; раз в full_every кадров
+    проверяется весь кадр, чтобы не пропустить лица вне найденных людей.
+    """
+    CACHE_EXT = "det"  # Папка DetectionStorage
+    STORE_CONF = 0.1  # Порог при анализе — минимум параметра conf
+    CHUNK_MAX_WORKERS = 4  # Каждый процесс пула держит свою копию модели — память растет с их числом
+    SCAN_STEP = 3  # Детектор на каждом 3-м кадре
+    MATCH_IOU = 0.3  # Одно и то же лицо на соседних проверенных кадрах
+    ANALYSIS_PARAMS = ("model", "backend", "person_crops", "person_detector", "full_every")
+
+    PERSON_CONF = 0.3  # Порог уверенности для рамок людей
+    UPPER_BODY = 0.6  # Лицо ищем в верхних 60% рамки человека
+    CROP_PAD = 0.15  # Запас вокруг кропа (доля ширины человека)
+    CROP_SIZE = 320  # Вход нейросети для кропов
+    NMS_IOU = 0.5  # Дубли одного лица из пересекающихся кропов
+
     def __init__(self, num, cache_dir, params=None):
         if not params:
             params = {
@@ -17,11 +44,32 @@ class FilterFaceBlur(FilterAsyncBase):
             }
         super().__init__(num, cache_dir, params)
         self.name = "AI Face Blur"
-        self._model = None
+        # Можно использовать yolov8n-face.pt (нужно скачать в папку models)
+        # Модель и замок инференса общие для всех экземпляров (ModelPool)
+        self._model_key = (os.path.join(os.getcwd(), 'models', 'yolov8n-face.pt'), infer_device())
+        self._model_lock = ModelPool.get_instance().acquire(self._model_key, self._load_model)
+        self.set_model_params(self._model_key)
+        self._released = False
+
+        # Инференс предпросмотра в фоновом потоке (ключ — кадр и conf)
+        self._live = LatestFrameInference(lambda key, frame: self._detect_faces(frame, *key), "face-preview")
+        self._live_applied = None  # Ключ результата, уже учтенного в памяти лиц
 
         # Хранилище для сглаживания: { id: {'box': [x1,y1,x2,y2], 'lost_count': 0} }
         self._face_memory = {}
         self._max_lost_frames = 5  # Сколько кадров "держать" маску после исчезновения
+        self._blur_kernel = FaceBlurKernel()
+
+        self._person_store = None  # DetectionStorage Object Detector в процессе анализа (set_worker_state)
+        self._person_key = None  # Быстрая модель людей в ModelPool (загружается по требованию)
+        self._person_lock = None
+        self._last_full = None  # Кадр последнего поиска по всему кадру (предпросмотр, экспорт)
+
+        self._store = None  # DetectionStorage текущего кеша
+        self._det_ranges = []  # Проанализированные кадры (_analyzed_ranges — кадры с лицами)
+        self._pending = []  # Результаты из воркера, еще не записанные в хранилище
+
+        self.load_data()
 
     def get_params_metadata(self):
         return {
@@ -29,46 +77,243 @@ class FilterFaceBlur(FilterAsyncBase):
             "conf": {"type": "float", "min": 0.1, "max": 1.0, "default": 0.3},
             "blur_size": {"type": "int", "min": 1, "max": 150, "default": 30},
             "pixelate": {"type": "bool", "default": False},
-            "ellipse": {"type": "bool", "default": True}
+            "ellipse": {"type": "bool", "default": True},
+            # Каскад: лица только в кропах людей (из Object Detector или быстрой модели)
+            "person_crops": {"type": "bool", "default": False},
+            # Своя быстрая модель людей для кадров, не покрытых анализом Object Detector
+            "person_detector": {"type": "bool", "default": False},
+            # Поиск по всему кадру раз в N кадров — лица, пропущенные детектором людей
+            "full_every": {"type": "int", "min": 1, "max": 300, "default": 30}
         }
 
     def _get_model(self):
-        if self._model is None:
-            # Можно использовать yolov8n-face.pt (нужно скачать в папку models)
-            model_path = os.path.join(os.getcwd(), 'models', 'yolov8n-face.pt')
-            self._model = YOLO(model_path)
-
-            if torch.cuda.is_available():
-                self._model.to('cuda')
-                print("use cuda")
-        return self._model
+        return ModelPool.get_instance().get(self._model_key)
+
+    def _load_model(self):
+        return self._load_yolo(self._model_key)
+
+    def _load_person_model(self):
+        return self._load_yolo(self._person_key)
+
+    def _load_yolo(self, model_key):
+        model, backend = load_yolo(*model_key, self.video_path)
+
+        if backend == "torch" and torch.cuda.is_available():
+            model.to('cuda')
+            print("use cuda")
+        return model
+
+    def warm_up(self):
+        ModelPool.get_instance().warm_up(self._model_key)
+
+    def release(self):
+        super().release()
+        self._live.stop()
+        if not self._released:
+            self._released = True
+            ModelPool.get_instance().release(self._model_key)
+            if self._person_key is not None:
+                ModelPool.get_instance().release(self._person_key)
+
+    # --- ХРАНИЛИЩЕ ЛИЦ ---
+
+    def reset_data(self):
+        super().reset_data()
+        self._store = None
+        self._det_ranges = []
+        self._pending = []
+
+    def load_data(self):
+        self._store = DetectionStorage(self.get_data_filepath())
+        self._det_ranges = self._store.analyzed_ranges()
+        self._update_presence()
+
+    def _update_presence(self):
+        """Кадры с лицами при текущем conf (для таймлайна)"""
+        if self._store is not None:
+            self._analyzed_ranges = self._quick_merge(self._store.presence(self.get_param("conf")).tolist())
+
+    def set_param(self, key, value):
+        super().set_param(key, value)
+        if key == "conf":
+            self.flush_save()
+            self._update_presence()
+
+    def get_save_payload(self):
+        if not self._pending:
+            return None
+        payload, self._pending = self._pending, []
+        return payload
+
+    def write_payload(self, payload, path):
+        store = self._store if self._store is not None and self._store.path == path else DetectionStorage(path)
+        for item in payload:
+            store.write_range(*item["range"], item, item.get("names"))
+
+    def get_stored_faces(self, idx):
+        """Рамки лиц кадра из хранилища; None — кадр не анализировался"""
+        stored = self._store.get(idx) if self._store is not None else None
+        if stored is None:
+            return None
+        keep = stored["scores"] >= self.get_param("conf")
+        return stored["boxes"][keep].tolist()
+
+    def _detect_faces(self, frame, idx, conf):
+        """Инференс одного кадра: [(id, [x1, y1, x2, y2])]"""
+        full_every = self.get_param("full_every")
+        full = self._last_full is None or abs(idx - self._last_full) >= full_every
+        if full:
+            self._last_full = idx
+
+        with self._model_lock:
+            model = self._get_model()
+            if model is None:
+                return []  # Модель не загрузилась — кадр без лиц
+            device = 'cuda' if torch.cuda.is_available() else 'cpu'
+            boxes, _ = self._find_faces(model, frame, idx, conf, device, full)
+
+        return [(i, box) for i, box in enumerate(boxes.tolist())]
+
+    # --- КАСКАД: ЛЮДИ -> ЛИЦА ---
+
+    def _find_faces(self, model, frame, idx, conf, device, full):
+        """
+        Лица кадра: (боксы (n, 4), уверенности). Если каскад включен, кадр не из полных
+        проверок и люди на нем известны — поиск одной пачкой по кропам людей.
+        """
+        persons = None
+        if self.get_param("person_crops") and not full:
+            persons = self._get_persons(frame, idx, device)
+
+        if persons is None:
+            # 1. Быстрый поиск лиц по всему кадру
+            results = model.predict(frame, device=device, conf=conf, half=(device == 'cuda'),
+                                    verbose=False, max_det=50)
+            return self._result_boxes(results[0] if results else None)
+
+        crops, offsets = self._person_crops(frame, persons)
+        if not crops:
+            return self._result_boxes(None)
+
+        results = model.predict(crops, device=device, conf=conf, imgsz=self.CROP_SIZE,
+                                half=(device == 'cuda'), verbose=False, max_det=10)
+        boxes, scores = [], []
+        for (ox, oy), res in zip(offsets, results):
+            c_boxes, c_scores = self._result_boxes(res)
+            boxes.append(c_boxes + np.array([ox, oy, ox, oy], dtype=np.float32))
+            scores.append(c_scores)
+        return self._suppress(np.concatenate(boxes), np.concatenate(scores))
+
+    @staticmethod
+    def _result_boxes(res):
+        if res is None or len(res) == 0:
+            return np.zeros((0, 4), np.float32), np.zeros(0, np.float32)
+        res = res.cpu()
+        return res.boxes.xyxy.numpy(), res.boxes.conf.numpy()
+
+    def _person_crops(self, frame, persons):
+        """Верхние части рамок людей с запасом: (кропы, смещения кропов в кадре)"""
+        h_img, w_img = frame.shape[:2]
+        crops, offsets = [], []
+        for x1, y1, x2, y2 in persons:
+            pad = (x2 - x1) * self.CROP_PAD
+            cx1, cy1 = int(max(0, x1 - pad)), int(max(0, y1 - pad))
+            cx2 = int(min(w_img, x2 + pad))
+            cy2 = int(min(h_img, y1 + (y2 - y1) * self.UPPER_BODY + pad))
+            if cx2 - cx1 < 8 or cy2 - cy1 < 8:
+                continue
+            crops.append(frame[cy1:cy2, cx1:cx2])
+            offsets.append((cx1, cy1))
+        return crops, offsets
+
+    def _suppress(self, boxes, scores):
+        """Одно лицо из двух пересекающихся кропов — оставляем более уверенное"""
+        if len(scores) < 2:
+            return boxes, scores
+        order = np.argsort(scores)[::-1]
+        iou = self._iou_matrix(boxes[order], boxes[order])
+        keep = []
+        for i in range(len(order)):
+            if all(iou[i, j] < self.NMS_IOU for j in keep):
+                keep.append(i)
+        return boxes[order[keep]], scores[order[keep]]
+
+    def _get_persons(self, frame, idx, device):
+        """
+        Рамки людей кадра: из хранилища Object Detector, иначе быстрой моделью (если включена).
+        None — люди на кадре неизвестны, нужен поиск по всему кадру.
+        """
+        store = self._get_person_store()
+        stored = store.get(idx) if store is not None else None
+        if stored is not None:
+            person_ids = [c for c, name in store.names.items() if name == "person"]
+            if person_ids:
+                keep = (stored["classes"] == person_ids[0]) & (stored["scores"] >= self.PERSON_CONF)
+                return stored["boxes"][keep]
+
+        if self.get_param("person_detector"):
+            return self._detect_persons(frame, device)
+        return None
+
+    def _get_person_store(self):
+        """
+        Хранилище Object Detector проекта — его же экземпляр, через который детектор пишет,
+        поэтому новые кадры видны сразу. В процессе анализа проекта нет — открыто
+        хранилище по пути от родителя, и оно переоткрывается, когда детектор его дописал.
+        """
+        for f_obj in self.get_prj_filters():
+            if isinstance(f_obj, FilterObjectDetector):
+                return f_obj.get_store()
+        if self._person_store is not None:
+            self._person_store.refresh()
+        return self._person_store
+
+    def get_worker_state(self):
+        store = self._get_person_store()
+        return {"person_store": store.path if store is not None else None}
+
+    def set_worker_state(self, state):
+        path = (state or {}).get("person_store")
+        self._person_store = DetectionStorage(path) if path else None
+
+    def _detect_persons(self, frame, device):
+        """Люди на кадре быстрой моделью (COCO, класс 0) на малом входе"""
+        pool = ModelPool.get_instance()
+        if self._person_key is None:
+            self._person_key = (os.path.join(os.getcwd(), 'models', 'yolo11n.pt'), self._model_key[1])
+            self._person_lock = pool.acquire(self._person_key, self._load_person_model)
+
+        with self._person_lock:
+            model = pool.get(self._person_key)
+            if model is None:
+                return None  # Люди неизвестны — ищем лица по всему кадру
+            results = model.predict(frame, device=device, conf=self.PERSON_CONF, classes=[0],
+                                    imgsz=self.CROP_SIZE, half=(device == 'cuda'), verbose=False)
+        return self._result_boxes(results[0] if results else None)[0]
 
     def process(self, frame, idx):
-        model = self._get_model()
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
-
-        current_boxes = []
-        # 1. Быстрый поиск лиц
-        results = model.predict( #predict track
-            frame,
-            device=device,
-            # persist=True,
-            conf=self.get_param("conf"),
-            half=(device == 'cuda'),
-            # imgsz=320,  # Уменьшаем размер для скорости
-            verbose=False,
-            max_det=50
-        )
-
-        if results and len(results[0]) > 0:
-            res = results[0].cpu()
-
-            for box in res.boxes:
-                # Берем ID трекера, если есть, иначе просто индекс
-                track_id = int(box.id[0]) if box.id is not None else len(current_boxes)
-                coords = box.xyxy[0].tolist()
-                current_boxes.append((track_id, coords))
+        stored = self.get_stored_faces(idx)
+        if stored is not None:
+            # Кадр проанализирован: только размытие, без нейросети
+            self._render_faces(frame, stored)
+            return frame
+
+        conf = self.get_param("conf")
+        if self.is_exporting:
+            # Экспорт: точный результат для каждого кадра
+            self._update_face_memory(self._detect_faces(frame, idx, conf))
+        else:
+            # Предпросмотр: нейросеть в фоне; память лиц обновляем, только когда пришел новый результат
+            latest = self._live.request((idx, conf), frame)
+            if latest is not None and latest[0] != self._live_applied:
+                self._live_applied = latest[0]
+                self._update_face_memory(latest[1])
+
+        # Таймлайн не трогаем: кадры с лицами известны только из скана (хранилища)
+        self._render_faces(frame, [data['box'] for data in self._face_memory.values()])
+        return frame
 
+    def _update_face_memory(self, current_boxes):
         # Обновляем память
         # 1. Помечаем все старые лица как "потерянные" на +1 кадр
         for f_id in self._face_memory:
@@ -85,113 +330,164 @@ class FilterFaceBlur(FilterAsyncBase):
         self._face_memory = {k: v for k, v in self._face_memory.items()
                              if v['lost_count'] < self._max_lost_frames}
 
+    def _render_faces(self, frame, boxes):
         # Параметры размытия
         ksize = self.get_param("blur_size")
         if ksize % 2 == 0: ksize += 1
         use_pixelate = self.get_param("pixelate")
         use_ellipse = self.get_param("ellipse")
 
-        # 4. Рендерим размытие для всех лиц из памяти
-        h_img, w_img = frame.shape[:2]
-        for f_id, data in self._face_memory.items():
-            x1, y1, x2, y2 = map(int, data['box'])
-
-            # Ограничиваем координаты границами кадра
-            x1, y1 = max(0, x1), max(0, y1)
-            x2, y2 = min(w_img, x2), min(h_img, y2)
-
-            w, h = x2 - x1, y2 - y1
-            if w <= 0 or h <= 0: continue
-
-            # Извлекаем ROI (область лица)
-            face_roi = frame[y1:y2, x1:x2]
-
-            # 2. Применяем эффект
-            if use_pixelate:
-                # Пикселизация
-                pw, ph = max(1, w // 15), max(1, h // 15)
-                tmp = cv2.resize(face_roi, (pw, ph), interpolation=cv2.INTER_NEAREST)
-                blurred = cv2.resize(tmp, (w, h), interpolation=cv2.INTER_NEAREST)
-            else:
-                # Размытие по Гауссу
-                blurred = cv2.GaussianBlur(face_roi, (ksize, ksize), 0)
-
-            # 3. Накладываем обратно
-            if use_ellipse:
-                # Создаем эллиптическую маску для мягких краев
-                mask = np.zeros((h, w), dtype=np.uint8)
-                cv2.ellipse(mask, (w // 2, h // 2), (w // 2, h // 2), 0, 0, 360, 255, -1)
-                mask_inv = cv2.bitwise_not(mask)
-
-                bg = cv2.bitwise_and(face_roi, face_roi, mask=mask_inv)
-                fg = cv2.bitwise_and(blurred, blurred, mask=mask)
-                frame[y1:y2, x1:x2] = cv2.add(bg, fg)
-            else:
-                frame[y1:y2, x1:x2] = blurred
-
-        # Обновляем прогресс-бар на таймлайне (опционально)
-        self._update_ranges(idx)
-        return frame
-
-    def _update_ranges(self, idx):
-        # 1. Добавляем новый "микро-интервал"
-        self._analyzed_ranges.append([idx, idx])
-
-        # 2. Сортируем по началу (важно для правильной склейки)
-        self._analyzed_ranges.sort(key=lambda x: x[0])
-
-        # 3. Склеиваем накладывающиеся или идущие впритык
-        merged = []
-        if not self._analyzed_ranges:
-            return
-
-        curr_start, curr_end = self._analyzed_ranges[0]
-
-        for i in range(1, len(self._analyzed_ranges)):
-            next_start, next_end = self._analyzed_ranges[i]
-
-            # Если интервалы пересекаются или идут подряд (допуск +1)
-            if next_start <= curr_end + 1:
-                # Расширяем текущий конец, если следующий интервал длиннее
-                curr_end = max(curr_end, next_end)
-            else:
-                # Разрыв найден: сохраняем старый интервал и начинаем новый
-                merged.append([curr_start, curr_end])
-                curr_start, curr_end = next_start, next_end
-
-        # Не забываем добавить последний интервал
-        merged.append([curr_start, curr_end])
-        self._analyzed_ranges = merged
+        # 4. Все лица — одним проходом (уменьшенное размытие, маски из кеша)
+        self._blur_kernel.apply(frame, boxes, ksize, use_pixelate, use_ellipse)
 
     def run_internal_logic(self, worker):
-        """Асинхронный скан только для визуализации 'где есть лица'"""
+        """Асинхронный скан лиц с записью рамок каждого кадра (куски параллельно)"""
         cap = cv2.VideoCapture(self.video_path)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        model = self._get_model()
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        cap.release()
+
+        # Считаем только кадры, которых еще нет в хранилище
+        missing = self.get_missing_ranges(*self.get_analysis_range(total_frames), self._det_ranges)
+        todo = max(1, sum(e - s + 1 for s, e in missing))
+        kept_ranges = list(self._analyzed_ranges)
 
         frames_with_faces = []
-        for f_idx in range(total_frames):
-            if not worker.is_running: break
+        done = 0
+        stats = AnalysisStats(todo)
+
+        def on_chunk_done(chunk, result):
+            nonlocal done
+            stats.mark()
+            stats.merge(result["timing"])
+            frames_with_faces.extend(result["hits"])
+
+            message = {
+                "ranges": self.merge_ranges(kept_ranges + self._quick_merge(sorted(frames_with_faces))),
+                "timing": stats.as_dict()
+            }
+            d_start, d_end = result["dets"]["range"]
+            if d_end >= d_start:
+                done += d_end - d_start + 1
+                message["dets"] = result["dets"]
+            message["progress"] = int(done / todo * 100)
+            worker.progress.emit(message)
+            stats.lap("emit")
+
+        self.run_chunks(worker, missing, on_chunk_done)
+        worker.progress.emit({
+            "progress": 100 if done >= todo else int(done / todo * 100),
+            "ranges": self.merge_ranges(kept_ranges + self._quick_merge(sorted(frames_with_faces))),
+            "timing": stats.as_dict()
+        })
+
+    def _on_worker_progress(self, data):
+        super()._on_worker_progress(data)
+
+        if "dets" in data:
+            # Рамки кадров куска: в хранилище уходят фоновой записью
+            self._pending.append(data["dets"])
+            self._det_ranges = self.merge_ranges(self._det_ranges + [data["dets"]["range"]])
+            self.request_save()
+
+    def use_chunk_pool(self):
+        # Одну видеокарту процессы не поделят — на CUDA сканируем в одном потоке
+        return not torch.cuda.is_available()
+
+    def scan_chunk(self, worker, cap, start, end):
+        """
+        Рамки лиц куска [start, end] в колонках хранилища.
+        Детектор — на каждом SCAN_STEP-м кадре и на краях куска, остальные кадры
+        заполняются интерполяцией, так что кусок покрыт целиком.
+        """
+        model = self._get_model()
+        if model is None:
+            raise Exception("Face detection model is not available")
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
 
-            ret, frame = cap.read()
-            if not ret: break
+        full_every = self.get_param("full_every")
+
+        found = []  # [(кадр, боксы, уверенности, классы, контуры)]
+        prev = None  # (кадр, боксы, уверенности) последнего проверенного кадра
+        last_full = None
+        stats = AnalysisStats()
+        for f_idx, frame in self.read_frames(worker, cap, start, end, stats):
+            if f_idx % self.SCAN_STEP == 0 or f_idx == start or f_idx == end:
+                full = last_full is None or f_idx - last_full >= full_every
+                if full:
+                    last_full = f_idx
+                boxes, scores = self._find_faces(model, frame, f_idx, self.STORE_CONF, device, full)
+
+                curr = (f_idx, boxes, scores)
+                if prev is not None:
+                    found.extend(self.fill_gap(prev, curr))
+                if len(scores):
+                    found.append((f_idx, boxes, scores, np.zeros(len(scores)), None))
+                prev = curr
+                stats.lap("core")
+            stats.frame_done()
 
-            # Сканируем каждый 3-й кадр для скорости (этого хватит для таймлайна)
-            if f_idx % 3 == 0:
-                results = model.predict(frame, device=device, conf=self.get_param("conf"),
-                                        imgsz=256, half=True, verbose=False)
-                if results and len(results[0]) > 0:
-                    frames_with_faces.append(f_idx)
+        # Кадры после последней проверки (остановка посреди куска) не записываем
+        conf = self.get_param("conf")
+        dets = pack_detections(found)
+        dets["range"] = [start, prev[0] if prev is not None else start - 1]
+        dets["names"] = {0: "face"}
 
-            if f_idx % 100 == 0:
-                worker.progress.emit({
-                    "progress": int(f_idx / total_frames * 100),
-                    "ranges": self._quick_merge(frames_with_faces)
-                })
+        return {
+            "hits": [f[0] for f in found if f[2].max() >= conf],
+            "dets": dets,
+            "timing": stats.as_dict()
+        }
 
-        cap.release()
-        worker.progress.emit({"progress": 100, "ranges": self._quick_merge(frames_with_faces)})
+    @classmethod
+    def fill_gap(cls, a, b):
+        """
+        Рамки кадров между двумя проверенными a и b — (кадр, боксы, уверенности).
+        Лица, совпавшие по IoU, плавно переходят из a в b; остальные держатся
+        на всем промежутке (лучше размыть лишнее, чем пропустить лицо).
+        """
+        a_idx, a_boxes, a_scores = a
+        b_idx, b_boxes, b_scores = b
+        if b_idx - a_idx < 2 or (len(a_scores) == 0 and len(b_scores) == 0):
+            return []
+
+        pairs = []
+        if len(a_scores) and len(b_scores):
+            iou = cls._iou_matrix(a_boxes, b_boxes)
+            for flat in np.argsort(iou, axis=None)[::-1]:
+                i, j = np.unravel_index(flat, iou.shape)
+                if iou[i, j] < cls.MATCH_IOU:
+                    break
+                if all(i != p[0] and j != p[1] for p in pairs):
+                    pairs.append((i, j))
+
+        a_left = [i for i in range(len(a_scores)) if all(i != p[0] for p in pairs)]
+        b_left = [j for j in range(len(b_scores)) if all(j != p[1] for p in pairs)]
+        a_pair = np.array([p[0] for p in pairs], dtype=int)
+        b_pair = np.array([p[1] for p in pairs], dtype=int)
+        pair_scores = np.minimum(a_scores[a_pair], b_scores[b_pair])
+        still_boxes = np.concatenate([a_boxes[a_left], b_boxes[b_left]]).reshape(-1, 4)
+        still_scores = np.concatenate([a_scores[a_left], b_scores[b_left]])
+        scores = np.concatenate([pair_scores, still_scores])
+        classes = np.zeros(len(scores))
+
+        items = []
+        for f_idx in range(a_idx + 1, b_idx):
+            t = (f_idx - a_idx) / (b_idx - a_idx)
+            moved = a_boxes[a_pair] * (1 - t) + b_boxes[b_pair] * t
+            items.append((f_idx, np.concatenate([moved.reshape(-1, 4), still_boxes]), scores, classes, None))
+        return items
+
+    @staticmethod
+    def _iou_matrix(a, b):
+        """IoU всех пар рамок a (n, 4) и b (m, 4)"""
+        x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+        y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+        x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+        y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+        inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+        area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+        return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
 
     def _quick_merge(self, indices):
         if not indices: return []
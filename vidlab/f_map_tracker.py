@@ -7,11 +7,20 @@ from PySide6.QtCore import Qt, QPointF, QRectF
 from .f_asinc_base import FilterAsyncBase
 from .m_cam_tracker_cv2 import CameraTrackerCv2Model
 from .m_cam_tracker_slam import CameraTrackerSlamModel
+from .m_row_buffer import RowBuffer
+from .m_analysis_stats import AnalysisStats
 
-DATA_VERSION = 4
+DATA_VERSION = 5
 
 
 class FilterMapTracker(FilterAsyncBase):
+    # Трекинг точек — циклы на Python по спискам словарей: считаем в отдельном процессе
+    USE_PROCESS = True
+    CACHE_EXT = "npy"
+    ANALYSIS_PARAMS = ("min_features",)
+    # Чекпоинт — активные точки и позы, на которые они ссылаются; истории в нем нет
+    MAX_CHECKPOINTS = 2
+
     def __init__(self, num, cache_dir, params=None):
         # Параметры по умолчанию для UI и логики
         default_params = {
@@ -30,9 +39,11 @@ class FilterMapTracker(FilterAsyncBase):
         self.name = "Map Tracker"
 
         # Данные в памяти
-        self._abs_path = np.array([], dtype=np.float32)  # Накопленный путь [x, y, angle]
+        self._path_buf = RowBuffer(3, fill=np.nan)  # Непосчитанные кадры — NaN
+        self._abs_path = self._path_buf.view()  # Накопленный путь [x, y, angle]
         self._marks = []  # Кадры смены сцен
-        self._map_cloud = []  # точки с возрастом
+        self._cloud_buf = RowBuffer(3)  # Точки карты [x, z, age]; воркер присылает изменения по индексам
+        self._map_cloud = self._cloud_buf.view()
 
         self.load_data()
 
@@ -47,32 +58,41 @@ class FilterMapTracker(FilterAsyncBase):
             "min_features": {"type": "int", "min": 10, "max": 500, "default": 50},
         }
 
-    def get_npy_filename(self):
-        return os.path.join(self.cache_dir, f"{self.get_id()}.npy")
+    def reset_data(self):
+        super().reset_data()
+        self._path_buf = RowBuffer(3, fill=np.nan)
+        self._abs_path = self._path_buf.view()
+        self._cloud_buf = RowBuffer(3)
+        self._map_cloud = self._cloud_buf.view()
 
-    def save_data(self):
-        if not self.cache_dir: return
-        os.makedirs(self.cache_dir, exist_ok=True)
+    def get_save_payload(self):
+        if not self.cache_dir: return None
 
-        payload = {
+        return {
             "version": DATA_VERSION,
-            "ranges": self._analyzed_ranges,
-            "marks": self._detected_scenes,
-            "map_cloud": self._map_cloud,
-            "abs_path": self._abs_path
+            "ranges": list(self._analyzed_ranges),
+            "marks": list(self._detected_scenes),
+            "map_cloud": self._map_cloud.copy(),
+            "abs_path": self._abs_path.copy(),
+            "checkpoints": dict(self._checkpoints)
         }
-        np.save(self.get_npy_filename(), payload)
+
+    def write_payload(self, payload, path):
+        self.write_npy_atomic(path, payload)
 
     def load_data(self):
-        path = self.get_npy_filename()
+        path = self.get_data_filepath()
         if os.path.exists(path):
             try:
                 payload = np.load(path, allow_pickle=True).item()
                 if payload.get("version") == DATA_VERSION:
                     self._analyzed_ranges = payload.get("ranges", [])
                     self._detected_scenes = payload.get("marks", [])
-                    self._abs_path = payload.get("abs_path", np.array([]))
-                    self._map_cloud = payload.get("map_cloud", np.array([]))
+                    self._path_buf = RowBuffer(3, fill=np.nan, data=payload.get("abs_path"))
+                    self._abs_path = self._path_buf.view()
+                    self._cloud_buf = RowBuffer(3, data=payload.get("map_cloud"))
+                    self._map_cloud = self._cloud_buf.view()
+                    self._checkpoints = payload.get("checkpoints", {})
             except Exception as e:
                 print(f"Error loading {self.name} cache: {e}")
 
@@ -83,6 +103,8 @@ class FilterMapTracker(FilterAsyncBase):
     def render_overlay(self, painter, idx, viewport_rect):
         if not self.get_param("show_map") or len(self._abs_path) <= idx:
             return
+        if not np.isfinite(self._abs_path[idx][0]):
+            return  # Кадр еще не проанализирован
 
         # 1. Размеры и позиция карты
         vw, vh = viewport_rect.width(), viewport_rect.height()
@@ -100,7 +122,8 @@ class FilterMapTracker(FilterAsyncBase):
         painter.drawRoundedRect(map_rect, 5, 5)
 
         # 2. Объединяем данные для расчета масштаба
-        path_data = self._abs_path[:, :2]  # [N, 2]
+        known_path = self._abs_path[np.isfinite(self._abs_path[:, 0])]
+        path_data = known_path[:, :2]  # [N, 2]
         cloud_data = self._map_cloud[:, :2] if len(self._map_cloud) > 0 else path_data
 
         # Вычисляем общие границы (путь + облако)
@@ -136,8 +159,8 @@ class FilterMapTracker(FilterAsyncBase):
                 painter.drawRect(QRectF(px - 2, py - 2, 4, 4))
 
         # 4. Рисуем траекторию (упрощенно)
-        step = max(1, len(self._abs_path) // 600)
-        path_to_draw = self._abs_path[::step]
+        step = max(1, len(known_path) // 600)
+        path_to_draw = known_path[::step]
 
         path_pen = QPen(QColor(0, 255, 100, 180), 1.5)
         painter.setPen(path_pen)
@@ -187,44 +210,98 @@ class FilterMapTracker(FilterAsyncBase):
                 "min_features" : self.get_param("min_features"),
             }
 
-        model = CameraTrackerSlamModel(w, h, params)
-
-        for frame_idx in range(total_frames):
-            if not worker.is_running: break
-            ret, frame = cap.read()
-            if not ret: break
-
-            # Скармливаем кадр модели
-            model.process_frame(frame, frame_idx)
-
-            if frame_idx % 100 == 0:
-                results = model.get_results()
-                results.update({
-                    "progress": int(100 * frame_idx / total_frames)
-                })
+        # Считаем только непокрытые участки, продолжая с ближайшего чекпоинта
+        ranges = list(self._analyzed_ranges)
+        marks = set(self._detected_scenes)
+        checkpoints = dict(self._checkpoints)
+        cloud_size = len(self._map_cloud)  # Точки модели участка дописываются после уже сохраненных
+        missing = self.get_missing_ranges(*self.get_analysis_range(total_frames), ranges)
+        todo = max(1, sum(e - s + 1 for s, e in missing))
+        done = 0
+        stats = AnalysisStats(todo)
+
+        def make_message(model, cloud_base, sent):
+            # Путь — только новые позы, облако — только новые и уточненные точки
+            results = model.get_results(path_since=sent)
+            results["path_start"] = max(sent, model.pose_base)
+            results["map_idx"] += cloud_base
+            model.trim_poses(model.last_frame_idx + 1)
+            results.update({
+                "marks": sorted(marks | set(model.marks)),
+                "ranges": self.merge_ranges(ranges + results["ranges"]),
+                "progress": int(100 * done / todo),
+                "timing": stats.as_dict()
+            })
+            return results
+
+        for seg_start, seg_end in missing:
+            if not worker.is_running:
+                break
+
+            c_idx, state = self.find_checkpoint(seg_start - 1, checkpoints, ranges)
+            model = CameraTrackerSlamModel(w, h, params)
+            read_from = seg_start if state is None else c_idx
+            cloud_base = cloud_size
+            sent = read_from  # С какого кадра путь еще не отправлен в UI
+            results = None
+
+            for frame_idx, frame in self.read_frames(worker, cap, read_from, seg_end, stats):
+                if state is not None and frame_idx == c_idx:
+                    # Кадр чекпоинта: только восстанавливаем состояние модели
+                    model.set_state(state, frame)
+                    sent = c_idx + 1
+                    stats.lap("preprocess")
+                    continue
+
+                # Скармливаем кадр модели
+                model.process_frame(frame, frame_idx)
+                stats.lap("core")
+                if frame_idx >= seg_start:
+                    done += 1
+                    stats.frame_done()
+
+                if frame_idx % 100 == 0:
+                    results = make_message(model, cloud_base, sent)
+                    sent = frame_idx + 1
+                    if frame_idx % self.CHECKPOINT_STEP == 0:
+                        checkpoints[frame_idx] = model.get_state()
+                        results["checkpoint"] = (frame_idx, checkpoints[frame_idx])
+                    worker.progress.emit(results)
+                    stats.lap("emit")
+
+            if model.poses:
+                # Чекпоинт на последнем кадре: отсюда продолжим после остановки
+                results = make_message(model, cloud_base, sent)
+                checkpoints[model.last_frame_idx] = model.get_state()
+                results["checkpoint"] = (model.last_frame_idx, checkpoints[model.last_frame_idx])
                 worker.progress.emit(results)
 
+                ranges = results["ranges"]
+                marks = set(results["marks"])
+            cloud_size = cloud_base + len(model.map_points_3d)
+
         cap.release()
-        results = model.get_results()
-        results.update({"progress": 100})
-        worker.progress.emit(results)
+        worker.progress.emit({
+            "ranges": ranges,
+            "progress": 100 if done >= todo else int(100 * done / todo),
+            "timing": stats.as_dict()
+        })
 
     def _on_worker_progress(self, data):
         """Принимаем пакеты данных и обновляем путь"""
-        if "abs_path" in data:
-            self._abs_path = data["abs_path"]
-
-        if "map_cloud" in data:
-            self._map_cloud = data["map_cloud"]
-            print(f"3d point count: {len(self._map_cloud)}")
-            print(data["stats"])
-
-        if "ranges" in data: self._analyzed_ranges = data["ranges"]
-        if "marks" in data: self._detected_scenes = data["marks"]
-        self.save_data()
-
-        if "progress" in data:
-            self.progress = data["progress"]
-
-
+        super()._on_worker_progress(data)
 
+        if "abs_path" in data:
+            # Новые позы кладем на их место; непосчитанные кадры — NaN
+            self._path_buf.place(data.get("path_start", 0), data["abs_path"])
+            self._abs_path = self._path_buf.view()
+
+        if "map_idx" in data:
+            # Новые и уточненные точки карты — на их места
+            self._cloud_buf.put(data["map_idx"], data["map_cloud"])
+            self._map_cloud = self._cloud_buf.view()
+            if "checkpoint" in data:
+                print(f"3d point count: {len(self._map_cloud)}")
+                print(data["stats"])
+
+        self.request_save()
@@ -1,144 +1,262 @@
 import cv2
 import os
-import json
+import time
 import numpy as np
 import torch
-from ultralytics import YOLO
 
 from .f_asinc_base import FilterAsyncBase
+from .m_analysis_stats import AnalysisStats
+from .m_batch_sizer import AdaptiveBatch
+from .m_det_storage import DetectionStorage, pack_detections
+from .m_live_infer import LatestFrameInference
+from .m_box_flow import BoxPropagator
+from .m_infer_backend import load_yolo, infer_device
+from .m_model_pool import ModelPool
 from .f_base import FilterBase
 
-CASH_TO_FILE = False # сохраняем ли кеш на диск
 USE_SEGMENTATION = True # Переключатель режима
 
 class FilterObjectDetector(FilterAsyncBase):
+    """
+    Детекция объектов YOLO. Анализ пишет все детекции (с запасом по уверенности)
+    в колоночное хранилище; при просмотре и экспорте кадры из хранилища
+    рисуются без нейросети, а порог conf применяется при отрисовке.
+    """
+    CACHE_EXT = "det"  # Папка DetectionStorage
+    ANALYSIS_PARAMS = ("model", "backend")
+    # MODEL_NAME = 'yolov8n-seg.pt' if USE_SEGMENTATION else 'yolov8n.pt'
+    MODEL_NAME = 'yolo11s-seg.pt' if USE_SEGMENTATION else 'yolo11s.pt'
+    STORE_CONF = 0.1  # Порог при анализе — минимум параметра conf
+    CHUNK_MAX_WORKERS = 4  # Каждый процесс пула держит свою копию модели — память растет с их числом
+
     def __init__(self, num, cache_dir, params=None):
         # Настройки по умолчанию
         if not params:
             params = {
                 "conf": 0.25,
                 "show_labels": True,
-                "use_cache": False,
                 "mask_opacity": 0.3  # Добавим прозрачность для заливки
             }
         super().__init__(num, cache_dir, params)
         self.name = "AI Object Detector"
 
-        # Модель загрузим только при необходимости (lazy loading)
-        self._model = None
+        # Модель общая для всех экземпляров (ModelPool), загружается при первом обращении
+        # или заранее в фоне (warm_up); замок инференса тоже общий
+        self._model_key = (os.path.join(os.getcwd(), 'models', self.MODEL_NAME), infer_device())
+        self._model_lock = ModelPool.get_instance().acquire(self._model_key, self._load_model)
+        self.set_model_params(self._model_key)
+        self._released = False
+
+        # Инференс предпросмотра в фоновом потоке (ключ — кадр и conf)
+        self._live = LatestFrameInference(lambda key, frame: self._detect(frame, key[1]), "object-preview")
 
-        # Кеш в оперативной памяти для текущей сессии
-        self._memory_cache = {}
+        # Экспорт с детектором через кадр: между запусками объекты ведет оптический поток
+        self._flow = BoxPropagator()
+        self._flow_idx = None  # Последний кадр, прошедший через _flow
+        self._flow_conf = None
+        self._since_detect = 0
 
-        # Пытаемся загрузить кеш с диска при инициализации
-        if CASH_TO_FILE:
-            self.load_cache()
+        self._store = None  # DetectionStorage текущего кеша
+        self._det_ranges = []  # Проанализированные кадры (_analyzed_ranges — кадры с объектами)
+        self._pending = []  # Результаты из воркера, еще не записанные в хранилище
+
+        self.load_data()
 
     def get_params_metadata(self):
         return {
             "act_in": {"type": "in_out", "default": -1},  # Наш триггер для UI
             "conf": {"type": "float", "min": 0.1, "max": 1.0, "default": 0.25},
             "show_labels": {"type": "bool", "default": True},
-            # "use_cache": {"type": "bool", "default": True},
             "show_contour": {"type": "bool", "default": True},  # Новый флаг
-            "mask_opacity": {"type": "float", "min": 0.0, "max": 1.0, "default": 0.3}
+            "mask_opacity": {"type": "float", "min": 0.0, "max": 1.0, "default": 0.3},
+            # Экспорт: детектор на каждом K-м кадре, между ними рамки ведет оптический поток
+            "detect_every": {"type": "int", "min": 1, "max": 30, "default": 1},
+            # Доля потерянных потоком объектов, после которой детектор запускается раньше
+            "drift_limit": {"type": "float", "min": 0.0, "max": 1.0, "default": 0.3},
+            # Кадров в одном вызове нейросети при анализе (0 — подбирается по замерам)
+            "batch_size": {"type": "int", "min": 0, "max": 64, "default": 0}
         }
 
     def _get_model(self):
-        """Ленивая инициализация модели YOLO"""
-        if self._model is None:
-            # Выбираем файл модели в зависимости от константы
-            # model_name = 'yolov8n-seg.pt' if USE_SEGMENTATION else 'yolov8n.pt'
-            model_name = 'yolo11s-seg.pt' if USE_SEGMENTATION else 'yolo11s.pt'
-            model_path = os.path.join(os.getcwd(), 'models', model_name)
-            self._model = YOLO(model_path)
-
-            # Получаем словарь всех классов
-            classes = self._model.names
-            print(f"AI Detector loaded. Known objects: {len(classes)}")
-            # print(classes) # Раскомментируйте, чтобы увидеть весь список {ID: 'Name'}
-
-            if torch.cuda.is_available():
-                self._model.to('cuda')
-                print(f"AI Detector: Using GPU (CUDA) with {'Segmentation' if USE_SEGMENTATION else 'BBox'}")
-        return self._model
-
-    def get_cache_path(self):
-        """Путь к JSON файлу с детекциями"""
-        return os.path.join(self.cache_dir, f"{self.get_id()}.json")
-
-    def load_cache(self):
-        path = self.get_cache_path()
-        if os.path.exists(path):
-            try:
-                with open(path, 'r') as f:
-                    # Ключи в JSON всегда строки, преобразуем обратно в int (номер кадра)
-                    raw_data = json.load(f)
-                    self._memory_cache = {int(k): v for k, v in raw_data.items()}
-            except Exception as e:
-                print(f"Error loading AI cache: {e}")
-
-    def save_cache(self):
-        path = self.get_cache_path()
-        os.makedirs(self.cache_dir, exist_ok=True)
-        try:
-            with open(path, 'w') as f:
-                json.dump(self._memory_cache, f)
-        except Exception as e:
-            print(f"Error saving AI cache: {e}")
+        """Модель YOLO из общего пула (загрузка при первом обращении)"""
+        return ModelPool.get_instance().get(self._model_key)
+
+    def _load_model(self):
+        model, backend = load_yolo(*self._model_key, self.video_path)
+
+        # Получаем словарь всех классов
+        classes = model.names
+        print(f"AI Detector loaded ({backend}). Known objects: {len(classes)}")
+        # print(classes) # Раскомментируйте, чтобы увидеть весь список {ID: 'Name'}
+
+        if backend == "torch" and torch.cuda.is_available():
+            model.to('cuda')
+            print(f"AI Detector: Using GPU (CUDA) with {'Segmentation' if USE_SEGMENTATION else 'BBox'}")
+        return model
+
+    def warm_up(self):
+        ModelPool.get_instance().warm_up(self._model_key)
+
+    def release(self):
+        super().release()
+        self._live.stop()
+        if not self._released:
+            self._released = True
+            ModelPool.get_instance().release(self._model_key)
+
+    # --- ХРАНИЛИЩЕ ДЕТЕКЦИЙ ---
+
+    def reset_data(self):
+        super().reset_data()
+        self._store = None
+        self._det_ranges = []
+        self._pending = []
+
+    def get_store(self):
+        """DetectionStorage текущего кеша (читают и другие фильтры) или None"""
+        return self._store
+
+    def load_data(self):
+        self._store = DetectionStorage(self.get_data_filepath())
+        self._det_ranges = self._store.analyzed_ranges()
+        self._update_presence()
+
+    def _update_presence(self):
+        """Кадры с объектами при текущем conf (для таймлайна)"""
+        if self._store is not None:
+            self._analyzed_ranges = self._quick_merge(self._store.presence(self.get_param("conf")).tolist())
+
+    def set_param(self, key, value):
+        super().set_param(key, value)
+        if key == "conf":
+            self.flush_save()
+            self._update_presence()
+
+    def get_save_payload(self):
+        if not self._pending:
+            return None
+        payload, self._pending = self._pending, []
+        return payload
+
+    def write_payload(self, payload, path):
+        store = self._store if self._store is not None and self._store.path == path else DetectionStorage(path)
+        for item in payload:
+            store.write_range(*item["range"], item, item.get("names"))
+
+    def get_stored_detections(self, idx):
+        """Детекции кадра из хранилища для отрисовки; None — кадр не анализировался"""
+        stored = self._store.get(idx) if self._store is not None else None
+        if stored is None:
+            return None
+
+        conf = self.get_param("conf")
+        names = self._store.names
+        detections = []
+        for i, score in enumerate(stored["scores"]):
+            if score < conf:
+                continue
+            obj = {
+                "bbox": stored["boxes"][i].tolist(),
+                "name": names.get(int(stored["classes"][i]), str(stored["classes"][i]))
+            }
+            if len(stored["polys"][i]):
+                obj["poly"] = stored["polys"][i]
+            detections.append(obj)
+        return detections
 
     def process(self, frame, idx):
         # if not self.focused:
         #     return frame
 
-        detections = None
-        use_cache = self.get_param("use_cache")
+        detections = self.get_stored_detections(idx)
+
+        if detections is None:
+            conf = self.get_param("conf")
+            if self.is_exporting:
+                # Экспорт: точный результат для каждого кадра (или перенос потоком)
+                detections = self._detect_tracked(frame, idx, conf)
+                if detections:
+                    self._update_ranges(idx)
+            else:
+                # Предпросмотр: нейросеть в фоне, рисуем последний готовый результат
+                latest = self._live.request((idx, conf), frame)
+                if latest is not None:
+                    (res_idx, _), detections = latest
+                    if detections and res_idx == idx:
+                        self._update_ranges(idx)
+
+        # 3. Отрисовка
+        if detections:
+            self._draw_detections(frame, detections)
+
+        return frame
 
-        if use_cache and idx in self._memory_cache:
-            detections = self._memory_cache[idx]
-        else:
+    def _detect_tracked(self, frame, idx, conf):
+        """
+        Детектор на каждом detect_every-м кадре; между запусками объекты переносятся потоком.
+        Раньше срока детектор запускается на разрыве последовательности, смене сцены
+        и когда поток потерял больше drift_limit объектов.
+        """
+        every = self.get_param("detect_every")
+        if every <= 1:
+            return self._detect(frame, conf)
+
+        gray = self._flow.prepare(frame)
+        detections = None
+        if self._flow_idx == idx - 1 and self._flow_conf == conf and self._since_detect < every:
+            moved, drift = self._flow.propagate(gray)
+            if drift <= self.get_param("drift_limit"):
+                detections = moved
+                self._since_detect += 1
+
+        if detections is None:
+            detections = self._detect(frame, conf)
+            self._flow.anchor(gray, detections)
+            self._flow_conf = conf
+            self._since_detect = 1
+
+        self._flow_idx = idx
+        return detections
+
+    def _detect(self, frame, conf):
+        """Инференс одного кадра: список объектов для отрисовки"""
+        with self._model_lock:
             model = self._get_model()
+            if model is None:
+                return []  # Модель не загрузилась — кадр без детекций
             device = 'cuda' if torch.cuda.is_available() else 'cpu'
 
             results = model.predict(
                 frame,
                 device=device,
-                conf=self.get_param("conf"),
+                conf=conf,
                 half=(device == 'cuda'),
                 # imgsz=320,
                 max_det=20,
                 verbose=False
             )
 
-            if results and len(results[0]) > 0:
-                res = results[0].cpu()
-                detections = []
-
-                # Логика извлечения данных
-                if USE_SEGMENTATION and res.masks is not None:
-                    # Извлекаем контуры (полигоны)
-                    for i, mask in enumerate(res.masks.xy):
-                        detections.append({
-                            "poly": mask.tolist(),  # Список точек [[x,y], [x,y]...]
-                            "name": res.names[int(res.boxes.cls[i])],
-                            "bbox": res.boxes.xyxy[i].tolist()  # Ббокс все равно берем для текста
-                        })
-                else:
-                    # Старая логика с боксами
-                    for box in res.boxes:
-                        detections.append({
-                            "bbox": box.xyxy[0].tolist(),
-                            "name": res.names[int(box.cls[0])]
-                        })
-
-                if use_cache: self._add_to_cache(idx, detections)
-                self._update_ranges(idx)
-
-        # 3. Отрисовка
-        if detections:
-            self._draw_detections(frame, detections)
-
-        return frame
+        detections = []
+        if results and len(results[0]) > 0:
+            res = results[0].cpu()
+
+            # Логика извлечения данных
+            if USE_SEGMENTATION and res.masks is not None:
+                # Извлекаем контуры (полигоны)
+                for i, mask in enumerate(res.masks.xy):
+                    detections.append({
+                        "poly": mask.tolist(),  # Список точек [[x,y], [x,y]...]
+                        "name": res.names[int(res.boxes.cls[i])],
+                        "bbox": res.boxes.xyxy[i].tolist()  # Ббокс все равно берем для текста
+                    })
+            else:
+                # Старая логика с боксами
+                for box in res.boxes:
+                    detections.append({
+                        "bbox": box.xyxy[0].tolist(),
+                        "name": res.names[int(box.cls[0])]
+                    })
+        return detections
 
     def _draw_detections(self, frame, detections):
         overlay = frame.copy() if self.get_param("mask_opacity") > 0 else None
@@ -209,81 +327,147 @@ class FilterObjectDetector(FilterAsyncBase):
         self._analyzed_ranges = merged
 
 
-    def _add_to_cache(self, idx, detections):
-        # 1. Записываем сами данные
-
-        self._memory_cache[idx] = detections
-
-        # 3. Сохраняем (опционально)
-        if  CASH_TO_FILE and len(self._memory_cache) % 100 == 0:
-            self.save_cache()
-
-
-    def __del__(self):
-        # При удалении фильтра сохраняем накопленный кеш
-        if CASH_TO_FILE and self._memory_cache:
-            self.save_cache()
-
     def run_internal_logic(self, worker):
-        """Асинхронное сканирование видео нейросетью"""
+        """Асинхронное сканирование видео нейросетью (куски параллельно в пуле процессов)"""
         cap = cv2.VideoCapture(self.video_path)
         if not cap.isOpened():
             raise Exception("Could not open video file")
-
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
 
-        # 1. Подготовка модели (внутри потока)
-        model = self._get_model()
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        # Считаем только кадры, которых еще нет в хранилище
+        missing = self.get_missing_ranges(*self.get_analysis_range(total_frames), self._det_ranges)
+        todo = max(1, sum(e - s + 1 for s, e in missing))
 
+        # Интервалы с объектами из уже посчитанных кадров сохраняем
+        kept_ranges = list(self._analyzed_ranges)
         # Список всех кадров, где были найдены объекты (для финальной склейки)
         frames_with_objects = []
-        frame_idx = 0
-
-        while worker.is_running:
-            ret, curr_frame = cap.read()
-            if not ret:
-                break
+        done = 0
+        stats = AnalysisStats(todo)
+
+        def on_chunk_done(chunk, result):
+            nonlocal done
+            stats.mark()
+            stats.merge(result["timing"])
+            frames_with_objects.extend(result["hits"])
+
+            # На лету склеиваем текущие результаты для отображения на таймлайне
+            message = {
+                "ranges": self.merge_ranges(kept_ranges + self._quick_merge(sorted(frames_with_objects))),
+                "marks": [],  # Объектам метки обычно не нужны, только интервалы
+                "timing": stats.as_dict()
+            }
+            d_start, d_end = result["dets"]["range"]
+            if d_end >= d_start:
+                done += d_end - d_start + 1
+                message["dets"] = result["dets"]
+            message["progress"] = int(done / todo * 100)
+            worker.progress.emit(message)
+            stats.lap("emit")
 
-            # 2. Инференс на максималках
-            # imgsz=320 и half=True дают огромный прирост FPS на GPU
-            results = model.predict(
-                curr_frame,
-                device=device,
-                conf=self.get_param("conf"),
-                half=(device == 'cuda'),
-                imgsz=320,
-                verbose=False,
-                max_det=10  # Еще немного ускорим, ограничив кол-во объектов
-            )
+        self.run_chunks(worker, missing, on_chunk_done)
 
-            # 3. Если что-то нашли — записываем индекс кадра
-            if results and len(results[0]) > 0:
-                frames_with_objects.append(frame_idx)
+        # Финальная склейка и сохранение в основной класс
+        worker.progress.emit({
+            "progress": 100 if done >= todo else int(done / todo * 100),
+            "ranges": self.merge_ranges(kept_ranges + self._quick_merge(sorted(frames_with_objects))),
+            "marks": [],
+            "timing": stats.as_dict()
+        })
 
-            # 4. Отчет в UI каждые 50 кадров
-            if frame_idx % 50 == 0:
-                # На лету склеиваем текущие результаты для отображения на таймлайне
-                current_ranges = self._quick_merge(frames_with_objects)
+    def _on_worker_progress(self, data):
+        super()._on_worker_progress(data)
 
-                worker.progress.emit({
-                    "progress": int(frame_idx / max(1, total_frames - 1) * 100),
-                    "ranges": current_ranges,
-                    "marks": []  # Объектам метки обычно не нужны, только интервалы
-                })
+        if "dets" in data:
+            # Колонки кадров куска: в хранилище уходят фоновой записью
+            self._pending.append(data["dets"])
+            self._det_ranges = self.merge_ranges(self._det_ranges + [data["dets"]["range"]])
+            self.request_save()
 
-            frame_idx += 1
+    def use_chunk_pool(self):
+        # Одну видеокарту процессы не поделят — на CUDA сканируем в одном потоке
+        return not torch.cuda.is_available()
 
-        # Финальная склейка и сохранение в основной класс
-        final_ranges = self._quick_merge(frames_with_objects)
+    def scan_chunk(self, worker, cap, start, end):
+        """Детекции куска [start, end] в колонках хранилища и кадры с объектами при текущем conf"""
+        # 1. Подготовка модели (внутри потока)
+        model = self._get_model()
+        if model is None:
+            raise Exception("Object detection model is not available")
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        sizer = AdaptiveBatch(self.get_param("batch_size"))
+
+        found = []  # [(кадр, боксы, уверенности, классы, контуры)]
+        last = start - 1
+        stats = AnalysisStats()
+        indices, frames = [], []
+
+        # 2. Кадры декодируются в соседнем потоке, пока нейросеть считает пачку
+        for frame_idx, curr_frame in self.prefetch_frames(worker, cap, start, end, stats):
+            indices.append(frame_idx)
+            frames.append(curr_frame)
+            if len(frames) >= sizer.size:
+                found.extend(self._predict_batch(model, device, indices, frames, sizer, stats))
+                last = indices[-1]
+                indices, frames = [], []
+
+        if frames and worker.is_running:
+            found.extend(self._predict_batch(model, device, indices, frames, sizer, stats))
+            last = indices[-1]
+
+        conf = self.get_param("conf")
+        dets = pack_detections(found)
+        dets["range"] = [start, last]
+        dets["names"] = dict(model.names)
 
-        worker.progress.emit({
-            "progress": 100,
-            "ranges": final_ranges,
-            "marks": []
-        })
+        return {
+            "hits": [f[0] for f in found if f[2].max() >= conf],
+            "dets": dets,
+            "timing": stats.as_dict()
+        }
 
-        cap.release()
+    def _predict_batch(self, model, device, indices, frames, sizer, stats):
+        """Один вызов predict на пачку; детекции возвращаются по индексам своих кадров"""
+        found = []
+        pos = 0
+        while pos < len(frames):
+            n = min(sizer.size, len(frames) - pos)
+            t_start = time.perf_counter()
+            try:
+                # imgsz=320 и half=True дают огромный прирост FPS на GPU
+                results = model.predict(
+                    frames[pos:pos + n],
+                    device=device,
+                    conf=self.STORE_CONF,
+                    half=(device == 'cuda'),
+                    imgsz=320,
+                    verbose=False,
+                    max_det=20
+                )
+            except (torch.cuda.OutOfMemoryError, MemoryError):
+                if n == 1:
+                    raise
+                if device == 'cuda':
+                    torch.cuda.empty_cache()
+                sizer.out_of_memory()
+                print(f"{self.name}: out of memory, batch size -> {sizer.size}")
+                continue
+            sizer.report(n, time.perf_counter() - t_start)
+
+            # 3. Результаты идут в порядке кадров пачки
+            for idx, res in zip(indices[pos:pos + n], results):
+                if len(res) == 0:
+                    continue
+                res = res.cpu()
+                polys = res.masks.xy if USE_SEGMENTATION and res.masks is not None else None
+                found.append((idx, res.boxes.xyxy.numpy(), res.boxes.conf.numpy(),
+                              res.boxes.cls.numpy(), polys))
+            pos += n
+
+        stats.lap("core")
+        stats.frame_done(len(frames))
+        return found
 
     def _quick_merge(self, frame_indices):
         """Вспомогательная быстрая склейка индексов в интервалы [start, end]"""
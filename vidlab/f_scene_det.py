@@ -1,9 +1,35 @@
-import json
 import os
 import cv2
+import numpy as np
 from .f_asinc_base import FilterAsyncBase
+from .m_row_buffer import RowBuffer
+from .m_analysis_stats import AnalysisStats
+from .m_packet_scan import read_packets, find_candidates, candidate_windows
+
+DATA_VERSION = 1  # При изменении логики инкрементируем
 
 class FilterSceneDetector(FilterAsyncBase):
+    """
+    Склейки по кривой разницы соседних кадров.
+    Анализ сохраняет саму кривую (float32 на кадр), а метки считаются из нее
+    по threshold и min_scene_len — смена порогов не требует повторного декодирования.
+
+    Быстрый режим (fast_step > 0): сравниваются кадры через fast_step, а интервалы
+    с разницей выше порога делятся пополам перемотками до точного кадра склейки.
+    Кривая тогда известна только в найденных склейках.
+
+    Предварительный проход (prescan, нужен PyAV): кандидаты берутся из размеров пакетов
+    и внеочередных ключевых кадров, а декодируются только окна вокруг них.
+    Проанализированными считаются только окна; остальные кадры участка помечаются
+    как просмотренные предварительным проходом, и полный проход (prescan выключен)
+    досчитывает их кривую в тот же кеш.
+    """
+    CACHE_EXT = "npy"
+    ANALYSIS_PARAMS = ("fast_step",)  # Полная кривая не зависит от порогов, окна prescan — ее точные куски
+    MARK_PARAMS = ("threshold", "min_scene_len")
+    FAST_SEEK_STEP = 48  # С такого шага выборки перемотка дешевле, чем grab() подряд
+    PRESCAN_RADIUS = 12  # Окно проверки вокруг кандидата (кадров в каждую сторону)
+
     def __init__(self, num, cache_dir, params=None):
         if not params:
             params = {
@@ -12,49 +38,106 @@ class FilterSceneDetector(FilterAsyncBase):
         super().__init__(num, cache_dir, params)
         self.name = "Scene Detector"
 
+        # Разница с предыдущим кадром; NaN — кадр не посчитан (или первый кадр видео)
+        self._score_buf = RowBuffer(1, fill=np.nan)
+        self._prescanned_ranges = []  # Участки, где prescan не нашел кандидатов (кривая не считалась)
+
         # обязательно, в базовом классе не вызывается
         self.load_data()
 
-    def save_data(self):
-        """Сохраняет результаты анализа в файл кеша"""
+    def reset_data(self):
+        super().reset_data()
+        self._score_buf = RowBuffer(1, fill=np.nan)
+        self._prescanned_ranges = []
+
+    def get_scores(self):
+        return self._score_buf.view()[:, 0]
+
+    def get_save_payload(self):
+        """Результаты анализа для файла кеша"""
         if not self.cache_dir:
             print(f"Warning: cache_dir not set for {self.name}")
-            return
-
-            # 2. Создаем папку, если её еще не существует
-        try:
-            os.makedirs(self.cache_dir, exist_ok=True)
-        except Exception as e:
-            print(f"Error creating cache directory {self.cache_dir}: {e}")
-            return
-
-        data = {
-            "ranges": self._analyzed_ranges,
-            "marks": self._detected_scenes
+            return None
+
+        return {
+            "version": DATA_VERSION,
+            "ranges": list(self._analyzed_ranges),
+            "prescanned": list(self._prescanned_ranges),
+            "scores": self.get_scores().copy()
         }
-        try:
-            with open(self.get_data_filepath(), 'w') as f:
-                json.dump(data, f)
-        except Exception as e:
-            print(f"Error saving cache for {self.name}: {e}")
+
+    def write_payload(self, payload, path):
+        self.write_npy_atomic(path, payload)
 
     def load_data(self):
         """Загружает результаты анализа из файла кеша"""
         path = self.get_data_filepath()
         if os.path.exists(path):
             try:
-                with open(path, 'r') as f:
-                    data = json.load(f)
-                    self._analyzed_ranges = data.get("ranges", [])
-                    self._detected_scenes = data.get("marks", [])
+                payload = np.load(path, allow_pickle=True).item()
+                if payload.get("version") == DATA_VERSION:
+                    self._analyzed_ranges = payload.get("ranges", [])
+                    self._prescanned_ranges = payload.get("prescanned", [])
+                    self._score_buf = RowBuffer(1, fill=np.nan, data=payload.get("scores"))
+                else:
+                    print(f"{self.name}: Old cache version, ignoring.")
             except Exception as e:
                 print(f"Error loading cache for {self.name}: {e}")
 
+        self.update_marks()
+
+    def get_analysis_params(self):
+        if self.get_param("fast_step"):
+            # Быстрый режим ищет интервалы по порогу: ниже него склейки не найдены
+            return self.ANALYSIS_PARAMS + ("threshold",)
+        return self.ANALYSIS_PARAMS
+
+    def set_param(self, key, value):
+        super().set_param(key, value)
+        if key in self.MARK_PARAMS:
+            self.update_marks()
+
+    # --- МЕТКИ ИЗ КРИВОЙ ---
+
+    @staticmethod
+    def find_cuts(scores, threshold, min_len):
+        """
+        Кадры, где разница выше порога и с предыдущей метки прошло не меньше min_len кадров.
+        Порог — одной векторной операцией; проход по длине прыгает по кандидатам через searchsorted.
+        """
+        with np.errstate(invalid='ignore'):
+            candidates = np.flatnonzero(scores > threshold)  # NaN не проходит
+        if len(candidates) == 0 or min_len <= 1:
+            return candidates.tolist()
+
+        marks = []
+        i = 0
+        while i < len(candidates):
+            m = int(candidates[i])
+            marks.append(m)
+            i = int(np.searchsorted(candidates, m + min_len, side='left'))
+        return marks
+
+    def update_marks(self):
+        self._detected_scenes = self.find_cuts(
+            self.get_scores(), self.get_param("threshold"), self.get_param("min_scene_len"))
+
+    def get_timeline_data(self):
+        data = super().get_timeline_data()
+        # Кривая для подбора порога: шкала — диапазон параметра threshold
+        data["curve"] = self.get_scores()
+        data["curve_level"] = self.get_param("threshold")
+        data["curve_max"] = self.get_metadata()["threshold"]["max"]
+        return data
 
     def get_params_metadata(self):
         return {
             "threshold": {"type": "int", "min": 1, "max": 100, "default": 30},
-            "min_scene_len": {"type": "int", "min": 0, "max": 100, "default": 10}  # Длина в кадрах
+            "min_scene_len": {"type": "int", "min": 0, "max": 100, "default": 10},  # Длина в кадрах
+            # Шаг выборки быстрого режима (0 — каждый кадр). В интервале шага находится одна склейка
+            "fast_step": {"type": "int", "min": 0, "max": 250, "default": 0},
+            # Кандидаты по пакетам контейнера без декодирования (PyAV)
+            "prescan": {"type": "bool", "default": False}
         }
 
 
@@ -63,87 +146,224 @@ class FilterSceneDetector(FilterAsyncBase):
         return frame
 
     def run_internal_logic(self, worker):
-        """Реальная работа с OpenCV"""
+        """
+        Считаем только еще не проанализированные участки.
+        Куски независимы (нужен лишь предыдущий кадр), поэтому идут параллельно в пуле процессов.
+        """
         cap = cv2.VideoCapture(self.video_path)
         if not cap.isOpened():
             raise Exception("Could not open video file")
-
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+
         if total_frames < 2:
             worker.is_running =  False
 
-        local_marks = []
-        frame_idx = 0
-        prev_gray = None  # Инициализируем пустотой
-
-        while worker.is_running:
-            ret, curr_frame = cap.read()
-            if not ret:
-                break
+        ranges = list(self._analyzed_ranges)
+        prescanned = list(self._prescanned_ranges)
+        prescan = self.get_param("prescan")
+        # Участки, уже просмотренные prescan, повторно идут только в полный проход
+        covered = self.merge_ranges(ranges + prescanned) if prescan else ranges
+        missing = self.get_missing_ranges(*self.get_analysis_range(total_frames), covered)
+        stats = AnalysisStats()
+
+        segments = missing
+        if prescan and missing:
+            windows = self._prescan_windows(missing, stats)
+            if windows is not None:
+                segments = windows
+
+        todo = max(1, sum(e - s + 1 for s, e in segments))
+        done = 0 if segments else todo  # Все уже посчитано или просмотрено prescan
+        stats.total_frames = todo
+
+        def on_chunk_done(chunk, result):
+            nonlocal done, ranges
+            stats.mark()
+            stats.merge(result["timing"])
+            if result["last"] >= chunk[0]:
+                done += result["last"] - chunk[0] + 1
+                ranges = self.merge_ranges(ranges + [[chunk[0], result["last"]]])
+
+            # В UI уходит только кривая этого куска
+            worker.progress.emit({
+                "progress": int(done / todo * 100),
+                "ranges": ranges,
+                "score_start": chunk[0],
+                "scores": result["scores"],
+                "timing": stats.as_dict()
+            })
+            stats.lap("emit")
+
+        self.run_chunks(worker, segments, on_chunk_done)
+
+        final = {"ranges": ranges, "timing": stats.as_dict()}
+        if segments is not missing and worker.is_running:
+            # Окна проверены — участки между ними склеек не содержат, но и кривой там нет
+            final["prescanned"] = self.merge_ranges(prescanned + missing)
+            done = todo
 
+        # финальное сохранение
+        final["progress"] = int(done / todo * 100)
+        worker.progress.emit(final)
+
+    def _prescan_windows(self, missing, stats):
+        """Окна проверки вокруг кандидатов из пакетов; None — проход недоступен"""
+        stats.mark()
+        packets = read_packets(self.video_path)
+        stats.lap("decode")
+        if packets is None:
+            return None
+
+        candidates = find_candidates(*packets)
+        windows = []
+        for seg_start, seg_end in missing:
+            windows.extend(candidate_windows(candidates, self.PRESCAN_RADIUS, seg_start, seg_end))
+        stats.lap("core")
+
+        print(f"{self.name}: prescan found {len(candidates)} candidates, "
+              f"{sum(e - s + 1 for s, e in windows)} frames to verify")
+        return windows
+
+    def scan_chunk(self, worker, cap, start, end):
+        """Разница с предыдущим кадром для кадров [start, end]"""
+        if self.get_param("fast_step"):
+            return self.scan_sparse(worker, cap, start, end)
+
+        scores = []
+        prev_gray = None
+        last = start - 1
+        stats = AnalysisStats()
+
+        # Для разницы нужен предыдущий кадр: куски перекрываются на один кадр
+        for frame_idx, curr_frame in self.read_frames(worker, cap, max(0, start - 1), end, stats):
             # 1. Подготовка текущего кадра
-            curr_gray = cv2.cvtColor(curr_frame, cv2.COLOR_BGR2GRAY)
-            curr_gray = cv2.resize(curr_gray, (256, 144))
-
-            # 2. Если это самый первый кадр — просто сохраняем его и идем дальше
-            if prev_gray is None:
-                prev_gray = curr_gray
-                frame_idx += 1
-                continue
-
-            # 3. Считаем разницу (начиная со второго кадра)
-            diff = cv2.absdiff(curr_gray, prev_gray)
-            score = cv2.mean(diff)[0]
-
-            # 4. Детекция склейки
-            thresh = self.get_param("threshold")
-            min_len = self.get_param("min_scene_len")
-
-            if score > thresh:
-                # ПРОВЕРКА: Прошло ли достаточно кадров с последней метки?
-                can_add = True
-                if local_marks:
-                    last_mark = local_marks[-1]
-                    if (frame_idx - last_mark) < min_len:
-                        can_add = False
-
-                if can_add:
-                    local_marks.append(frame_idx)
-
-
-
-            # Каждые 100 кадров шлем отчет в UI
-            if frame_idx % 100 == 0:
-                worker.progress.emit({
-                    "progress": int(frame_idx/(total_frames-1)*100),
-                    "ranges": [[0, frame_idx]],
-                    "marks": list(local_marks)
-                })
+            curr_gray = self._prepare(curr_frame)
+            stats.lap("preprocess")
+
+            # 2. Считаем разницу (самый первый кадр видео сравнивать не с чем)
+            if frame_idx >= start:
+                if prev_gray is not None:
+                    scores.append(self._diff(prev_gray, curr_gray))
+                else:
+                    scores.append(np.nan)
+                stats.frame_done()
+            stats.lap("core")
 
             prev_gray = curr_gray
-            frame_idx += 1
-
-        # финальное сохранение
-        worker.progress.emit({
-            "progress": int(frame_idx / (total_frames - 1) * 100),
-            "ranges": [[0, frame_idx]],
-            "marks": list(local_marks)
-        })
+            last = frame_idx
+
+        return {"scores": np.asarray(scores, dtype=np.float32), "last": last, "timing": stats.as_dict()}
+
+    @staticmethod
+    def _prepare(frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (256, 144))
+
+    @staticmethod
+    def _diff(a, b):
+        return cv2.mean(cv2.absdiff(a, b))[0]
+
+    def scan_sparse(self, worker, cap, start, end):
+        """
+        Быстрый режим для кадров [start, end]: грубый проход с шагом fast_step,
+        затем бисекция интервалов, где разница выше порога.
+        Кадры без склеек в кривой остаются NaN.
+        """
+        step = self.get_param("fast_step")
+        thresh = self.get_param("threshold")
+        scores = np.full(end - start + 1, np.nan, dtype=np.float32)
+        stats = AnalysisStats()
+        cache = {}  # {кадр: уменьшенный серый кадр} для бисекции текущего интервала
+
+        def read_at(idx):
+            stats.mark()
+            if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != idx:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, idx)
+            ret, frame = cap.read()
+            stats.lap("decode")
+            if not ret:
+                return None
+            gray = self._prepare(frame)
+            stats.lap("preprocess")
+            return gray
+
+        def read_next(idx):
+            """Следующий кадр выборки: короткий шаг — grab() без декодирования в BGR"""
+            pos = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
+            if pos <= idx < pos + self.FAST_SEEK_STEP:
+                stats.mark()
+                for _ in range(idx - pos):
+                    cap.grab()
+                stats.lap("decode")
+            return read_at(idx)
+
+        a = max(0, start - 1)
+        a_gray = read_next(a)
+        last = start - 1 if a_gray is None else a
+
+        # Первый кадр видео сравнивать не с чем
+        while a_gray is not None and a < end:
+            if not worker.is_running:
+                break
 
-        cap.release()
+            b = min(a + step, end)
+            b_gray = read_next(b)
+            if b_gray is None:
+                break
 
+            stats.mark()
+            if self._diff(a_gray, b_gray) > thresh:
+                cut, score = self._bisect(worker, a, a_gray, b, b_gray, thresh, cache, read_at, stats)
+                if cut is not None and cut >= start:
+                    scores[cut - start] = score
+                cache.clear()
+                cap.set(cv2.CAP_PROP_POS_FRAMES, b + 1)  # Дальше снова последовательно
+            stats.lap("core")
+
+            stats.frame_done(b - a)
+            last = b
+            a, a_gray = b, b_gray
+
+        return {"scores": scores[:max(0, last - start + 1)], "last": last, "timing": stats.as_dict()}
+
+    def _bisect(self, worker, a, a_gray, b, b_gray, thresh, cache, read_at, stats):
+        """
+        Точный кадр склейки в (a, b]: на каждом шаге оставляем половину с большей разницей.
+        Плавный переход (обе половины ниже порога) — не склейка. Возвращает (кадр, разница).
+        """
+        while b - a > 1:
+            if not worker.is_running:
+                return None, None
+
+            m = (a + b) // 2
+            m_gray = cache.get(m)
+            if m_gray is None:
+                m_gray = read_at(m)
+                if m_gray is None:
+                    return None, None
+                cache[m] = m_gray
+                stats.mark()
+
+            left, right = self._diff(a_gray, m_gray), self._diff(m_gray, b_gray)
+            if max(left, right) <= thresh:
+                return None, None
+            if left >= right:
+                b, b_gray = m, m_gray
+            else:
+                a, a_gray = m, m_gray
+
+        return b, self._diff(a_gray, b_gray)
 
     def _on_worker_progress(self, data):
         """Обновление данных из потока (выполняется в UI-потоке)"""
-        # Мы используем наши новые сеттеры/геттеры
-        if "progress" in data:
-            self.progress = data["progress"]
-
-        if "ranges" in data:
-            self._analyzed_ranges = data["ranges"]
+        super()._on_worker_progress(data)
 
-        if "marks" in data:
-            self._detected_scenes = data["marks"]
+        if "scores" in data:
+            self._score_buf.place(data.get("score_start", 0), data["scores"])
+            self.update_marks()
 
-        self.save_data()
+        if "prescanned" in data:
+            self._prescanned_ranges = data["prescanned"]
 
+        self.request_save()
@@ -7,10 +7,16 @@ from PySide6.QtCore import Qt, QPointF, QRectF
 from vidlab.f_asinc_base import FilterAsyncBase
 from .m_slam_base import SlamBaseModel  # Или конкретная реализация потомка
 from .m_slam_cv2d import SlamCv2dModel
+from .m_row_buffer import RowBuffer
+from .m_analysis_stats import AnalysisStats
 
 DATA_VERSION = 5
 
 class FilterSlamTracker(FilterAsyncBase):
+    # Трекинг точек — циклы на Python по спискам словарей: считаем в отдельном процессе
+    USE_PROCESS = True
+    CACHE_EXT = "npy"
+
     def __init__(self, num, cache_dir, params=None):
         # Создаем временную модель, чтобы забрать метаданные параметров
         self.interactive_model = SlamCv2dModel(is_batch_mode=False)
@@ -19,7 +25,8 @@ class FilterSlamTracker(FilterAsyncBase):
         self.name = "SLAM Tracker"
 
         # Данные пути для карты
-        self._abs_path = np.array([], dtype=np.float32)
+        self._path_buf = RowBuffer(3, fill=np.nan)  # Непосчитанные кадры — NaN
+        self._abs_path = self._path_buf.view()
         self.load_data()
 
     def get_params_metadata(self):
@@ -44,30 +51,40 @@ class FilterSlamTracker(FilterAsyncBase):
         meta.update(self.interactive_model.get_params_metadata())
         return meta
 
-    def get_npy_filename(self):
-        return os.path.join(self.cache_dir, f"{self.get_id()}.npy")
+    def get_analysis_params(self):
+        # Пакетный просчет зависит от всех параметров модели
+        return tuple(self.interactive_model.get_params_metadata())
+
+    def reset_data(self):
+        super().reset_data()
+        self._path_buf = RowBuffer(3, fill=np.nan)
+        self._abs_path = self._path_buf.view()
 
-    def save_data(self):
-        if not self.cache_dir: return
-        os.makedirs(self.cache_dir, exist_ok=True)
+    def get_save_payload(self):
+        if not self.cache_dir: return None
 
-        payload = {
+        return {
             "version": DATA_VERSION,
-            "ranges": self._analyzed_ranges,
-            "marks": self._detected_scenes,
-            "abs_path": self._abs_path
+            "ranges": list(self._analyzed_ranges),
+            "marks": list(self._detected_scenes),
+            "abs_path": self._abs_path.copy(),
+            "checkpoints": dict(self._checkpoints)
         }
-        np.save(self.get_npy_filename(), payload)
+
+    def write_payload(self, payload, path):
+        self.write_npy_atomic(path, payload)
 
     def load_data(self):
-        path = self.get_npy_filename()
+        path = self.get_data_filepath()
         if os.path.exists(path):
             try:
                 payload = np.load(path, allow_pickle=True).item()
                 if payload.get("version") == DATA_VERSION:
                     self._analyzed_ranges = payload.get("ranges", [])
                     self._detected_scenes = payload.get("marks", [])
-                    self._abs_path = payload.get("abs_path", np.array([]))
+                    self._path_buf = RowBuffer(3, fill=np.nan, data=payload.get("abs_path"))
+                    self._abs_path = self._path_buf.view()
+                    self._checkpoints = payload.get("checkpoints", {})
             except Exception as e:
                 print(f"Error loading {self.name} cache: {e}")
 
@@ -75,7 +92,7 @@ class FilterSlamTracker(FilterAsyncBase):
 
     def process(self, frame, idx):
         # 1. Синхронизируем параметры и обновляем интерактивную модель
-        self.interactive_model.set_params(self.get_params())
+        self.interactive_model.set_params(self.get_snapshot(idx))
         self.interactive_model.update(frame, idx)
 
         if self.focused:
@@ -232,6 +249,8 @@ class FilterSlamTracker(FilterAsyncBase):
     def _draw_mini_map(self, painter, idx, viewport_rect):
         if not self.get_param("show_map") or len(self._abs_path) <= idx:
             return
+        if not np.isfinite(self._abs_path[idx][0]):
+            return  # Кадр еще не проанализирован
 
         # 1. Рассчитываем размеры и позицию виджета карты
         vw = viewport_rect.width()
@@ -256,6 +275,7 @@ class FilterSlamTracker(FilterAsyncBase):
         # 3. Подготовка данных пути
         step = max(1, len(self._abs_path) // 600)
         path_to_draw = path_to_draw[::step]
+        path_to_draw = path_to_draw[np.isfinite(path_to_draw[:, 0])]
 
         if len(path_to_draw) > 1:
             # Вычисляем границы для нормализации
@@ -464,37 +484,79 @@ class FilterSlamTracker(FilterAsyncBase):
 
         # Создаем пакетную модель
         batch_model = SlamCv2dModel(is_batch_mode=True)
-        batch_model.set_params(self.get_params())
-
-        for f_idx in range(total_frames):
-            if not worker.is_running: break
-            ret, frame = cap.read()
-            if not ret: break
-
-            batch_model.update(frame, f_idx)
-
-            if f_idx % 200 == 0:
+        batch_model.set_params(self.get_snapshot())
+
+        # Считаем только непокрытые участки, продолжая с ближайшего чекпоинта
+        ranges = list(self._analyzed_ranges)
+        checkpoints = dict(self._checkpoints)
+        missing = self.get_missing_ranges(*self.get_analysis_range(total_frames), ranges)
+        todo = max(1, sum(e - s + 1 for s, e in missing))
+        done = 0
+        stats = AnalysisStats(todo)
+
+        for seg_start, seg_end in missing:
+            if not worker.is_running:
+                break
+
+            c_idx, state = self.find_checkpoint(seg_start - 1, checkpoints, ranges)
+            batch_model.reset()
+            run_start = seg_start if state is None else c_idx + 1
+            read_from = seg_start if state is None else c_idx
+            f_idx = run_start - 1
+            sent = 0  # Сколько строк пути уже отправлено в UI
+
+            for f_idx, frame in self.read_frames(worker, cap, read_from, seg_end, stats):
+                if f_idx < run_start:
+                    # Кадр чекпоинта: только восстанавливаем состояние модели
+                    batch_model.set_state(state, frame)
+                    stats.lap("preprocess")
+                    continue
+
+                batch_model.update(frame, f_idx)
+                stats.lap("core")
+                if f_idx >= seg_start:
+                    done += 1
+                    stats.frame_done()
+
+                if f_idx % self.CHECKPOINT_STEP == 0:
+                    checkpoints[f_idx] = batch_model.get_state()
+                    worker.progress.emit({
+                        "path_start": run_start + sent,
+                        "abs_path": batch_model.get_path_rows(sent),
+                        "progress": int(100 * done / todo),
+                        "ranges": self.merge_ranges(ranges + [[run_start, f_idx]]),
+                        "checkpoint": (f_idx, checkpoints[f_idx]),
+                        "timing": stats.as_dict()
+                    })
+                    sent = len(batch_model.abs_path)
+                    stats.lap("emit")
+
+            if f_idx >= run_start:
+                # Чекпоинт на последнем кадре: отсюда продолжим после остановки
+                ranges = self.merge_ranges(ranges + [[run_start, f_idx]])
+                checkpoints[f_idx] = batch_model.get_state()
                 worker.progress.emit({
-                    "abs_path": batch_model.get_full_path(),
-                    "progress": int(100 * f_idx / total_frames),
-                    "ranges": [[0,f_idx]]
+                    "path_start": run_start + sent,
+                    "abs_path": batch_model.get_path_rows(sent),
+                    "progress": int(100 * done / todo),
+                    "ranges": ranges,
+                    "checkpoint": (f_idx, checkpoints[f_idx]),
+                    "timing": stats.as_dict()
                 })
 
         cap.release()
         worker.progress.emit({
-            "abs_path": batch_model.get_full_path(),
-            "ranges": [[0, f_idx]],
-            "progress": 100
+            "ranges": ranges,
+            "progress": 100 if done >= todo else int(100 * done / todo),
+            "timing": stats.as_dict()
         })
 
     def _on_worker_progress(self, data):
+        super()._on_worker_progress(data)
 
-        if "abs_path" in data: self._abs_path = data["abs_path"]
-
-        if "ranges" in data: self._analyzed_ranges = data["ranges"]
-
-        if "marks" in data: self._detected_scenes = data["marks"]
-
-        if "progress" in data: self.progress = data["progress"]
+        if "abs_path" in data:
+            # Новые строки пути кладем на их место; непосчитанные кадры — NaN
+            self._path_buf.place(data.get("path_start", 0), data["abs_path"])
+            self._abs_path = self._path_buf.view()
 
-        self.save_data()
\ No newline at end of file
+        self.request_save()
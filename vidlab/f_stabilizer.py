@@ -3,10 +3,15 @@ import os
 import cv2
 import numpy as np
 from .f_asinc_base import FilterAsyncBase
+from .m_row_buffer import RowBuffer
+from .m_analysis_stats import AnalysisStats
 
 DATA_VERSION = 2  # При изменении логики инкрементируем
 
 class FilterStabilizer(FilterAsyncBase):
+    CACHE_EXT = "npy"
+    ANALYSIS_PARAMS = ("min_features",)
+
     def __init__(self, num, cache_dir, params=None):
         if not params:
             params = {
@@ -15,7 +20,8 @@ class FilterStabilizer(FilterAsyncBase):
         self.name = "Stabilizer"
 
         # Внутреннее состояние
-        self._raw_transforms = np.array([])  # Сырые данные из сканера
+        self._raw_buf = RowBuffer(3)  # Сырые данные из сканера, строка на кадр
+        self._raw_transforms = self._raw_buf.view()
         self._stab_data = np.array([])  # Сглаженные данные для отрисовки
         self._max_offset = 0
         self._last_smooth_radius = -1  # Радиус, для которого считали последний раз
@@ -32,32 +38,39 @@ class FilterStabilizer(FilterAsyncBase):
 
         }
 
-    def get_npy_filename(self):
-        return os.path.join(self.cache_dir, f"{self.get_id()}.npy")
+    def reset_data(self):
+        super().reset_data()
+        self._raw_buf = RowBuffer(3)
+        self._raw_transforms = self._raw_buf.view()
+        self._stab_data = np.array([])
+        self._max_offset = 0
+        self._last_smooth_radius = -1
 
-    def save_data(self):
+    def get_save_payload(self):
         """Сохраняем всё в один NPY файл"""
-        if not self.cache_dir: return
-        os.makedirs(self.cache_dir, exist_ok=True)
+        if not self.cache_dir: return None
 
-        payload = {
+        return {
             "version": DATA_VERSION,
-            "ranges": self._analyzed_ranges,
-            "marks": self._detected_scenes,
-            "raw_transforms": self._raw_transforms,
+            "ranges": list(self._analyzed_ranges),
+            "marks": list(self._detected_scenes),
+            "raw_transforms": self._raw_transforms.copy(),
             "max_offset": self._max_offset
         }
-        np.save(self.get_npy_filename(), payload)
+
+    def write_payload(self, payload, path):
+        self.write_npy_atomic(path, payload)
 
     def load_data(self):
-        path = self.get_npy_filename()
+        path = self.get_data_filepath()
         if os.path.exists(path):
             try:
                 payload = np.load(path, allow_pickle=True).item()
                 if payload.get("version") == DATA_VERSION:
                     self._analyzed_ranges = payload.get("ranges", [])
                     self._detected_scenes = payload.get("marks", [])
-                    self._raw_transforms = payload.get("raw_transforms", np.array([]))
+                    self._raw_buf = RowBuffer(3, data=payload.get("raw_transforms"))
+                    self._raw_transforms = self._raw_buf.view()
                     self._max_offset = payload.get("max_offset", 0)
                 else:
                     print(f"{self.name}: Old cache version, ignoring.")
@@ -146,68 +159,100 @@ class FilterStabilizer(FilterAsyncBase):
         cap = cv2.VideoCapture(self.video_path)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
-        raw_transforms = []
-        prev_gray = None
-        frame_idx = 0
-        local_marks = []
+        # Считаем только еще не проанализированные участки
+        ranges = list(self._analyzed_ranges)
+        marks = set(self._detected_scenes)
+        missing = self.get_missing_ranges(*self.get_analysis_range(total_frames), ranges)
+        todo = max(1, sum(e - s + 1 for s, e in missing))
+        done = 0
+        stats = AnalysisStats(todo)
+
+        for seg_start, seg_end in missing:
+            if not worker.is_running:
+                break
+
+            raw_transforms = []  # Строки участка, начиная с seg_start
+            sent = 0  # Сколько строк уже отправлено в UI
+            prev_gray = None
+            frame_idx = seg_start - 1
+
+            # Смещение считается от предыдущего кадра: читаем с seg_start - 1
+            for frame_idx, frame in self.read_frames(worker, cap, max(0, seg_start - 1), seg_end, stats):
+                curr_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                stats.lap("preprocess")
+                if prev_gray is None:
+                    prev_gray = curr_gray
+                    if frame_idx < seg_start:
+                        continue
+                    raw_transforms.append([0, 0, 0])
+                    done += 1
+                    stats.lap("core")
+                    stats.frame_done()
+                    continue
+
+                p0 = cv2.goodFeaturesToTrack(prev_gray, maxCorners=200, qualityLevel=0.01, minDistance=30)
+
+                # Логика детекции смещения
+                current_trans = [0, 0, 0]
+                if p0 is not None and len(p0) > 0:
+                    p1, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, curr_gray, p0, None)
+                    if p1 is not None and status is not None:
+                        good = np.where(status == 1)[0]
+                        if len(good) < self.get_param("min_features"):
+                            marks.add(frame_idx)  # Смена сцены
+                        else:
+                            m, _ = cv2.estimateAffinePartial2D(p0[good], p1[good])
+                            if m is not None:
+                                current_trans = [m[0, 2], m[1, 2], np.arctan2(m[1, 0], m[0, 0])]
+
+                raw_transforms.append(current_trans)
+                done += 1
+                stats.lap("core")
+                stats.frame_done()
+
+                # Каждые 100 кадров отправляем в UI поток только новые строки
+                if frame_idx % 100 == 0:
+                    worker.progress.emit({
+                        "progress": int(done / todo * 100),
+                        "raw_start": seg_start + sent,
+                        "raw_transforms": raw_transforms[sent:],
+                        "marks": sorted(marks),
+                        "ranges": self.merge_ranges(ranges + [[seg_start, frame_idx]]),
+                        "timing": stats.as_dict()
+                    })
+                    sent = len(raw_transforms)
+                    stats.lap("emit")
 
-        while worker.is_running:
-            ret, frame = cap.read()
-            if not ret: break
-
-            curr_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            if prev_gray is None:
                 prev_gray = curr_gray
-                raw_transforms.append([0, 0, 0])
-                frame_idx += 1
-                continue
-
-            p0 = cv2.goodFeaturesToTrack(prev_gray, maxCorners=200, qualityLevel=0.01, minDistance=30)
-
-            # Логика детекции смещения
-            current_trans = [0, 0, 0]
-            if p0 is not None and len(p0) > 0:
-                p1, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, curr_gray, p0, None)
-                if p1 is not None and status is not None:
-                    good = np.where(status == 1)[0]
-                    if len(good) < self.get_param("min_features"):
-                        local_marks.append(frame_idx)  # Смена сцены
-                    else:
-                        m, _ = cv2.estimateAffinePartial2D(p0[good], p1[good])
-                        if m is not None:
-                            current_trans = [m[0, 2], m[1, 2], np.arctan2(m[1, 0], m[0, 0])]
-
-            raw_transforms.append(current_trans)
-
-            # Каждые 100 кадров сбрасываем сырые данные в UI поток
-            if frame_idx % 100 == 0:
+
+            if raw_transforms:
+                ranges = self.merge_ranges(ranges + [[seg_start, frame_idx]])
                 worker.progress.emit({
-                    "progress": int(frame_idx / total_frames * 100),
-                    "raw_transforms": list(raw_transforms),
-                    "marks": list(local_marks),
-                    "ranges": [[0, frame_idx]]
+                    "progress": int(done / todo * 100),
+                    "raw_start": seg_start + sent,
+                    "raw_transforms": raw_transforms[sent:],
+                    "marks": sorted(marks),
+                    "ranges": ranges,
+                    "timing": stats.as_dict()
                 })
 
-            prev_gray = curr_gray
-            frame_idx += 1
-
         worker.progress.emit({
-            "progress": 100,
-            "raw_transforms": list(raw_transforms),
-            "marks": list(local_marks),
-            "ranges": [[0, frame_idx]]
+            "progress": 100 if done >= todo else int(done / todo * 100),
+            "marks": sorted(marks),
+            "ranges": ranges,
+            "timing": stats.as_dict()
         })
         cap.release()
 
     def _on_worker_progress(self, data):
         """Прием данных из воркера и сохранение на диск"""
-        if "progress" in data: self.progress = data["progress"]
-        if "ranges" in data: self._analyzed_ranges = data["ranges"]
-        if "marks" in data: self._detected_scenes = data["marks"]
+        super()._on_worker_progress(data)
         if "raw_transforms" in data:
-            self._raw_transforms = np.array(data["raw_transforms"])
+            # Новые строки кладем на их место в массиве, индексированном по кадрам
+            self._raw_buf.place(data.get("raw_start", 0), data["raw_transforms"])
+            self._raw_transforms = self._raw_buf.view()
+            self._last_smooth_radius = -1  # Данные поменялись — пересчитать сглаживание
 
         # Мы не считаем сглаживание здесь!
         # Его посчитает process() при следующем запросе кадра.
-        self.save_data()
-
+        self.request_save()
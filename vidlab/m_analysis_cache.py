@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+INDEX_FILENAME = "_index.json"
+
+# Отпечаток видео: размер файла + хеш нескольких блоков по всему файлу
+FP_SAMPLES = 8
+FP_BLOCK = 64 * 1024
+
+_fingerprints = {}  # {(path, size, mtime_ns): fingerprint}
+_index_lock = threading.Lock()
+
+
+def video_fingerprint(path):
+    """
+    Быстрый отпечаток видеофайла (читается ~0.5 МБ, а не весь файл).
+    Меняется при замене файла; не зависит от имени и папки.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    cache_key = (path, st.st_size, st.st_mtime_ns)
+    fp = _fingerprints.get(cache_key)
+    if fp is not None:
+        return fp
+
+    h = hashlib.blake2b(digest_size=8)
+    h.update(str(st.st_size).encode())
+    try:
+        with open(path, 'rb') as f:
+            step = max(1, (st.st_size - FP_BLOCK) // max(1, FP_SAMPLES - 1))
+            for i in range(FP_SAMPLES):
+                f.seek(min(i * step, max(0, st.st_size - FP_BLOCK)))
+                h.update(f.read(FP_BLOCK))
+    except OSError as e:
+        print(f"Fingerprint error for {path}: {e}")
+        return None
+
+    fp = h.hexdigest()
+    _fingerprints[cache_key] = fp
+    return fp
+
+
+def params_hash(params):
+    """Хеш параметров анализа (порядок ключей не важен)"""
+    text = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.blake2b(text.encode(), digest_size=6).hexdigest()
+
+
+def make_cache_key(video_fp, params):
+    return f"{video_fp}_{params_hash(params)}"
+
+
+def register_entry(cache_dir, filename, info):
+    """
+    Запись в индекс кеша: какой файл, для какого видео и каких параметров.
+    Нужна для просмотра и чистки кеша; сами файлы находятся по имени.
+    """
+    path = os.path.join(cache_dir, INDEX_FILENAME)
+    with _index_lock:
+        index = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    index = json.load(f)
+            except Exception as e:
+                print(f"Error reading cache index: {e}")
+
+        old = {k: v for k, v in index.get(filename, {}).items() if k != "created"}
+        if old == info:
+            return  # Запись уже есть — не переписываем файл
+
+        index[filename] = dict(info, created=int(time.time()))
+        try:
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(index, f, indent=1)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"Error writing cache index: {e}")
@@ -0,0 +1,118 @@
+from .m_settings import SettingsModel
+
+# Состояния задачи анализа
+STATE_IDLE = "idle"
+STATE_QUEUED = "queued"
+STATE_RUNNING = "running"
+STATE_PAUSED = "paused"
+
+# Приоритеты (чем больше, тем раньше запускается)
+PRIORITY_NORMAL = 0
+PRIORITY_VISIBLE = 10  # окно действия фильтра накрывает текущий кадр
+PRIORITY_FOCUSED = 20  # фильтр выбран в панели
+
+
+class AnalysisScheduler:
+    """
+    Общая очередь фонового анализа для всех асинхронных фильтров.
+    Ограничивает число одновременно работающих анализаторов и ставит на паузу
+    их все на время воспроизведения. Все методы вызываются из UI-потока.
+    """
+
+    _instance = None
+
+    def __init__(self):
+        self.max_jobs = SettingsModel.get_instance().get_analysis_max_jobs()
+
+        self._queue = []  # Фильтры, ожидающие запуска
+        self._running = []  # Фильтры с работающим воркером
+        self._seq = 0  # Порядок постановки (FIFO внутри одного приоритета)
+        self._order = {}  # {id(filter): seq}
+        self._playback_active = False
+        self._current_frame = 0
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+
+        return cls._instance
+
+    def set_max_jobs(self, count):
+        self.max_jobs = max(1, int(count))
+        SettingsModel.get_instance().set_analysis_max_jobs(self.max_jobs)
+        self._dispatch()
+
+    def submit(self, filter_obj):
+        """Ставит фильтр в очередь; запуск — когда освободится слот"""
+        if filter_obj in self._queue or filter_obj in self._running:
+            return
+
+        self._seq += 1
+        self._order[id(filter_obj)] = self._seq
+        self._queue.append(filter_obj)
+        filter_obj.analysis_state = STATE_QUEUED
+        self._dispatch()
+
+    def cancel(self, filter_obj):
+        """Убирает фильтр из очереди (если он еще не запущен)"""
+        if filter_obj in self._queue:
+            self._queue.remove(filter_obj)
+            self._order.pop(id(filter_obj), None)
+            filter_obj.analysis_state = STATE_IDLE
+            return True
+        return False
+
+    def remove(self, filter_obj):
+        """Фильтр удален из проекта — планировщик не должен держать на него ссылок"""
+        self.cancel(filter_obj)
+        if filter_obj in self._running:
+            self._running.remove(filter_obj)
+            self._dispatch()
+        self._order.pop(id(filter_obj), None)
+
+    def job_finished(self, filter_obj):
+        """Воркер фильтра завершился — отдаем слот следующему"""
+        if filter_obj in self._running:
+            self._running.remove(filter_obj)
+        self._order.pop(id(filter_obj), None)
+        filter_obj.analysis_state = STATE_IDLE
+        self._dispatch()
+
+    def update_priorities(self, current_frame=None):
+        """Пересчет порядка очереди (смена фокуса, перемотка)"""
+        if current_frame is not None:
+            self._current_frame = current_frame
+        self._dispatch()
+
+    def set_playback_active(self, active):
+        """Во время воспроизведения анализ приостанавливается, чтобы не отбирать CPU"""
+        if self._playback_active == active:
+            return
+
+        self._playback_active = active
+        for f in self._running:
+            f.set_analysis_paused(active)
+
+        if not active:
+            self._dispatch()
+
+    def get_priority(self, filter_obj):
+        priority = PRIORITY_NORMAL
+        if filter_obj.focused:
+            priority += PRIORITY_FOCUSED
+        if filter_obj.is_active_at(self._current_frame):
+            priority += PRIORITY_VISIBLE
+        return priority
+
+    def _dispatch(self):
+        if not self._queue:
+            return
+
+        # Сначала фокус и видимый диапазон, затем порядок постановки
+        self._queue.sort(key=lambda f: (-self.get_priority(f), self._order.get(id(f), 0)))
+
+        while self._queue and len(self._running) < self.max_jobs:
+            filter_obj = self._queue.pop(0)
+            self._running.append(filter_obj)
+            filter_obj.launch_worker(paused=self._playback_active)
@@ -0,0 +1,80 @@
+import time
+
+# Этапы, на которые раскладывается время анализа
+STAGES = ("decode", "preprocess", "core", "emit")
+
+
+class AnalysisStats:
+    """
+    Счетчики скорости анализатора: кадры/сек, ETA и время по этапам.
+    Замер "кругами": mark() запускает секундомер, lap(stage) относит
+    прошедшее время к этапу и перезапускает его.
+    """
+
+    def __init__(self, total_frames=0):
+        self.total_frames = max(0, total_frames)
+        self.frames = 0
+        self.stages = {name: 0.0 for name in STAGES}
+
+        self._started = time.perf_counter()
+        self._mark = self._started
+
+    def mark(self):
+        self._mark = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self._mark
+        self._mark = now
+
+    def frame_done(self, count=1):
+        self.frames += count
+
+    def merge(self, data):
+        """Добавляет счетчики куска, посчитанного в другом процессе (результат as_dict())"""
+        self.frames += data.get("frames", 0)
+        for name, sec in data.get("stages", {}).items():
+            self.stages[name] = self.stages.get(name, 0.0) + sec
+
+    def as_dict(self):
+        elapsed = time.perf_counter() - self._started
+        fps = self.frames / elapsed if elapsed > 0 else 0.0
+        left = max(0, self.total_frames - self.frames)
+
+        return {
+            "frames": self.frames,
+            "elapsed": round(elapsed, 2),
+            "fps": round(fps, 1),
+            "eta": round(left / fps, 1) if fps > 0 else None,
+            "stages": {name: round(sec, 3) for name, sec in self.stages.items()}
+        }
+
+
+def format_stats(data, with_frames=False):
+    """Строка для панели: '120 fps · ETA 1:05 · decode 40% · core 55%'"""
+    if not data:
+        return ""
+
+    parts = [f"{data.get('fps', 0):.0f} fps"]
+    if with_frames:
+        parts.append(f"{data.get('frames', 0)} fr in {_format_time(data.get('elapsed', 0))}")
+    if data.get("eta") is not None:
+        parts.append(f"ETA {_format_time(data['eta'])}")
+
+    # Доли этапов — от суммы замеров (в пуле процессов она больше реального времени)
+    stages = data.get("stages", {})
+    total = sum(stages.values())
+    if total > 0:
+        for name in STAGES:
+            share = stages.get(name, 0.0) / total
+            if share >= 0.01:
+                parts.append(f"{name} {share * 100:.0f}%")
+
+    return " · ".join(parts)
+
+
+def _format_time(sec):
+    sec = int(sec)
+    h, rest = divmod(sec, 3600)
+    m, s = divmod(rest, 60)
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m}:{s:02d}"
@@ -0,0 +1,48 @@
+class AdaptiveBatch:
+    """
+    Размер пачки кадров для инференса по замерам.
+    Пачка удваивается, пока время на кадр заметно падает, и уменьшается,
+    если одна пачка идет дольше max_latency (отзывчивость остановки и прогресса)
+    или не влезла в память. Фиксированный size отключает подстройку.
+    """
+
+    GAIN = 0.95  # Большая пачка должна быть хотя бы на 5% быстрее на кадр
+
+    def __init__(self, size=None, max_size=32, max_latency=1.0):
+        self.fixed = bool(size)
+        self.size = size or 1
+        self.max_size = max(self.size, max_size)
+        self.max_latency = max_latency
+
+        self._per_frame = {}  # {размер пачки: сек на кадр}
+        self._warm = False  # Первый вызов модели (прогрев) в замеры не идет
+
+    def report(self, count, seconds):
+        """Замер одной пачки из count кадров"""
+        if not self._warm:
+            self._warm = True
+            return
+        if self.fixed or count < self.size:
+            return  # Неполная пачка в конце куска ничего не говорит о скорости
+
+        per_frame = seconds / count
+        prev = self._per_frame.get(self.size)
+        self._per_frame[self.size] = per_frame if prev is None else 0.7 * prev + 0.3 * per_frame
+
+        if seconds > self.max_latency and self.size > 1:
+            self.size //= 2
+            self.max_size = self.size
+            return
+
+        smaller = self._per_frame.get(self.size // 2)
+        if smaller is not None and self._per_frame[self.size] > smaller * self.GAIN:
+            # Выигрыша нет — возвращаемся к меньшей пачке и больше не растем
+            self.size //= 2
+            self.max_size = self.size
+        elif self.size * 2 <= self.max_size:
+            self.size *= 2
+
+    def out_of_memory(self):
+        """Пачка не влезла в память: уменьшаем и запрещаем рост обратно"""
+        self.size = max(1, self.size // 2)
+        self.max_size = self.size
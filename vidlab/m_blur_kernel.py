@@ -0,0 +1,132 @@
+import cv2
+import numpy as np
+
+
+class FaceBlurKernel:
+    """
+    Размытие/пикселизация набора областей кадра за один проход.
+    - Гаусс с большим ядром считается на уменьшенной копии и растягивается обратно
+      (широкое размытие не содержит мелких деталей, разницы не видно).
+    - Маски (эллипс с мягким краем или прямоугольник) кешируются по размеру,
+      округленному до MASK_STEP, и растягиваются до точного размера рамки.
+    - Соседние области собираются в одну альфа-маску на общем охватывающем ROI,
+      смешивание — один вызов blendLinear над этим ROI. Далекие друг от друга
+      группы обрабатываются отдельно, чтобы не размывать весь кадр ради двух лиц.
+    """
+
+    MASK_STEP = 16  # Квантование размеров масок в кеше (пикс.)
+    MAX_MASKS = 256  # Размер кеша масок
+    LOW_KERNEL = 15  # Ядро на уменьшенной копии; во сколько раз ядро больше — во столько уменьшаем
+    FEATHER = 0.15  # Ширина мягкого края эллипса (доля меньшей стороны)
+    PIXEL_BLOCKS = 15  # Пикселизация: размер блока — 1/15 рамки
+    GROUP_FILL = 0.7  # Рамки объединяются, если занимают не меньше 70% общего ROI
+
+    def __init__(self):
+        self._masks = {}  # {(w, h, ellipse): uint8 маска}
+
+    def apply(self, frame, boxes, ksize, pixelate=False, ellipse=True):
+        """Обрабатывает frame на месте; boxes — [x1, y1, x2, y2] в пикселях кадра"""
+        h_img, w_img = frame.shape[:2]
+        rects = []
+        for box in boxes:
+            x1, y1, x2, y2 = map(int, box)
+            x1, y1 = max(0, x1), max(0, y1)
+            x2, y2 = min(w_img, x2), min(h_img, y2)
+            if x2 > x1 and y2 > y1:
+                rects.append((x1, y1, x2, y2))
+
+        for group in self._group(rects):
+            self._apply_group(frame, group, ksize, pixelate, ellipse)
+        return frame
+
+    def _group(self, rects):
+        """Склейка рамок в группы, общий ROI которых не сильно больше самих рамок"""
+        groups = [[r] for r in rects]
+        merged = True
+        while merged and len(groups) > 1:
+            merged = False
+            for i in range(len(groups)):
+                for j in range(i + 1, len(groups)):
+                    union = groups[i] + groups[j]
+                    if self._area(union) <= sum(self._area([r]) for r in union) / self.GROUP_FILL:
+                        groups[i] = union
+                        groups.pop(j)
+                        merged = True
+                        break
+                if merged:
+                    break
+        return groups
+
+    @staticmethod
+    def _bounds(rects):
+        return (min(r[0] for r in rects), min(r[1] for r in rects),
+                max(r[2] for r in rects), max(r[3] for r in rects))
+
+    @classmethod
+    def _area(cls, rects):
+        x1, y1, x2, y2 = cls._bounds(rects)
+        return (x2 - x1) * (y2 - y1)
+
+    def _apply_group(self, frame, rects, ksize, pixelate, ellipse):
+        # 1. Общий ROI группы
+        ux1, uy1, ux2, uy2 = self._bounds(rects)
+        roi = frame[uy1:uy2, ux1:ux2]
+
+        # 2. Обработанная версия ROI и альфа-маска областей
+        if pixelate:
+            effect = roi.copy()
+        else:
+            effect = self._blur(roi, ksize)
+
+        alpha = np.zeros(roi.shape[:2], dtype=np.uint8)
+        for x1, y1, x2, y2 in rects:
+            w, h = x2 - x1, y2 - y1
+            lx, ly = x1 - ux1, y1 - uy1
+            if pixelate:
+                face = roi[ly:ly + h, lx:lx + w]
+                pw, ph = max(1, w // self.PIXEL_BLOCKS), max(1, h // self.PIXEL_BLOCKS)
+                tmp = cv2.resize(face, (pw, ph), interpolation=cv2.INTER_NEAREST)
+                effect[ly:ly + h, lx:lx + w] = cv2.resize(tmp, (w, h), interpolation=cv2.INTER_NEAREST)
+            np.maximum(alpha[ly:ly + h, lx:lx + w], self._mask(w, h, ellipse), out=alpha[ly:ly + h, lx:lx + w])
+
+        # 3. Смешивание: effect * alpha + roi * (1 - alpha)
+        weight = alpha.astype(np.float32) * (1.0 / 255)
+        roi[:] = cv2.blendLinear(effect, roi, weight, 1.0 - weight)
+
+    def _blur(self, roi, ksize):
+        ksize = max(1, int(ksize)) | 1
+        factor = ksize // self.LOW_KERNEL
+        if factor <= 1:
+            return cv2.GaussianBlur(roi, (ksize, ksize), 0)
+
+        h, w = roi.shape[:2]
+        small = cv2.resize(roi, (max(1, w // factor), max(1, h // factor)), interpolation=cv2.INTER_AREA)
+        k = max(3, (ksize // factor) | 1)
+        small = cv2.GaussianBlur(small, (k, k), 0)
+        return cv2.resize(small, (w, h), interpolation=cv2.INTER_LINEAR)
+
+    def _mask(self, w, h, ellipse):
+        """Маска рамки w x h (0..255) из кеша"""
+        if not ellipse:
+            return np.full((h, w), 255, dtype=np.uint8)
+
+        qw = -(-w // self.MASK_STEP) * self.MASK_STEP
+        qh = -(-h // self.MASK_STEP) * self.MASK_STEP
+        key = (qw, qh, ellipse)
+        mask = self._masks.get(key)
+        if mask is None:
+            if len(self._masks) >= self.MAX_MASKS:
+                self._masks.clear()
+            mask = self._masks[key] = self._make_ellipse(qw, qh)
+
+        if mask.shape != (h, w):
+            mask = cv2.resize(mask, (w, h), interpolation=cv2.INTER_LINEAR)
+        return mask
+
+    def _make_ellipse(self, w, h):
+        """Эллипс во всю рамку; край плавно спадает внутрь на FEATHER"""
+        feather = max(1, int(min(w, h) * self.FEATHER))
+        mask = np.zeros((h, w), dtype=np.uint8)
+        axes = (max(1, w // 2 - feather // 2), max(1, h // 2 - feather // 2))
+        cv2.ellipse(mask, (w // 2, h // 2), axes, 0, 0, 360, 255, -1)
+        return cv2.GaussianBlur(mask, (0, 0), feather / 2)
@@ -0,0 +1,104 @@
+import cv2
+import numpy as np
+
+
+class BoxPropagator:
+    """
+    Перенос рамок и контуров объектов между запусками детектора.
+    На опорном кадре внутри каждой рамки выбираются углы (goodFeaturesToTrack),
+    дальше они ведутся разреженным потоком Лукаса-Канаде; рамка сдвигается
+    на медианное смещение своих точек и масштабируется по их разбросу.
+    """
+
+    WORK_WIDTH = 640  # Поток считаем на уменьшенном кадре
+    MAX_POINTS = 30  # Точек на объект
+    FB_ERROR = 1.0  # Порог ошибки прямого-обратного прохода (пикс. рабочего масштаба)
+    MIN_POINTS = 4  # Меньше точек — объект потерян
+    SCENE_DIFF = 30  # Средняя разница кадров, после которой считаем, что сменилась сцена
+
+    def __init__(self):
+        self._prev_gray = None
+        self._scale = 1.0
+        self._objects = []  # [(объект, точки (n, 1, 2) float32)]
+
+    def prepare(self, frame):
+        """Серый кадр рабочего масштаба"""
+        h, w = frame.shape[:2]
+        self._scale = min(1.0, self.WORK_WIDTH / w)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self._scale < 1.0:
+            gray = cv2.resize(gray, (int(w * self._scale), int(h * self._scale)), interpolation=cv2.INTER_AREA)
+        return gray
+
+    def anchor(self, gray, detections):
+        """Опорный кадр: свежие детекции, точки выбираются заново"""
+        self._prev_gray = gray
+        self._objects = []
+        s = self._scale
+        for obj in detections:
+            x1, y1, x2, y2 = [int(v * s) for v in obj["bbox"]]
+            mask = np.zeros_like(gray)
+            mask[max(0, y1):max(0, y2), max(0, x1):max(0, x2)] = 255
+            pts = cv2.goodFeaturesToTrack(gray, self.MAX_POINTS, 0.01, 5, mask=mask)
+            self._objects.append((obj, pts))
+
+    def propagate(self, gray):
+        """
+        Переносит объекты опорного/предыдущего кадра на gray.
+        Возвращает (детекции, drift): drift — доля потерянных объектов, 1.0 — смена сцены.
+        """
+        if self._prev_gray is None:
+            return [], 1.0
+
+        if cv2.mean(cv2.absdiff(gray, self._prev_gray))[0] > self.SCENE_DIFF:
+            return [], 1.0
+
+        if not self._objects:
+            self._prev_gray = gray
+            return [], 0.0
+
+        total = len(self._objects)
+        moved, kept = [], []
+        for obj, pts in self._objects:
+            new_obj, new_pts = self._move_object(obj, pts, gray)
+            if new_obj is None:
+                continue
+            moved.append(new_obj)
+            kept.append((new_obj, new_pts))
+
+        self._objects = kept
+        self._prev_gray = gray
+        return moved, 1.0 - len(kept) / total
+
+    def _move_object(self, obj, pts, gray):
+        if pts is None or len(pts) < self.MIN_POINTS:
+            return None, None
+
+        nxt, st, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, pts, None)
+        back, st_back, _ = cv2.calcOpticalFlowPyrLK(gray, self._prev_gray, nxt, None)
+        fb_err = np.linalg.norm((back - pts).reshape(-1, 2), axis=1)
+        good = (st.ravel() == 1) & (st_back.ravel() == 1) & (fb_err < self.FB_ERROR)
+        if good.sum() < self.MIN_POINTS:
+            return None, None
+
+        p0 = pts[good].reshape(-1, 2)
+        p1 = nxt[good].reshape(-1, 2)
+
+        # Сдвиг — медиана смещений, масштаб — отношение разброса точек вокруг центра
+        shift = np.median(p1 - p0, axis=0) / self._scale
+        c0, c1 = p0.mean(axis=0), p1.mean(axis=0)
+        spread0 = np.median(np.linalg.norm(p0 - c0, axis=1))
+        spread1 = np.median(np.linalg.norm(p1 - c1, axis=1))
+        zoom = float(np.clip(spread1 / spread0, 0.8, 1.25)) if spread0 > 1e-3 else 1.0
+
+        x1, y1, x2, y2 = obj["bbox"]
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        new_cx, new_cy = cx + shift[0], cy + shift[1]
+        hw, hh = (x2 - x1) / 2 * zoom, (y2 - y1) / 2 * zoom
+
+        new_obj = dict(obj, bbox=[new_cx - hw, new_cy - hh, new_cx + hw, new_cy + hh])
+        if "poly" in obj:
+            poly = np.asarray(obj["poly"], dtype=np.float32).reshape(-1, 2)
+            new_obj["poly"] = (poly - (cx, cy)) * zoom + (new_cx, new_cy)
+
+        return new_obj, p1.reshape(-1, 1, 2).astype(np.float32)
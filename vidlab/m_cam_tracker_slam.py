@@ -1,8 +1,13 @@
+import copy
 import os
 import cv2
 import numpy as np
 
 class CameraTrackerSlamModel:
+    # Не попадают в чекпоинт: кадр пересчитывается, остальное задается конструктором.
+    # История поз и карта точек уже отданы в UI — в чекпоинт идут только позы,
+    # на которые ссылаются активные точки (см. get_state)
+    STATE_SKIP = ("prev_gray", "w", "h", "params", "K", "poses", "map_points_3d", "voxel_map", "map_dirty")
 
     def __init__(self, w, h, params):
         self.w = w
@@ -14,8 +19,10 @@ class CameraTrackerSlamModel:
 
         # Состояние (Мир)
         self.prev_gray = None
-        # Список всех матриц 4x4 для каждого кадра
+        # Матрицы 4x4 для каждого кадра, начиная с pose_base (старые отбрасывает trim_poses)
         self.poses = []
+        self.pose_base = 0
+        self.first_frame_idx = 0
         # Текущая абсолютная позиция (Мировая матрица)
         self.current_pose = np.eye(4, dtype=np.float32)
         self.marks = []
@@ -46,13 +53,51 @@ class CameraTrackerSlamModel:
 
         self.voxel_size = 1  # Размер кубика (5 см)
         self.voxel_map = {}  # {(vx, vz): index_in_map_points_3d}
+        self.map_dirty = set()  # Индексы точек карты, изменившихся после последнего get_results
 
         self.last_frame_idx = 0
 
         self.stats_total_lost_points = 0
 
+    def get_state(self):
+        """Снимок для чекпоинта: текущая поза, активные точки и позы с кадра самой старой из них"""
+        state = copy.deepcopy({k: v for k, v in self.__dict__.items() if k not in self.STATE_SKIP})
+        keep_from = self._oldest_needed_pose()
+        state["poses"] = [p.copy() for p in self.poses[keep_from - self.pose_base:]]
+        state["pose_base"] = keep_from
+        return state
+
+    def set_state(self, state, frame):
+        """
+        Восстановление из чекпоинта; frame — кадр чекпоинта (last_frame_idx).
+        Карта начинается пустой: новые точки дописываются к уже сохраненным.
+        """
+        self.__dict__.update(copy.deepcopy(state))
+        self.map_points_3d = []
+        self.voxel_map = {}
+        self.map_dirty = set()
+        self.prev_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def pose_at(self, frame_idx):
+        return self.poses[frame_idx - self.pose_base]
+
+    def _oldest_needed_pose(self):
+        """Кадр самой ранней позы, на которую еще ссылаются активные точки"""
+        return min([d['first_pose_idx'] for d in self.active_pts.values()] + [self.last_frame_idx])
+
+    def trim_poses(self, keep_from):
+        """Отбрасывает позы до кадра keep_from (уже отданные в UI и не нужные точкам)"""
+        keep_from = min(keep_from, self._oldest_needed_pose())
+        drop = keep_from - self.pose_base
+        if drop > 0:
+            del self.poses[:drop]
+            self.pose_base = keep_from
+
     def process_frame(self, frame, idx):
         curr_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if not self.poses:
+            self.first_frame_idx = idx  # Анализ может начинаться не с нуля
+            self.pose_base = idx
         self.last_frame_idx = idx
         rel_pose = np.eye(4, dtype=np.float32)
 
@@ -133,7 +178,7 @@ class CameraTrackerSlamModel:
             return
 
         # 2. Базис (смещение камеры)
-        start_pose = self.poses[data['first_pose_idx']]
+        start_pose = self.pose_at(data['first_pose_idx'])
         curr_pose = self.current_pose
         dist = np.linalg.norm(curr_pose[:3, 3] - start_pose[:3, 3])
 
@@ -195,6 +240,7 @@ class CameraTrackerSlamModel:
                         'age': age,
                         'ratio': parallax_ratio
                     }
+                    self.map_dirty.add(idx_in_list)
             else:
                 # 3. Если воксель пустой, добавляем новую точку
                 new_idx = len(self.map_points_3d)
@@ -204,6 +250,7 @@ class CameraTrackerSlamModel:
                     'ratio': parallax_ratio
                 })
                 self.voxel_map[v_idx] = new_idx
+                self.map_dirty.add(new_idx)
 
             # Для статистики адаптации
             self.slam_config["success_rate_history"].append(1)
@@ -247,7 +294,7 @@ class CameraTrackerSlamModel:
 
             # Нам нужно значимое смещение.
             # Если мы еще не накопили Scale, будем ориентироваться на возраст и "базис"
-            start_pose = self.poses[data['first_pose_idx']]
+            start_pose = self.pose_at(data['first_pose_idx'])
             rel_t = self.current_pose[:3, 3] - start_pose[:3, 3]
             dist = np.linalg.norm(rel_t)
 
@@ -273,6 +320,7 @@ class CameraTrackerSlamModel:
                 # и не слишком близко/далеко
                 if 0.1 < pt_local[2] < 100:
                     data['pos_3d'] = pts3d.flatten()  # Это уже мировые координаты
+                    self.map_dirty.add(len(self.map_points_3d))
                     self.map_points_3d.append({
                         'pos': data['pos_3d'],
                         'age': age
@@ -287,7 +335,7 @@ class CameraTrackerSlamModel:
             if age < 5: continue  # Ждем минимальный параллакс
 
             # Триангулируем текущее положение относительно старта
-            start_pose = self.poses[data['first_pose_idx']]
+            start_pose = self.pose_at(data['first_pose_idx'])
             P1 = self.K @ np.linalg.inv(start_pose)[:3, :]
 
             pts4d = cv2.triangulatePoints(P1, P2,
@@ -309,15 +357,22 @@ class CameraTrackerSlamModel:
                     # Обновляем позицию (можно через среднее или фильтр Калмана)
                 data['pos_3d'] = 0.8 * data['pos_3d'] + 0.2 * new_pos_3d
 
-    def get_results(self):
+    def get_results(self, path_since=0):
+        """
+        path_since — отдать путь только начиная с этого кадра (порция для UI).
+        Облако — только точки, добавленные или уточненные после прошлого вызова:
+        map_idx — их индексы в map_points_3d, map_cloud — строки [x, z, age].
+        """
         # Траектория камеры
-        path = [[p[0, 3], p[2, 3], np.arctan2(p[0, 2], p[2, 2])] for p in self.poses]
-
-
+        path = [[p[0, 3], p[2, 3], np.arctan2(p[0, 2], p[2, 2])]
+                for p in self.poses[max(0, path_since - self.pose_base):]]
 
-        # Облако точек
+        # Изменения облака точек
+        cloud_idx = sorted(self.map_dirty)
+        self.map_dirty.clear()
         cloud = []
-        for p in self.map_points_3d:
+        for i in cloud_idx:
+            p = self.map_points_3d[i]
             cloud.append([p['pos'][0], p['pos'][2], p['age']])
 
 
@@ -338,16 +393,17 @@ class CameraTrackerSlamModel:
         success_rate = (triangulated_count / total_lost * 100) if total_lost > 0 else 0
 
         return {
-            "abs_path": np.array(path, dtype=np.float32),
-            "map_cloud": np.array(cloud, dtype=np.float32),
+            "abs_path": np.array(path, dtype=np.float32).reshape(-1, 3),
+            "map_idx": np.array(cloud_idx, dtype=np.int64),
+            "map_cloud": np.array(cloud, dtype=np.float32).reshape(-1, 3),
             "marks": self.marks,
-            "ranges": [[0, self.last_frame_idx]],
+            "ranges": [[self.first_frame_idx, self.last_frame_idx]],
             "stats": {
                 "active": active_count,
                 "in_map": triangulated_count,
                 "max_age_pending": max_age,
                 "success_rate_pct": round(success_rate, 1),
-                "last_ratio": float(round(self.map_points_3d[-1]['ratio'], 2)) if self.map_points_3d else 0,
+                "last_ratio": float(round(self.map_points_3d[-1].get('ratio', 0), 2)) if self.map_points_3d else 0,
                 # --- ТЕКУЩИЕ ЗНАЧЕНИЯ "РУЧЕК" ---
                 "cfg_quality": round(self.slam_config.get("quality_level", 0), 4),
                 "cfg_min_dist": round(self.slam_config.get("min_parallax_dist", 0), 3)
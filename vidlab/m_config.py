@@ -2,4 +2,12 @@
 APP_NAME = "Video Analyzer"
 APP_VER = '1.0'
 
-WIN_W, WIN_H = 1100, 700 # размер главного окна
\ No newline at end of file
+WIN_W, WIN_H = 1100, 700 # размер главного окна
+
+# Набор выходов для экспорта "мастер + веб + превью" за один проход
+# size: высота кадра (ширина по пропорциям) или None — как у обработанного кадра
+EXPORT_RENDITIONS = [
+    {"suffix": "_1080p", "size": 1080, "codec": 'mp4v'},
+    {"suffix": "_720p", "size": 720, "codec": 'mp4v'},
+    {"suffix": "_360p", "size": 360, "codec": 'mp4v'},
+]
@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import numpy as np
+
+
+class DepthStorage:
+    """
+    Карты глубины на диске (папка с сырыми массивами), чтение через memmap.
+
+    depth.f16  — карты float16 (height x width) подряд, в порядке расчета
+    frames.bin — int64 на кадр: номер карты в depth.f16 (-1 — кадр не считался)
+    meta.json  — версия формата и размер карт
+
+    Карты новых кадров дописываются, строки кадров пишутся после них,
+    так что оборванная запись не видна читателю. Повторный анализ кадра
+    перезаписывает его прежнюю карту на месте — файл не растет от перезапусков.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.height = None
+        self.width = None
+
+        self._lock = threading.Lock()
+        self._maps = None  # (frames, depth); None — переоткрыть при чтении
+
+        self._load_meta()
+
+    # --- ЧТЕНИЕ ---
+
+    def _load_meta(self):
+        meta_path = os.path.join(self.path, "meta.json")
+        if not os.path.exists(meta_path):
+            return
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta.get("version") != self.VERSION:
+                print(f"Depth store {self.path}: old version, ignoring.")
+                self.clear()
+                return
+            self.height, self.width = int(meta["height"]), int(meta["width"])
+        except Exception as e:
+            print(f"Error loading depth store meta: {e}")
+
+    def _get_maps(self):
+        with self._lock:
+            if self._maps is None:
+                frames = np.zeros(0, dtype=np.int64)
+                depth = np.zeros((0, 1, 1), dtype=np.float16)
+
+                frames_path = os.path.join(self.path, "frames.bin")
+                if os.path.exists(frames_path) and os.path.getsize(frames_path) >= 8:
+                    frames = np.memmap(frames_path, dtype=np.int64, mode='r')
+
+                depth_path = os.path.join(self.path, "depth.f16")
+                if self.height and os.path.exists(depth_path):
+                    rows = os.path.getsize(depth_path) // (self.height * self.width * 2)
+                    if rows:
+                        depth = np.memmap(depth_path, dtype=np.float16, mode='r',
+                                          shape=(rows, self.height, self.width))
+                self._maps = (frames, depth)
+            return self._maps
+
+    def get(self, frame_idx):
+        """Карта глубины кадра (float16, размер хранилища) или None"""
+        frames, depth = self._get_maps()
+        if frame_idx < 0 or frame_idx >= len(frames):
+            return None
+        row = int(frames[frame_idx])
+        if row < 0 or row >= len(depth):
+            return None
+        return depth[row]
+
+    def analyzed_ranges(self):
+        """Посчитанные кадры в виде диапазонов [start, end]"""
+        frames, _ = self._get_maps()
+        done = np.asarray(frames) >= 0
+        if not done.any():
+            return []
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], done.astype(np.int8), [0]))))
+        return [[int(s), int(e) - 1] for s, e in zip(edges[::2], edges[1::2])]
+
+    # --- ЗАПИСЬ ---
+
+    def write_range(self, start, maps):
+        """Карты кадров start, start+1, ... — массив (n, height, width). Вызывается из одного потока записи"""
+        maps = np.ascontiguousarray(maps, dtype=np.float16)
+        if len(maps) == 0:
+            return
+
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            if self.height is None:
+                self.height, self.width = maps.shape[1:]
+                self._write_meta()
+            elif maps.shape[1:] != (self.height, self.width):
+                print(f"Depth store {self.path}: map size {maps.shape[1:]} does not match, skipped.")
+                return
+            self._maps = None  # Файлы растут — отображения переоткроем при чтении
+
+            # 1. Кадры, у которых карта уже есть, — перезапись на месте
+            depth_path = os.path.join(self.path, "depth.f16")
+            row_size = self.height * self.width * 2
+            base = os.path.getsize(depth_path) // row_size if os.path.exists(depth_path) else 0
+            rows = self._read_rows(start, len(maps))
+            reuse = (rows >= 0) & (rows < base)
+            if reuse.any():
+                with open(depth_path, 'r+b') as f:
+                    for i in np.flatnonzero(reuse):
+                        f.seek(int(rows[i]) * row_size)
+                        f.write(maps[i].tobytes())
+
+            # 2. Новые карты — в конец файла
+            new = np.flatnonzero(~reuse)
+            if len(new):
+                with open(depth_path, 'ab') as f:
+                    f.write(maps[new].tobytes())
+                rows[new] = np.arange(base, base + len(new), dtype=np.int64)
+
+            # 3. Строки кадров
+            self._write_frames(start, rows)
+
+    def _read_rows(self, start, count):
+        """Строки карт кадров [start, start + count) из frames.bin; -1 — карты нет"""
+        rows = np.full(count, -1, dtype=np.int64)
+        file_path = os.path.join(self.path, "frames.bin")
+        have = os.path.getsize(file_path) // 8 if os.path.exists(file_path) else 0
+        if start < have:
+            stored = np.fromfile(file_path, dtype=np.int64, count=min(count, have - start), offset=start * 8)
+            rows[:len(stored)] = stored
+        return rows
+
+    def _write_frames(self, start, rows):
+        file_path = os.path.join(self.path, "frames.bin")
+        size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+
+        with open(file_path, 'r+b' if size else 'wb') as f:
+            have = size // 8
+            if start > have:
+                # Пропущенные кадры — "не считался"
+                f.seek(have * 8)
+                f.write(np.full(start - have, -1, dtype=np.int64).tobytes())
+            f.seek(start * 8)
+            f.write(rows.tobytes())
+
+    def _write_meta(self):
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"version": self.VERSION, "height": self.height, "width": self.width}, f)
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+    def clear(self):
+        """Удаление всех данных хранилища"""
+        with self._lock:
+            self._maps = None
+            self.height = self.width = None
+            for name in ("depth.f16", "frames.bin", "meta.json"):
+                file_path = os.path.join(self.path, name)
+                if os.path.exists(file_path):
+                    try:
+                        os.remove(file_path)
+                    except OSError as e:
+                        print(f"Error deleting {file_path}: {e}")
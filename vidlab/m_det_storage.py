@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+import numpy as np
+
+
+class DetectionStorage:
+    """
+    Колоночное хранилище детекций на диске (папка с сырыми массивами).
+    Каждая колонка — отдельный файл, открывается через memmap, поэтому
+    детекции кадра читаются за O(1) без загрузки всего файла в память.
+
+    frames.bin  — строка на кадр: начало и число детекций, макс. уверенность
+                  (start = -1 — кадр не анализировался)
+    boxes.bin   — float32 [x1, y1, x2, y2] на детекцию
+    scores.bin  — float32 уверенность
+    classes.bin — int16 номер класса
+    polys.bin   — int64 [начало, число вершин] контура в verts.bin
+    verts.bin   — int16 [x, y] вершины контуров подряд
+    meta.json   — версия формата и имена классов
+
+    Запись только дописывает колонки и переписывает строки кадров на месте;
+    строки кадров пишутся последними, так что оборванная запись не видна читателю.
+    """
+
+    VERSION = 1
+    FRAME_DTYPE = np.dtype([('start', '<i8'), ('count', '<i4'), ('max_score', '<f4')])
+    COLUMNS = {
+        "boxes": (np.float32, 4),
+        "scores": (np.float32, 1),
+        "classes": (np.int16, 1),
+        "polys": (np.int64, 2),
+        "verts": (np.int16, 2),
+    }
+
+    def __init__(self, path):
+        self.path = path
+        self.names = {}
+
+        self._lock = threading.Lock()
+        self._maps = None  # {колонка: memmap}; None — переоткрыть при чтении
+        self._sizes = None  # Размеры frames.bin и boxes.bin при последней проверке (refresh)
+
+        self._load_meta()
+
+    # --- ЧТЕНИЕ ---
+
+    def _load_meta(self):
+        meta_path = os.path.join(self.path, "meta.json")
+        if not os.path.exists(meta_path):
+            return
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta.get("version") != self.VERSION:
+                print(f"Detection store {self.path}: old version, ignoring.")
+                self.clear()
+                return
+            self.names = {int(k): v for k, v in meta.get("names", {}).items()}
+        except Exception as e:
+            print(f"Error loading detection store meta: {e}")
+
+    def _open_column(self, name, dtype, width):
+        file_path = os.path.join(self.path, f"{name}.bin")
+        row_size = np.dtype(dtype).itemsize * width
+        rows = os.path.getsize(file_path) // row_size if os.path.exists(file_path) else 0
+        shape = (rows,) if width == 1 else (rows, width)
+        if rows == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(file_path, dtype=dtype, mode='r', shape=shape)
+
+    def _get_maps(self):
+        with self._lock:
+            if self._maps is None:
+                maps = {name: self._open_column(name, dtype, width)
+                        for name, (dtype, width) in self.COLUMNS.items()}
+                maps["frames"] = self._open_column("frames", self.FRAME_DTYPE, 1)
+                self._maps = maps
+            return self._maps
+
+    def refresh(self):
+        """
+        Хранилище дописал другой экземпляр (другой процесс) — переоткрыть колонки.
+        Строки кадров переписываются на месте, а детекции только дописываются,
+        поэтому изменения видны по размерам файлов.
+        """
+        sizes = tuple(os.path.getsize(p) if os.path.exists(p) else 0
+                      for p in (os.path.join(self.path, "frames.bin"), os.path.join(self.path, "boxes.bin")))
+        with self._lock:
+            if sizes == self._sizes:
+                return
+            self._sizes = sizes
+            self._maps = None
+        if not self.names:
+            self._load_meta()
+
+    def get_frame_table(self):
+        """Строки всех кадров (start, count, max_score) — для масок и таймлайна"""
+        return self._get_maps()["frames"]
+
+    def get(self, frame_idx):
+        """
+        Детекции кадра: {"boxes", "scores", "classes", "polys"} или None, если кадр не анализировался.
+        polys — список int16 массивов вершин (пустой массив — контура нет).
+        """
+        maps = self._get_maps()
+        frames = maps["frames"]
+        if frame_idx < 0 or frame_idx >= len(frames):
+            return None
+
+        start, count = int(frames[frame_idx]['start']), int(frames[frame_idx]['count'])
+        if start < 0 or start + count > len(maps["boxes"]):
+            return None
+
+        end = start + count
+        polys = []
+        for v_start, v_len in maps["polys"][start:end]:
+            polys.append(maps["verts"][v_start:v_start + v_len])
+
+        return {
+            "boxes": maps["boxes"][start:end],
+            "scores": maps["scores"][start:end],
+            "classes": maps["classes"][start:end],
+            "polys": polys
+        }
+
+    def analyzed_ranges(self):
+        """Проанализированные кадры в виде диапазонов [start, end]"""
+        done = self.get_frame_table()['start'] >= 0
+        if not done.any():
+            return []
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], done.astype(np.int8), [0]))))
+        return [[int(s), int(e) - 1] for s, e in zip(edges[::2], edges[1::2])]
+
+    def presence(self, conf):
+        """Номера кадров, где есть детекция не ниже conf"""
+        table = self.get_frame_table()
+        return np.flatnonzero((table['start'] >= 0) & (table['max_score'] >= conf))
+
+    # --- ЗАПИСЬ ---
+
+    def write_range(self, start, end, dets, names=None):
+        """
+        Результаты кадров [start, end] (см. pack_detections). Кадры без детекций
+        тоже помечаются проанализированными. Вызывается из одного потока записи.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            self._maps = None  # Файлы растут — отображения переоткроем при чтении
+
+            det_base = self._rows("boxes")
+            vert_base = self._rows("verts")
+
+            vert_counts = dets["vert_counts"].astype(np.int64)
+            vert_starts = vert_base + np.concatenate(([0], np.cumsum(vert_counts)[:-1])).astype(np.int64)
+            polys = np.stack([vert_starts, vert_counts], axis=1) if len(vert_counts) else np.zeros((0, 2), np.int64)
+
+            # 1. Колонки детекций
+            self._append("verts", dets["verts"])
+            self._append("polys", polys)
+            self._append("boxes", dets["boxes"])
+            self._append("scores", dets["scores"])
+            self._append("classes", dets["classes"])
+
+            # 2. Строки кадров (детекции отсортированы по кадру)
+            local = dets["frame"].astype(np.int64) - start
+            rows = np.zeros(end - start + 1, dtype=self.FRAME_DTYPE)
+            counts = np.bincount(local, minlength=len(rows))
+            rows['count'] = counts
+            rows['start'] = det_base + np.concatenate(([0], np.cumsum(counts)[:-1]))
+            np.maximum.at(rows['max_score'], local, dets["scores"])
+            self._write_frames(start, rows)
+
+            if names and names != self.names:
+                self.names = {int(k): v for k, v in names.items()}
+                self._write_meta()
+            elif not os.path.exists(os.path.join(self.path, "meta.json")):
+                self._write_meta()
+
+    def _rows(self, name):
+        dtype, width = self.COLUMNS[name]
+        file_path = os.path.join(self.path, f"{name}.bin")
+        if not os.path.exists(file_path):
+            return 0
+        return os.path.getsize(file_path) // (np.dtype(dtype).itemsize * width)
+
+    def _append(self, name, data):
+        dtype, width = self.COLUMNS[name]
+        data = np.ascontiguousarray(data, dtype=dtype)
+        with open(os.path.join(self.path, f"{name}.bin"), 'ab') as f:
+            f.write(data.tobytes())
+
+    def _write_frames(self, start, rows):
+        file_path = os.path.join(self.path, "frames.bin")
+        row_size = self.FRAME_DTYPE.itemsize
+        size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+
+        with open(file_path, 'r+b' if size else 'wb') as f:
+            have = size // row_size
+            if start > have:
+                # Пропущенные кадры — "не анализировался"
+                gap = np.zeros(start - have, dtype=self.FRAME_DTYPE)
+                gap['start'] = -1
+                f.seek(have * row_size)
+                f.write(gap.tobytes())
+            f.seek(start * row_size)
+            f.write(rows.tobytes())
+
+    def _write_meta(self):
+        tmp_path = os.path.join(self.path, "meta.json.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump({"version": self.VERSION, "names": self.names}, f)
+        os.replace(tmp_path, os.path.join(self.path, "meta.json"))
+
+    def clear(self):
+        """Удаление всех данных хранилища"""
+        with self._lock:
+            self._maps = None
+            self.names = {}
+            for name in list(self.COLUMNS) + ["frames", "meta"]:
+                file_path = os.path.join(self.path, f"{name}.json" if name == "meta" else f"{name}.bin")
+                if os.path.exists(file_path):
+                    try:
+                        os.remove(file_path)
+                    except OSError as e:
+                        print(f"Error deleting {file_path}: {e}")
+
+
+def pack_detections(items):
+    """
+    Детекции нескольких кадров в колонки для write_range.
+    items — [(frame_idx, boxes (n, 4), scores (n,), classes (n,), polys [массив (k, 2) | None])],
+    по возрастанию кадра.
+    """
+    frames, boxes, scores, classes, counts, verts = [], [], [], [], [], []
+    for frame_idx, f_boxes, f_scores, f_classes, f_polys in items:
+        n = len(f_scores)
+        frames.append(np.full(n, frame_idx, dtype=np.int32))
+        boxes.append(np.asarray(f_boxes, dtype=np.float32).reshape(-1, 4))
+        scores.append(np.asarray(f_scores, dtype=np.float32))
+        classes.append(np.asarray(f_classes, dtype=np.int16))
+        for i in range(n):
+            poly = f_polys[i] if f_polys is not None else None
+            if poly is None or len(poly) == 0:
+                counts.append(0)
+                continue
+            # Пиксельные координаты помещаются в int16 (кадры до 32K)
+            poly = np.round(np.asarray(poly, dtype=np.float32)).astype(np.int16).reshape(-1, 2)
+            counts.append(len(poly))
+            verts.append(poly)
+
+    return {
+        "frame": np.concatenate(frames) if frames else np.zeros(0, np.int32),
+        "boxes": np.concatenate(boxes) if boxes else np.zeros((0, 4), np.float32),
+        "scores": np.concatenate(scores) if scores else np.zeros(0, np.float32),
+        "classes": np.concatenate(classes) if classes else np.zeros(0, np.int16),
+        "vert_counts": np.asarray(counts, dtype=np.int32),
+        "verts": np.concatenate(verts) if verts else np.zeros((0, 2), np.int16),
+    }
@@ -0,0 +1,32 @@
+import cv2
+import numpy as np
+
+
+def guided_upsample(src, guide, radius=4, eps=1e-3, work_width=640):
+    """
+    Растягивает карту низкого разрешения src до размера кадра guide так,
+    чтобы ее края легли на края кадра (быстрый управляемый фильтр, He и Sun).
+    Линейные коэффициенты a, b считаются на копии шириной work_width
+    и растягиваются билинейно; на полном разрешении — только a * I + b.
+    eps — в единицах яркости [0, 1], от масштаба src не зависит.
+    """
+    h, w = guide.shape[:2]
+    gray = cv2.cvtColor(guide, cv2.COLOR_BGR2GRAY) if guide.ndim == 3 else guide
+
+    scale = min(1.0, work_width / w)
+    size = (max(1, int(w * scale)), max(1, int(h * scale)))
+    I = cv2.resize(gray, size, interpolation=cv2.INTER_AREA).astype(np.float32) * (1.0 / 255)
+    p = cv2.resize(src.astype(np.float32), size, interpolation=cv2.INTER_LINEAR)
+
+    ksize = (2 * radius + 1, 2 * radius + 1)
+    mean_I = cv2.boxFilter(I, -1, ksize)
+    mean_p = cv2.boxFilter(p, -1, ksize)
+    cov_Ip = cv2.boxFilter(I * p, -1, ksize) - mean_I * mean_p
+    var_I = cv2.boxFilter(I * I, -1, ksize) - mean_I * mean_I
+
+    a = cov_Ip / (var_I + eps)
+    b = mean_p - a * mean_I
+    mean_a = cv2.resize(cv2.boxFilter(a, -1, ksize), (w, h), interpolation=cv2.INTER_LINEAR)
+    mean_b = cv2.resize(cv2.boxFilter(b, -1, ksize), (w, h), interpolation=cv2.INTER_LINEAR)
+
+    return mean_a * (gray.astype(np.float32) * (1.0 / 255)) + mean_b
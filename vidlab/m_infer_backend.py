@@ -0,0 +1,365 @@
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import cv2
+import numpy as np
+
+from .m_settings import SettingsModel
+
+# Бэкенд инференса нейросетей для машин без видеокарты.
+# torch — исходный путь (.pt / transformers); onnx — модели экспортируются в ONNX
+# и выполняются ONNX Runtime; onnx_int8 — то же, веса и активации квантованы в INT8
+# по кадрам видео. Экспорт кешируется рядом с моделью в папке models.
+# Если onnxruntime не установлен — работаем через torch. Бэкенд фиксируется в ключе
+# модели фильтра (infer_device) при его создании; если экспорт на этом бэкенде не удался,
+# загрузка модели завершается ошибкой, а не подменяется torch — иначе кеш анализа,
+# помеченный бэкендом, получил бы результаты другого.
+#
+# Ограничение INT8: модель калибруется один раз — по видео, на котором она понадобилась
+# впервые, — и файл <модель>.int8.onnx используется для всех следующих видео.
+# Для съемки с другой экспозицией или сюжетом точность может упасть;
+# чтобы перекалибровать по текущему видео, удалите файл .int8.onnx из папки models.
+
+BACKENDS = ("torch", "onnx", "onnx_int8")
+CALIB_FRAMES = 32  # Кадров видео для калибровки INT8
+
+LOCK_STALE = 3600  # Секунд, после которых чужой файл блокировки экспорта считается брошенным
+
+_export_lock = threading.Lock()  # Экспорт одной модели из нескольких фильтров сразу
+_pinned_device = None  # Устройство фильтра родителя в процессе анализа (pin_device)
+
+
+def resolve_backend():
+    """Бэкенд из настроек с учетом окружения: на CUDA всегда torch"""
+    backend = SettingsModel.get_instance().get_infer_backend()
+    if backend not in BACKENDS or backend == "torch":
+        return "torch"
+
+    import torch
+    if torch.cuda.is_available():
+        return "torch"
+
+    try:
+        import onnxruntime  # noqa: F401
+    except ImportError:
+        print("Inference backend: onnxruntime is not installed, using torch")
+        return "torch"
+    return backend
+
+
+def pin_device(device):
+    """
+    Процесс анализа считает на устройстве фильтра, который его запустил,
+    а не по настройкам, которые могли смениться с момента создания фильтра
+    """
+    global _pinned_device
+    _pinned_device = device
+
+
+def infer_device():
+    """Где выполняется модель: cuda, cpu (torch) или бэкенд ONNX — часть ключа ModelPool"""
+    if _pinned_device:
+        return _pinned_device
+    import torch
+    if torch.cuda.is_available():
+        return "cuda"
+    backend = resolve_backend()
+    return "cpu" if backend == "torch" else backend
+
+
+def device_backend(device):
+    """Бэкенд по устройству из ключа модели: cuda и cpu — torch"""
+    return device if device in BACKENDS else "torch"
+
+
+def create_session(onnx_path):
+    """Сессия ONNX Runtime на CPU с числом потоков из настроек"""
+    import onnxruntime as ort
+
+    settings = SettingsModel.get_instance()
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = settings.get_infer_threads()
+    if settings.get_infer_threads(resolve=False) == 0:
+        # Авто: все ядра на сессию, но без активного ожидания — параллельные анализаторы
+        # делят ядра, и крутящиеся в ожидании потоки отнимали бы их друг у друга
+        opts.add_session_config_entry("session.intra_op.allow_spinning", "0")
+    opts.inter_op_num_threads = 1
+    opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(onnx_path, opts, providers=["CPUExecutionProvider"])
+
+
+# --- КАЛИБРОВКА INT8 ---
+
+def sample_frames(video_path, count=CALIB_FRAMES):
+    """Кадры (BGR), равномерно взятые по всему видео"""
+    frames = []
+    if not video_path:
+        return frames
+
+    cap = cv2.VideoCapture(video_path)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    for idx in np.unique(np.linspace(0, max(0, total - 1), count).astype(int)):
+        cap.set(cv2.CAP_PROP_POS_FRAMES, int(idx))
+        ret, frame = cap.read()
+        if ret:
+            frames.append(frame)
+    cap.release()
+    return frames
+
+
+class FrameCalibrationReader:
+    """Источник калибровочных данных для quantize_static: кадр -> вход модели"""
+
+    def __init__(self, input_name, frames, prepare):
+        self._input_name = input_name
+        self._frames = frames
+        self._prepare = prepare
+        self._pos = 0
+
+    def get_next(self):
+        if self._pos >= len(self._frames):
+            return None
+        frame = self._frames[self._pos]
+        self._pos += 1
+        return {self._input_name: self._prepare(frame)}
+
+    def rewind(self):
+        self._pos = 0
+
+
+def quantize_int8(src_path, dst_path, frames, prepare):
+    """Статическое квантование INT8 (QDQ) с калибровкой по кадрам"""
+    import onnxruntime as ort
+    from onnxruntime.quantization import quantize_static, QuantFormat, QuantType
+
+    input_name = ort.InferenceSession(src_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+    reader = FrameCalibrationReader(input_name, frames, prepare)
+
+    tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+    quantize_static(
+        src_path, tmp_path, reader,
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+        op_types_to_quantize=["Conv", "MatMul"]
+    )
+    os.replace(tmp_path, dst_path)
+
+
+@contextlib.contextmanager
+def _export_guard(base_path):
+    """
+    Экспорт по очереди: замок потоков процесса и файл блокировки рядом с моделью —
+    процессы пула анализа (spawn) замок потоков не разделяют
+    """
+    lock_path = base_path + ".export.lock"
+    with _export_lock:
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > LOCK_STALE:
+                        os.remove(lock_path)  # Процесс, начавший экспорт, не завершился
+                        continue
+                except OSError:
+                    continue  # Файл только что удалили — пробуем снова
+                time.sleep(0.5)
+        try:
+            os.write(fd, str(os.getpid()).encode())
+            yield
+        finally:
+            os.close(fd)
+            try:
+                os.remove(lock_path)
+            except OSError as e:
+                print(f"Error removing {lock_path}: {e}")
+
+
+def _cached_onnx(base_path, backend, export_fn, video_path, prepare):
+    """
+    Путь к ONNX модели на диске; при отсутствии — экспорт (и квантование).
+    INT8 калибруется по видео, на котором модель понадобилась впервые, и дальше
+    используется для любого видео (см. ограничение в начале модуля).
+    """
+    fp32_path = base_path + ".onnx"
+    int8_path = base_path + ".int8.onnx"
+
+    if os.path.exists(fp32_path) and (backend != "onnx_int8" or os.path.exists(int8_path)):
+        return int8_path if backend == "onnx_int8" else fp32_path
+
+    # Пока ждали блокировку, файл мог создать другой процесс — проверки внутри повторяются
+    with _export_guard(base_path):
+        if not os.path.exists(fp32_path):
+            print(f"Exporting {os.path.basename(fp32_path)} to ONNX...")
+            export_fn(fp32_path)
+
+        if backend != "onnx_int8":
+            return fp32_path
+
+        if not os.path.exists(int8_path):
+            frames = sample_frames(video_path)
+            if not frames:
+                # FP32 под ключом onnx_int8 не отдаем — загрузка повторится, когда видео будет доступно
+                raise Exception("INT8 calibration: no frames to calibrate on")
+            print(f"Quantizing {os.path.basename(int8_path)} on {len(frames)} frames "
+                  f"of {os.path.basename(video_path)} (reused for other videos)...")
+            quantize_int8(fp32_path, int8_path, frames, prepare)
+        return int8_path
+
+
+# --- YOLO ---
+
+def _letterbox(frame, size):
+    """Вход YOLO: вписать в квадрат size с серыми полями, RGB, NCHW, [0, 1]"""
+    h, w = frame.shape[:2]
+    scale = size / max(h, w)
+    nh, nw = int(round(h * scale)), int(round(w * scale))
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top, left = (size - nh) // 2, (size - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    rgb = cv2.cvtColor(canvas, cv2.COLOR_BGR2RGB)
+    return (rgb.transpose(2, 0, 1)[None].astype(np.float32) / 255.0)
+
+
+def _export_yolo(model_path, dst_path):
+    from ultralytics import YOLO
+
+    # Ultralytics пишет .onnx рядом с .pt — экспортируем копию во временной папке,
+    # чтобы параллельные процессы анализа не видели недописанный файл
+    tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(dst_path))
+    try:
+        tmp_model = os.path.join(tmp_dir, os.path.basename(model_path))
+        shutil.copy(model_path, tmp_model)
+        exported = YOLO(tmp_model).export(format="onnx", dynamic=True, verbose=False)
+        os.replace(exported, dst_path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def load_yolo(model_path, device, video_path=None, imgsz=640):
+    """
+    YOLO на бэкенде устройства device из ключа модели. Возвращает (модель, бэкенд);
+    интерфейс predict один и тот же. Модель ONNX сразу прогревается, а ее сессия
+    пересоздается с нашими потоками. Ошибка экспорта не подменяется torch — исключение.
+    """
+    from ultralytics import YOLO
+
+    backend = device_backend(device)
+    if backend == "torch":
+        return YOLO(model_path), backend
+
+    onnx_path = _cached_onnx(
+        os.path.splitext(model_path)[0], backend,
+        lambda dst: _export_yolo(model_path, dst),
+        video_path, lambda frame: _letterbox(frame, imgsz)
+    )
+    model = YOLO(onnx_path)
+    model.predict(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), device='cpu', verbose=False)
+
+    runner = getattr(model.predictor, "model", None)
+    if runner is not None and hasattr(runner, "session"):
+        runner.session = create_session(onnx_path)
+
+    print(f"Loaded {os.path.basename(onnx_path)} via ONNX Runtime")
+    return model, backend
+
+
+# --- ГЛУБИНА ---
+
+def _depth_input(rgb_frame, size, mean, std):
+    """Вход модели глубины: квадрат size или (ширина, высота), нормализация, NCHW"""
+    dsize = size if isinstance(size, tuple) else (size, size)
+    img = cv2.resize(rgb_frame, dsize, interpolation=cv2.INTER_CUBIC)
+    img = (img.astype(np.float32) / 255.0 - mean) / std
+    return img.transpose(2, 0, 1)[None]
+
+
+class OnnxDepthModel:
+    """Depth Anything через ONNX Runtime: RGB кадр -> карта глубины размера кадра"""
+
+    def __init__(self, onnx_path, size, mean, std):
+        self._session = create_session(onnx_path)
+        model_input = self._session.get_inputs()[0]
+        self._input_name = model_input.name
+        # Высота и ширина входа переменные (экспорт с dynamic_axes); в старых экспортах
+        # вход фиксирован — тогда любой кадр приводится к size (удалите .onnx для переэкспорта)
+        self.dynamic = not all(isinstance(dim, int) for dim in model_input.shape[2:])
+        self.size = size
+        self._mean = np.asarray(mean, dtype=np.float32)
+        self._std = np.asarray(std, dtype=np.float32)
+
+    def __call__(self, rgb_frame, input_size=None):
+        """input_size — (ширина, высота) входа, кратные 14; по умолчанию квадрат size"""
+        h, w = rgb_frame.shape[:2]
+        size = input_size if input_size and self.dynamic else self.size
+        pixel_values = _depth_input(rgb_frame, size, self._mean, self._std)
+        depth = self._session.run(None, {self._input_name: pixel_values})[0]
+        return cv2.resize(np.squeeze(depth).astype(np.float32), (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+def _read_depth_config(model_dir):
+    """Размер входа и нормализация из preprocessor_config.json модели"""
+    size, mean, std = 518, [0.485, 0.456, 0.406], [0.229, 0.224, 0.225]
+    config_path = os.path.join(model_dir, "preprocessor_config.json")
+    if os.path.exists(config_path):
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        cfg_size = config.get("size", size)
+        size = cfg_size.get("height", size) if isinstance(cfg_size, dict) else int(cfg_size)
+        mean = config.get("image_mean", mean)
+        std = config.get("image_std", std)
+    # Вход ViT кратен размеру патча
+    return size - size % 14, mean, std
+
+
+def _export_depth(model_dir, dst_path, size):
+    import torch
+    from transformers import AutoModelForDepthEstimation
+
+    class _DepthOnly(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model(pixel_values=pixel_values).predicted_depth
+
+    model = _DepthOnly(AutoModelForDepthEstimation.from_pretrained(model_dir).float().eval())
+    tmp_path = f"{dst_path}.{os.getpid()}.tmp"
+    with torch.inference_mode():
+        torch.onnx.export(model, torch.zeros(1, 3, size, size), tmp_path,
+                          input_names=["pixel_values"], output_names=["predicted_depth"],
+                          # Предпросмотр считает на уменьшенном кадре — размер входа не фиксируем
+                          dynamic_axes={"pixel_values": {2: "height", 3: "width"},
+                                        "predicted_depth": {1: "height", 2: "width"}},
+                          opset_version=17)
+    os.replace(tmp_path, dst_path)
+
+
+def load_depth(model_dir, device, video_path=None):
+    """
+    Модель глубины на ONNX Runtime или None, если устройство device из ключа модели —
+    torch (остаемся на пайплайне transformers). Ошибка экспорта — исключение.
+    """
+    backend = device_backend(device)
+    if backend == "torch":
+        return None
+
+    size, mean, std = _read_depth_config(model_dir)
+    mean, std = np.asarray(mean, np.float32), np.asarray(std, np.float32)
+
+    onnx_path = _cached_onnx(
+        model_dir.rstrip(os.sep), backend,
+        lambda dst: _export_depth(model_dir, dst, size),
+        video_path, lambda frame: _depth_input(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB), size, mean, std)
+    )
+    print(f"Loaded {os.path.basename(onnx_path)} via ONNX Runtime")
+    return OnnxDepthModel(onnx_path, size, mean, std)
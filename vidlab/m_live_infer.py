@@ -0,0 +1,105 @@
+import threading
+from PySide6.QtCore import QObject, Signal
+
+
+class LiveResultHub(QObject):
+    """
+    Общий сигнал "готов новый результат предпросмотра".
+    Создается в UI-потоке (контроллером), поэтому испускание из фоновых потоков
+    доставляется в UI-поток очередью Qt.
+    """
+
+    result_ready = Signal()
+
+    _instance = None
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+
+        return cls._instance
+
+
+class LatestFrameInference:
+    """
+    Фоновый инференс для предпросмотра: UI не ждет нейросеть.
+    Обрабатывается только самый новый запрошенный кадр — необработанный
+    предыдущий вытесняется. Фильтр рисует последний готовый результат.
+    infer_fn(key, frame) выполняется в отдельном потоке; stop() завершает его.
+    """
+
+    def __init__(self, infer_fn, name="live-infer"):
+        self._infer_fn = infer_fn
+        self._name = name
+
+        self._cond = threading.Condition()
+        self._pending = None  # (key, frame) — ждет обработки
+        self._busy_key = None  # Ключ кадра, который считается сейчас
+        self._latest = None  # (key, result) — последний готовый результат
+        self._thread = None
+        self._stopped = False
+
+    def request(self, key, frame):
+        """
+        Запрос результата для кадра (key — номер кадра и параметры инференса).
+        Возвращает последний готовый (key, result) — возможно, для другого кадра — или None.
+        """
+        with self._cond:
+            latest = self._latest
+            if self._stopped:
+                return latest
+            if (latest is None or latest[0] != key) and self._busy_key != key:
+                # Кадр дальше меняется фильтрами — в поток уходит копия
+                self._pending = (key, frame.copy())
+                self._cond.notify()
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                    self._thread.start()
+            return latest
+
+    def reset(self):
+        """Забыть готовый результат (например, после смены модели)"""
+        with self._cond:
+            self._latest = None
+            self._pending = None
+
+    def stop(self):
+        """
+        Завершить поток (фильтр удален). infer_fn отпускается — он держит ссылку на фильтр;
+        кадр, который считается сейчас, дорабатывает, и поток выходит
+        """
+        with self._cond:
+            self._stopped = True
+            self._pending = None
+            self._infer_fn = None
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                key, frame = self._pending
+                self._pending = None
+                self._busy_key = key
+                infer_fn = self._infer_fn
+
+            try:
+                result = infer_fn(key, frame)
+            except Exception as e:
+                print(f"Live inference error ({self._name}): {e}")
+                result = None
+
+            infer_fn = None
+            with self._cond:
+                self._busy_key = None
+                if self._stopped:
+                    return
+                if result is not None:
+                    self._latest = (key, result)
+
+            if result is not None:
+                LiveResultHub.get_instance().result_ready.emit()
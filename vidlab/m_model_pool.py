@@ -0,0 +1,138 @@
+import threading
+import time
+from collections import OrderedDict
+
+from .m_live_infer import LiveResultHub
+
+
+class _PoolEntry:
+    def __init__(self, loader):
+        self.loader = loader  # Отпускается после успешной загрузки (держит ссылку на фильтр)
+        self.model = None
+        self.refs = 0
+        self.loading = None  # Event текущей попытки загрузки; None — загрузка не идет
+        self.failed_at = None  # Время последней неудачной попытки
+        self.lock = threading.Lock()  # predict не потокобезопасен — инференс одной модели по очереди
+
+
+class ModelPool:
+    """
+    Общие нейросети процесса: ключ (путь модели, устройство), счетчик ссылок фильтров.
+    Несколько экземпляров фильтра с одной моделью делят ее и замок инференса.
+    Модели без ссылок остаются в памяти (MAX_IDLE последних по использованию)
+    на случай повторного добавления фильтра; более старые выгружаются.
+    Неудачная загрузка повторяется при следующем обращении, но не чаще RETRY_DELAY;
+    до тех пор get() возвращает None.
+    """
+
+    MAX_IDLE = 2
+    RETRY_DELAY = 10.0  # Секунд между попытками загрузить модель после ошибки
+
+    _instance = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # {ключ: _PoolEntry}, от давно использованных к свежим
+
+    @classmethod
+    def get_instance(cls):
+        if cls._instance is None:
+            cls._instance = cls()
+
+        return cls._instance
+
+    def acquire(self, key, loader):
+        """
+        Фильтр начинает пользоваться моделью (загрузка откладывается до get/warm_up).
+        loader() -> модель. Возвращает общий замок инференса этой модели.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _PoolEntry(loader)
+            entry.refs += 1
+            self._entries.move_to_end(key)
+            return entry.lock
+
+    def release(self, key):
+        """Фильтр удален — модель может быть выгружена"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs = max(0, entry.refs - 1)
+            self._evict()
+
+    def warm_up(self, key):
+        """Загрузка в фоновом потоке, чтобы первый кадр не ждал модель"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not self._can_start(entry):
+                return
+            entry.loading = threading.Event()
+        threading.Thread(target=self._load, args=(key, entry, True), name="model-warmup", daemon=True).start()
+
+    def get(self, key, wait=True):
+        """
+        Модель по ключу или None (загрузка не удалась). Если загрузку еще никто не начал,
+        она идет в вызывающем потоке.
+        wait=False — не ждать: пока модель не готова, вернется None (загрузка уходит в фон).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            if entry.model is not None:
+                return entry.model
+            start = self._can_start(entry)
+            if start and wait:
+                entry.loading = threading.Event()
+            attempt = entry.loading
+
+        if not wait:
+            if start:
+                self.warm_up(key)
+            return None
+
+        if attempt is None:
+            return None  # Недавняя попытка не удалась — повторим после RETRY_DELAY
+        if start:
+            self._load(key, entry, False)
+        attempt.wait()
+        return entry.model
+
+    def _can_start(self, entry):
+        """Загрузку можно начать: модели нет, попытка не идет и после ошибки выждали паузу"""
+        if entry.model is not None or entry.loading is not None:
+            return False
+        return entry.failed_at is None or time.monotonic() - entry.failed_at >= self.RETRY_DELAY
+
+    def _load(self, key, entry, notify):
+        model = None
+        try:
+            model = entry.loader()
+        except Exception as e:
+            print(f"Model pool: failed to load {key[0]}: {e}")
+
+        with self._lock:
+            attempt = entry.loading
+            entry.loading = None
+            if model is None:
+                entry.failed_at = time.monotonic()  # loader оставляем для повторной попытки
+            else:
+                entry.model = model
+                entry.loader = None
+                entry.failed_at = None
+        attempt.set()
+
+        # Кадр предпросмотра, отрисованный без модели, пора перерисовать
+        if notify and model is not None:
+            LiveResultHub.get_instance().result_ready.emit()
+
+    def _evict(self):
+        """Выгрузка самых старых моделей без ссылок сверх MAX_IDLE"""
+        idle = [key for key, entry in self._entries.items() if entry.refs == 0]
+        for key in idle[:max(0, len(idle) - self.MAX_IDLE)]:
+            self._entries.pop(key)
+            print(f"Model pool: unloaded {key[0]} ({key[1]})")
@@ -0,0 +1,89 @@
+import warnings
+import numpy as np
+
+# Кандидаты склеек по метаданным пакетов контейнера (без декодирования).
+# Нужен PyAV (pip install av); без него предварительный проход просто не выполняется.
+
+SIZE_WINDOW = 31  # Окно скользящей медианы размеров пакетов (кадров)
+SIZE_RATIO = 3.0  # Всплеск: пакет больше медианы окна во столько раз
+
+
+def read_packets(path):
+    """
+    Размеры пакетов и флаги ключевых кадров в порядке показа (номер = номер кадра).
+    Читается только демультиплексор. None — PyAV нет или файл не читается.
+    """
+    try:
+        import av
+    except ImportError:
+        print("Packet prescan: PyAV is not installed")
+        return None
+
+    pts, sizes, keys = [], [], []
+    try:
+        with av.open(path) as container:
+            stream = container.streams.video[0]
+            for pkt in container.demux(stream):
+                if pkt.pts is None or pkt.size == 0:
+                    continue  # Пустые пакеты сброса в конце потока
+                pts.append(pkt.pts)
+                sizes.append(pkt.size)
+                keys.append(pkt.is_keyframe)
+    except Exception as e:
+        print(f"Packet prescan error for {path}: {e}")
+        return None
+
+    # Пакеты идут в порядке декодирования (B-кадры) — переставляем в порядок показа
+    order = np.argsort(np.asarray(pts, dtype=np.int64), kind='stable')
+    return np.asarray(sizes, dtype=np.float32)[order], np.asarray(keys, dtype=bool)[order]
+
+
+def find_candidates(sizes, keys):
+    """Номера кадров-кандидатов: внеочередные ключевые кадры и всплески размера"""
+    n = len(sizes)
+    if n < 2:
+        return []
+
+    candidates = set()
+
+    # 1. Ключевые кадры не по обычному интервалу GOP (самому частому расстоянию между ними)
+    key_idx = np.flatnonzero(keys)
+    gaps = np.diff(key_idx)
+    values, counts = np.unique(gaps, return_counts=True)
+    if len(counts) and counts.max() > 1:
+        gop = values[np.argmax(counts)]
+        candidates.update(key_idx[1:][gaps != gop].tolist())
+    else:
+        # Постоянного интервала нет (ключевые кадры только на склейках) — берем все
+        candidates.update(key_idx.tolist())
+
+    # 2. Всплески размера среди неключевых кадров
+    inter = np.where(keys, np.nan, sizes)
+    if n >= SIZE_WINDOW:
+        pad = SIZE_WINDOW // 2
+        padded = np.pad(inter, pad, mode='edge')
+        windows = np.lib.stride_tricks.sliding_window_view(padded, SIZE_WINDOW)
+        with warnings.catch_warnings(), np.errstate(invalid='ignore'):
+            warnings.simplefilter('ignore', RuntimeWarning)  # Окно из одних ключевых кадров
+            median = np.nanmedian(windows, axis=1)
+            spikes = np.flatnonzero(inter > median * SIZE_RATIO)
+        candidates.update(spikes.tolist())
+
+    candidates.discard(0)
+    return sorted(candidates)
+
+
+def candidate_windows(candidates, radius, start, end):
+    """Участки [c - radius, c + radius] внутри [start, end], слитые при пересечении"""
+    windows = []
+    for c in candidates:
+        if c < start - radius or c > end + radius:
+            continue
+        s, e = max(start, c - radius), min(end, c + radius)
+        if s > e:
+            continue
+        if windows and s <= windows[-1][1] + 1:
+            windows[-1][1] = max(windows[-1][1], e)
+        else:
+            windows.append([s, e])
+    return windows
@@ -2,6 +2,7 @@ import json
 import os
 
 from .f_ai_depth import FilterAiDepth
+from .f_asinc_base import FilterAsyncBase
 from .f_base import FilterBase
 from .f_bw import FilterBW
 from .f_cam_tracker2d import FilterCameraTracker2D
@@ -23,6 +24,7 @@ class VideoProjectExtModel(VideoProjectModel):
     def __init__(self):
         super().__init__()
         self.filters = []  # Список активных объектов фильтров
+        self.video_path = None
 
         # Реестр доступных классов фильтров (Имя -> Класс)
 
@@ -46,6 +48,7 @@ class VideoProjectExtModel(VideoProjectModel):
     def load_project(self, video_path):
         # Загружаем базовые сцены через родителя
         data = super().load_project(video_path)
+        self.video_path = video_path
 
         # Определяем папку для кеша данных фильтров
         base_dir = os.path.dirname(video_path)
@@ -61,11 +64,13 @@ class VideoProjectExtModel(VideoProjectModel):
         else:
             # Если старый формат (просто список), значит фильтров еще нет
             self.scenes = data
+            self._release_filters()
             self.filters = []
 
         return self.scenes
 
     def _restore_filters(self, configs):
+        self._release_filters()
         self.filters = []
         for cfg in configs:
             f_class = self.filter_registry.get(cfg['name'])
@@ -73,7 +78,11 @@ class VideoProjectExtModel(VideoProjectModel):
                 f_obj = f_class(cfg['num'], self.cache_dir, cfg['params'])
                 f_obj.enabled = cfg.get('enabled', True)
                 f_obj.set_prj_save_callback(self.save_project)
+                f_obj.set_prj_filters_callback(self.get_filters)
+                self._attach_video(f_obj)
                 self.filters.append(f_obj)
+                if f_obj.enabled:
+                    f_obj.warm_up()
 
     def add_filter(self, filter_name):
         f_class = self.filter_registry.get(filter_name)
@@ -85,10 +94,26 @@ class VideoProjectExtModel(VideoProjectModel):
 
         new_filter = f_class(next_num, self.cache_dir)
         new_filter.set_prj_save_callback(self.save_project)
+        new_filter.set_prj_filters_callback(self.get_filters)
+        self._attach_video(new_filter)
+        new_filter.warm_up()  # Модель грузится в фоне, пока пользователь настраивает фильтр
 
         self.filters.append(new_filter)
         self.save_project()
 
+    def get_filters(self):
+        return self.filters
+
+    def _release_filters(self):
+        """Старые фильтры уходят вместе с проектом — общие модели им больше не нужны"""
+        for f_obj in self.filters:
+            f_obj.release()
+
+    def _attach_video(self, f_obj):
+        """Кеш анализа адресуется отпечатком видео — фильтр должен знать файл сразу"""
+        if isinstance(f_obj, FilterAsyncBase) and self.video_path:
+            f_obj.attach_video(self.video_path)
+
     def save_project(self):
         """Переопределяем сохранение, чтобы включить фильтры"""
         if not self.current_json_path: return
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+class RowBuffer:
+    """
+    Растущий массив строк, индексированный номером кадра.
+    Емкость растет удвоением, поэтому дописывание результатов порциями
+    не копирует всю историю на каждом сообщении воркера.
+    """
+
+    def __init__(self, width, fill=0.0, dtype=np.float32, data=None):
+        self.width = width
+        self.fill = fill
+        self.dtype = dtype
+
+        self._data = np.full((0, width), fill, dtype=dtype)
+        self._length = 0
+
+        if data is not None and len(data) > 0:
+            self.place(0, data)
+
+    def __len__(self):
+        return self._length
+
+    def place(self, start, rows):
+        """Записывает строки с кадра start; пропущенные строки остаются равны fill"""
+        rows = np.asarray(rows, dtype=self.dtype)
+        if rows.size == 0:
+            return
+        rows = rows.reshape(-1, self.width)
+
+        end = start + len(rows)
+        self._reserve(end)
+        self._data[start:end] = rows
+        self._length = max(self._length, end)
+
+    def put(self, indices, rows):
+        """Записывает строки по произвольным индексам (обновления вразброс)"""
+        indices = np.asarray(indices, dtype=np.int64)
+        if indices.size == 0:
+            return
+        rows = np.asarray(rows, dtype=self.dtype).reshape(-1, self.width)
+
+        end = int(indices.max()) + 1
+        self._reserve(end)
+        self._data[indices] = rows
+        self._length = max(self._length, end)
+
+    def _reserve(self, end):
+        if end > len(self._data):
+            capacity = max(end, 2 * len(self._data), 1024)
+            grown = np.full((capacity, self.width), self.fill, dtype=self.dtype)
+            grown[:self._length] = self._data[:self._length]
+            self._data = grown
+
+    def view(self):
+        """Заполненная часть без копирования (действительна до следующего роста)"""
+        return self._data[:self._length]
@@ -1,3 +1,5 @@
+import os
+
 from PySide6.QtCore import QSettings
 
 # это ключи в реестре/файле настроек
@@ -37,4 +39,32 @@ class SettingsModel:
 
     def load_geometry(self):
         return (self.settings.value("geometry"),
-                self.settings.value("window_state"))
\ No newline at end of file
+                self.settings.value("window_state"))
+
+    def get_analysis_max_jobs(self):
+        """Сколько анализаторов может работать одновременно (по умолчанию — число ядер)"""
+        default = max(1, os.cpu_count() or 1)
+        return max(1, int(self.settings.value("analysis_max_jobs", default)))
+
+    def set_analysis_max_jobs(self, count):
+        self.settings.setValue("analysis_max_jobs", int(count))
+
+    def get_infer_backend(self):
+        """Бэкенд нейросетей: torch, onnx или onnx_int8 (см. m_infer_backend)"""
+        return str(self.settings.value("infer_backend", "torch"))
+
+    def set_infer_backend(self, backend):
+        self.settings.setValue("infer_backend", backend)
+
+    def get_infer_threads(self, resolve=True):
+        """
+        Потоков ONNX Runtime на одну модель (0 — авто: все ядра).
+        resolve=False — сохраненное значение как есть (для окна настроек).
+        """
+        threads = int(self.settings.value("infer_threads", 0))
+        if threads > 0 or not resolve:
+            return threads
+        return max(1, os.cpu_count() or 1)
+
+    def set_infer_threads(self, count):
+        self.settings.setValue("infer_threads", int(count))
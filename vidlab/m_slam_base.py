@@ -1,7 +1,12 @@
+import copy
+import cv2
 import numpy as np
 
 
 class SlamBaseModel:
+    # Поля, которые не попадают в чекпоинт: кадр пересчитывается, путь хранит фильтр
+    STATE_SKIP = ("prev_gray", "abs_path", "config", "metadata")
+
     def __init__(self, is_batch_mode=False):
         self.is_batch_mode = is_batch_mode
 
@@ -62,6 +67,19 @@ class SlamBaseModel:
 
         self.wpoints = None
 
+    def get_state(self):
+        """Снимок состояния трекинга для чекпоинта"""
+        return copy.deepcopy({k: v for k, v in self.__dict__.items() if k not in self.STATE_SKIP})
+
+    def set_state(self, state, frame):
+        """
+        Восстановление из чекпоинта. frame — кадр чекпоинта (state.last_idx),
+        из него заново строится prev_gray. Путь копится с нуля.
+        """
+        self.__dict__.update(copy.deepcopy(state))
+        self.abs_path = [] if self.is_batch_mode else None
+        self.prev_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
     def update(self, frame, idx):
         """
         Оркестрация обновления.
@@ -128,6 +146,12 @@ class SlamBaseModel:
     def get_fwd_velocity(self, im_meter = False):
         return self.curr_velocity if not im_meter else self.curr_step_m
 
+    def get_path_rows(self, start):
+        """Строки пути, накопленные с позиции start (для пересылки порциями)"""
+        if self.abs_path is not None and len(self.abs_path) > start:
+            return np.array(self.abs_path[start:], dtype=np.float32)
+        return np.empty((0, 3), dtype=np.float32)
+
     def get_full_path(self):
         """Возвращает накопленный путь как numpy массив"""
         if self.abs_path is not None and len(self.abs_path) > 0:
@@ -3,7 +3,7 @@ import os
 
 
 class VideoExport:
-    def __init__(self, output_path, fps, size):
+    def __init__(self, output_path, fps, size, codec='mp4v'):
         self.output_path = output_path
         self.fps = fps
         self.size = size  # (width, height)
@@ -12,7 +12,7 @@ class VideoExport:
 
         # Кодек H.264 (AVC).
         # На Windows/Linux через FFmpeg бэкенд обычно используется 'avc1' или 'X264'
-        self.fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self.fourcc = cv2.VideoWriter_fourcc(*codec)
 
     def _init_writer(self):
         if self.writer is None:
@@ -59,4 +59,58 @@ class VideoExport:
                 os.remove(self.output_path)
                 print(f"Экспорт отменен, файл удален.")
             except Exception as e:
-                print(f"Не удалось удалить файл: {e}")
\ No newline at end of file
+                print(f"Не удалось удалить файл: {e}")
+
+
+class VideoMultiExport:
+    """
+    Раздает один обработанный кадр нескольким VideoExport.
+    Описание выхода (spec): {"path": str, "size": (w, h) | высота | None, "codec": 'mp4v'}
+    size=None — размер обработанного кадра, число — высота с сохранением пропорций.
+    """
+
+    def __init__(self, specs, fps, src_size):
+        self.exporters = []
+        for spec in specs:
+            size = self.resolve_size(spec.get("size"), src_size)
+            self.exporters.append(VideoExport(
+                output_path=spec["path"],
+                fps=fps,
+                size=size,
+                codec=spec.get("codec", 'mp4v')
+            ))
+
+    @staticmethod
+    def resolve_size(size, src_size):
+        src_w, src_h = src_size
+        if size is None:
+            return src_w, src_h
+
+        if isinstance(size, int):
+            # Задана только высота: ширину считаем по пропорциям (кодекам нужны четные размеры)
+            w = int(round(src_w * size / src_h / 2)) * 2
+            return max(2, w), size
+
+        return int(size[0]), int(size[1])
+
+    def write_frame(self, frame):
+        h, w = frame.shape[:2]
+        # Кадры одного размера масштабируем один раз на все выходы
+        scaled = {(w, h): frame}
+
+        for exp in self.exporters:
+            out = scaled.get(exp.size)
+            if out is None:
+                # INTER_AREA дает меньше муара при уменьшении
+                interp = cv2.INTER_AREA if exp.size[0] < w else cv2.INTER_LINEAR
+                out = cv2.resize(frame, exp.size, interpolation=interp)
+                scaled[exp.size] = out
+            exp.write_frame(out)
+
+    def finish(self):
+        for exp in self.exporters:
+            exp.finish()
+
+    def cancel(self):
+        for exp in self.exporters:
+            exp.cancel()
@@ -5,6 +5,8 @@ from PySide6.QtCore import Qt, Signal, QTimer
 
 from vidlab.c_video import VideoController
 from vidlab.f_asinc_base import FilterAsyncBase
+from vidlab.m_analysis_sched import AnalysisScheduler, STATE_QUEUED, STATE_PAUSED
+from vidlab.m_analysis_stats import format_stats
 
 
 class FilterManagerWidget(QWidget):
@@ -63,6 +65,13 @@ class FilterManagerWidget(QWidget):
         self.progress_bar.setVisible(False)
         layout.addWidget(self.progress_bar)
 
+        # Скорость анализа: fps, ETA и доли этапов
+        self.stats_label = QLabel()
+        self.stats_label.setStyleSheet("color: #888; font-size: 10px;")
+        self.stats_label.setWordWrap(True)
+        self.stats_label.setVisible(False)
+        layout.addWidget(self.stats_label)
+
         # Таймер для обновления состояния кнопок и прогресс-бара
         self.update_timer = QTimer()
         self.update_timer.timeout.connect(self.sync_ui_state)
@@ -136,9 +145,11 @@ class FilterManagerWidget(QWidget):
         # Устанавливаем фокус (для Overlay в будущем)
         for f in self.project.filters: f.focused = False
         selected_filter.focused = True
+        # Анализ выбранного фильтра идет первым
+        AnalysisScheduler.get_instance().update_priorities()
 
         # Строим UI на основе метаданных
-        metadata = selected_filter.get_params_metadata()
+        metadata = selected_filter.get_metadata()
         for key, info in metadata.items():
             self._add_param_control(selected_filter, key, info)
 
@@ -146,6 +157,7 @@ class FilterManagerWidget(QWidget):
         is_async = isinstance(selected_filter, FilterAsyncBase)
         self.btn_analyze.setVisible(is_async)
         self.progress_bar.setVisible(is_async)
+        self.stats_label.setVisible(is_async)
         self.sync_ui_state()
 
         self.controller.refresh_current_frame()  # Обновить превью
@@ -163,12 +175,23 @@ class FilterManagerWidget(QWidget):
             self.progress_bar.setVisible(True)
             self.progress_bar.setValue(f.progress)
 
+            # Показываем, ждет ли анализ своей очереди или стоит на паузе
+            if f.analysis_state == STATE_QUEUED:
+                self.progress_bar.setFormat("%p% (queued)")
+            elif f.analysis_state == STATE_PAUSED:
+                self.progress_bar.setFormat("%p% (paused)")
+            else:
+                self.progress_bar.setFormat("%p%")
+
         else:
             self.btn_analyze.setText("Start Analysis")
             self.btn_analyze.setStyleSheet("")
+            self.progress_bar.setFormat("%p%")
             self.progress_bar.setVisible(f.progress > 0 and f.progress < 100)
             self.progress_bar.setValue(f.progress)
 
+        self.stats_label.setText(format_stats(f.analysis_stats, with_frames=not f.is_analyzing))
+
         self.controller.refresh_current_frame()
 
     def on_analyze_clicked(self):
@@ -183,7 +206,12 @@ class FilterManagerWidget(QWidget):
         else:
             # Перед запуском прокидываем путь к видео из модели
             f.video_path = self.controller.model.file_path
-            f.start_analysis()
+            # Анализируем только нужный участок, а не весь файл
+            analysis_range = self.controller.get_filter_analysis_range(f)
+            if analysis_range[0] > analysis_range[1]:
+                QMessageBox.warning(self, "Анализ", "In/Out проекта не пересекается с окном действия фильтра.")
+                return
+            f.start_analysis(analysis_range)
 
     def _on_track_clicked(self, checked):
         if checked:
@@ -540,8 +568,13 @@ class FilterManagerWidget(QWidget):
 
         # Проверяем, на какую кнопку нажал пользователь
         if msg_box.clickedButton() == btn_yes:
+            # Фоновый анализ удаляемого фильтра больше не нужен
+            if isinstance(filter_obj, FilterAsyncBase):
+                filter_obj.stop_analysis()
+
             # Удаляем из списка в модели
             self.project.filters.pop(row)
+            filter_obj.release()
             self.project.save_project()
 
             self.refresh_list()
@@ -8,9 +8,10 @@ from .m_config import APP_NAME
 from .m_settings import SettingsModel
 from .v_filter_man import FilterManagerWidget
 from .v_scene_list import SceneListWidget
+from .v_settings import SettingsDialog
 from .v_video import VideoWidget
 from .c_video import VideoController
-from .m_config import WIN_W, WIN_H, APP_NAME, APP_VER
+from .m_config import WIN_W, WIN_H, APP_NAME, APP_VER, EXPORT_RENDITIONS
 from .v_histogram import HistogramWidget  # Импорт внутри, если нужно
 
 
@@ -133,6 +134,13 @@ class MainView(QMainWindow):
         open_act.setShortcut("Ctrl+M")
         open_act.triggered.connect(self._export_file_dialog)
 
+        multi_act = file_menu.addAction("💾 Експорт 1080p/720p/360p...")
+        multi_act.setShortcut("Ctrl+Shift+M")
+        multi_act.triggered.connect(self._export_renditions_dialog)
+
+        settings_act = file_menu.addAction("⚙ Настройки...")
+        settings_act.triggered.connect(self._open_settings_dialog)
+
     def _update_recent_files_menu(self):
         self.recent_menu.clear()
         files = self.settings.get_recent_files()
@@ -238,25 +246,44 @@ class MainView(QMainWindow):
     def _export_file_dialog(self):
         path, _ = QFileDialog.getSaveFileName(self, "Export Video", "", "Video (*.mp4)")
         if path:
-            # Создаем диалог прогресса
-            progress = QProgressDialog("Exporting...", "Cancel", 0, 100, self)
-            progress.setWindowModality(Qt.WindowModal)
-
-            def update_ui(val):
-                progress.setValue(val)
-                return not progress.wasCanceled()
-
-            # Запускаем экспорт
-            try:
-                success = self.controller.export_video(path, update_ui)
-                if success:
-                    # Можно вывести маленькое уведомление
-                    print("Экспорт успешно завершен")
-
-            except Exception as e:
-                QMessageBox.critical(self, "Ошибка", f"Не удалось экспортировать: {str(e)}")
-            finally:
-                progress.close()
+            self._run_export(path)
+
+    def _export_renditions_dialog(self):
+        """Экспорт всех вариантов из EXPORT_RENDITIONS за один проход декодирования"""
+        path, _ = QFileDialog.getSaveFileName(self, "Export Renditions", "", "Video (*.mp4)")
+        if path:
+            base, ext = os.path.splitext(path)
+            specs = [{
+                "path": f"{base}{r['suffix']}{ext or '.mp4'}",
+                "size": r["size"],
+                "codec": r["codec"]
+            } for r in EXPORT_RENDITIONS]
+            self._run_export(specs)
+
+    def _open_settings_dialog(self):
+        SettingsDialog(self).exec()
+
+    def _run_export(self, path):
+        """path: путь к файлу или список описаний выходов (см. export_video)"""
+        # Создаем диалог прогресса
+        progress = QProgressDialog("Exporting...", "Cancel", 0, 100, self)
+        progress.setWindowModality(Qt.WindowModal)
+
+        def update_ui(val):
+            progress.setValue(val)
+            return not progress.wasCanceled()
+
+        # Запускаем экспорт
+        try:
+            success = self.controller.export_video(path, update_ui)
+            if success:
+                # Можно вывести маленькое уведомление
+                print("Экспорт успешно завершен")
+
+        except Exception as e:
+            QMessageBox.critical(self, "Ошибка", f"Не удалось экспортировать: {str(e)}")
+        finally:
+            progress.close()
 
     # --- СОХРАНЕНИЕ СОСТОЯНИЯ ---
 
@@ -0,0 +1,59 @@
+import os
+
+from PySide6.QtWidgets import QDialog, QFormLayout, QSpinBox, QComboBox, QLabel, QDialogButtonBox
+
+from .m_analysis_sched import AnalysisScheduler
+from .m_infer_backend import BACKENDS
+from .m_settings import SettingsModel
+
+
+class SettingsDialog(QDialog):
+    """Настройки приложения: фоновый анализ и бэкенд нейросетей"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Настройки")
+        self.settings = SettingsModel.get_instance()
+        self._init_ui()
+
+    def _init_ui(self):
+        layout = QFormLayout(self)
+        cpu_count = max(1, os.cpu_count() or 1)
+
+        # Сколько анализаторов работает одновременно
+        self.spin_jobs = QSpinBox()
+        self.spin_jobs.setRange(1, cpu_count * 2)
+        self.spin_jobs.setValue(AnalysisScheduler.get_instance().max_jobs)
+        self.spin_jobs.setToolTip("Одновременно работающих фоновых анализаторов")
+        layout.addRow("Анализаторов одновременно:", self.spin_jobs)
+
+        # Бэкенд нейросетей без видеокарты (на CUDA всегда torch)
+        self.combo_backend = QComboBox()
+        self.combo_backend.addItems(BACKENDS)
+        backend = self.settings.get_infer_backend()
+        self.combo_backend.setCurrentText(backend if backend in BACKENDS else "torch")
+        self.combo_backend.setToolTip("onnx_int8 калибруется по первому видео и используется для всех остальных")
+        layout.addRow("Бэкенд нейросетей:", self.combo_backend)
+
+        # Потоки ONNX Runtime на модель; 0 — все ядра
+        self.spin_threads = QSpinBox()
+        self.spin_threads.setRange(0, cpu_count)
+        self.spin_threads.setSpecialValueText("авто")
+        self.spin_threads.setValue(self.settings.get_infer_threads(resolve=False))
+        layout.addRow("Потоков на модель:", self.spin_threads)
+
+        note = QLabel("Бэкенд применяется к фильтрам, созданным после смены (или после повторного открытия видео).")
+        note.setWordWrap(True)
+        note.setStyleSheet("color: #888; font-size: 10px;")
+        layout.addRow(note)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+
+    def accept(self):
+        AnalysisScheduler.get_instance().set_max_jobs(self.spin_jobs.value())
+        self.settings.set_infer_backend(self.combo_backend.currentText())
+        self.settings.set_infer_threads(self.spin_threads.value())
+        super().accept()
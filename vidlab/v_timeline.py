@@ -1,4 +1,5 @@
 import cv2
+import numpy as np
 from PySide6.QtGui import QPainter, QColor, QPen, Qt
 from PySide6.QtWidgets import QWidget, QSizePolicy
 from PySide6.QtCore import Signal, QPoint
@@ -70,6 +71,10 @@ class TimelineWidget(QWidget):
             # Рисуем от верха до середины
             painter.drawRect(int(x1), 5, int(x2 - x1), mid_y - 5)
 
+        # Кривая анализа (например, разница кадров у детектора сцен) и порог
+        if data.get("curve") is not None:
+            self._draw_curve_top(painter, data, mid_y, start_f, end_f)
+
         # Рисуем метки (Marks) сверху - высокие оранжевые линии
         painter.setPen(QPen(QColor("orange"), 2))
         marks = data.get("marks", [])
@@ -89,6 +94,35 @@ class TimelineWidget(QWidget):
             x_end = self._frame_to_x(act_out)
             painter.fillRect(x_start, rect.y(), x_end - x_start, 5, QColor(0, 0, 255, 80))
 
+    def _draw_curve_top(self, painter, data, mid_y, start_f, end_f):
+        curve = data["curve"][max(0, start_f):end_f + 1]
+        width = self.width()
+        if len(curve) == 0 or width <= 0:
+            return
+
+        # Максимум по каждому столбцу пикселей, чтобы короткие пики не терялись
+        cols = min(width, len(curve))
+        bounds = np.linspace(0, len(curve), cols + 1).astype(int)[:-1]
+        with np.errstate(invalid='ignore'):
+            peaks = np.fmax.reduceat(curve, bounds)
+
+        scale = (mid_y - 10) / max(1e-6, data.get("curve_max", 100))
+        x_offset = self._frame_to_x(max(0, start_f))
+        x_step = (self._frame_to_x(max(0, start_f) + len(curve)) - x_offset) / cols
+
+        painter.setPen(QPen(QColor(120, 180, 255, 160), 1))
+        for i, v in enumerate(peaks):
+            if not np.isfinite(v):
+                continue  # Участок не посчитан
+            x = int(x_offset + i * x_step)
+            painter.drawLine(x, mid_y, x, mid_y - int(min(v, data.get("curve_max", 100)) * scale))
+
+        level = data.get("curve_level")
+        if level is not None:
+            y = mid_y - int(level * scale)
+            painter.setPen(QPen(QColor(255, 80, 80, 160), 1, Qt.DashLine))
+            painter.drawLine(0, y, width, y)
+
     def _draw_navigation_bottom(self, painter, rect, mid_y, start_f, end_f):
         in_f = self.controller.get_in_index()
         out_f = self.controller.get_out_index()